@@ -1,9 +1,29 @@
 # Import packages
 import pandas as pd
 import numpy as np
+from etl.eurostat import stream_sdmx_csv
+from etl.countries import UNKNOWN, countries, country_ids, country_names, eu27_codes, eu27_ids
+from etl.composite import INDICATORS
+from etl.indicators import employment_gap
+from etl.profile import column_profile, column_values, describe_column
+from etl.watermarks import changed_slices, commit_watermarks, save_refreshed, slice_country_ids, slice_rows
+from etl.validation import Expectation, check_coverage, coverage_matrix, with_country_names
+from etl.telemetry import step
 
 # Reading in raw csv files
-raw_df = pd.read_csv('./datasets_raw/Employment and activity by sex and age - annual data_eurostat_2022.csv')
+# The shared loader skips the constant columns DATAFLOW, LAST UPDATE and freq
+# The file is streamed in chunks and only rows with indic_em = EMP_LFS and the geo code of an EU27 country
+# or of the EU27 aggregate (country dimension, etl/countries.py)
+# are kept while reading (see 1.2 and 1.3), so the full Eurostat bulk download never sits in memory
+# Every logical step records its time, memory and rows in / out (etl/telemetry.py)
+# Incremental refresh (etl/watermarks.py): only the country / year slices that changed since the last run
+# are recomputed and upserted into the cleaned table, the whole table is rebuilt on the first run
+refresh = changed_slices('employment', './datasets_raw/Employment and activity by sex and age - annual data_eurostat_2022.csv')
+with step('load') as s:
+    raw_df = stream_sdmx_csv('./datasets_raw/Employment and activity by sex and age - annual data_eurostat_2022.csv',
+                             filters={'indic_em': 'EMP_LFS', 'geo': eu27_codes(aggregate=True)}, value_dtype='float64')
+    raw_df = slice_rows(raw_df, refresh)
+    s.rows_out(raw_df)
 print(raw_df.head())
 print(raw_df.columns)
 
@@ -12,75 +32,74 @@ print(raw_df.columns)
 
 # 1. Data Cleaning Step 1
 # 1.1 Identify and delete columns that are not necessary for further process
-raw_df.drop(columns=['DATAFLOW', 'LAST UPDATE'], axis=1, inplace=True)
+# DATAFLOW and LAST UPDATE are not read in by the loader
 print(raw_df.head())
 
 # 1.2 Explore each column and there unique values, especially if categorical data AND Decide how to proceed with this data
-# Only one value in column 'freq' (frequency) --> annually, so that we can drop this column as well
-print(raw_df['freq'].unique())
-raw_df.drop(columns=['freq'], axis=1, inplace=True)
-print(raw_df.head())
+# The exploration prints come from the column profile of the loaded table (etl/profile.py): every column
+# is scanned once and the report is cached next to the raw file, so later runs do not scan it again
+with step('profile', raw_df):
+    profile = column_profile('./datasets_raw/Employment and activity by sex and age - annual data_eurostat_2022.csv',
+                             raw_df, key='EMP_LFS-EU27', cache=refresh.full)
+# Only one value in column 'freq' (frequency) --> annually, so the loader drops this column as well
 
 # Indices / indic_em
 # ACT: Persons in the labour force
 # EMP_LFS: Total employment (resident population concept)
 # We want to see data of the total employment and not only for active persons in the labour market
-print(raw_df['indic_em'].unique())
+print(describe_column(profile, 'indic_em'))
 
 # Sex
 # F: Female
 # M: Male
 # T: Total
-print(sorted(raw_df['sex'].unique()))
+print(describe_column(profile, 'sex'))
 
 # Age
 # Data has different age groups
 # ?Since we are focusing mainly on the gender, should we get rid of the other age groups?
-print(raw_df['age'].unique())
+print(describe_column(profile, 'age'))
 
 # Unit
 # PC_POP: Percentage of total population
 # THS_PER: Thousand persons
 # We are going to work with the percentage of total population
-print(raw_df['unit'].unique())
+print(describe_column(profile, 'unit'))
 
 # Geo
-# Working with the countries that are inside the EU27 csv from addtional data
+# Working with the countries of the EU27 in the country dimension (additional_data/countries.csv)
 # ?Should we keep the EU27 "Country"
-print((raw_df['geo'].unique()))
+print(describe_column(profile, 'geo'))
 
 # TIME_PERIOD
 # Time is from 2003-2021, but maybe probably not in all countries
-print(sorted(raw_df['TIME_PERIOD'].unique()))
+print(describe_column(profile, 'TIME_PERIOD'))
 
 # OBS_VALUE
 # mixed values percentage and total values --> getting rid of the total values through the unit
-print(sorted(raw_df['OBS_VALUE'].unique()))
+print(describe_column(profile, 'OBS_VALUE'))
 
 # OBS_FLAG
 # Deciding in a later stage what to do with the flagged rows
 # b: break in time series
 # d: definition differs
 # nan: no flag
-print((raw_df['OBS_FLAG'].unique()))
+print(describe_column(profile, 'OBS_FLAG'))
 
 # Clean dataset STEP 1
-# indic_em = EMP_LFS
+# indic_em = EMP_LFS (already filtered while reading)
 # unit = PC_POP
 # Drop columns after filtering
-clean_df = raw_df.loc[(raw_df['indic_em'] == 'EMP_LFS')].copy()
+clean_df = raw_df.copy()
 clean_df.drop(columns=['indic_em'], axis=1, inplace=True)
 print(clean_df.head())
 
-# 1.3 Rename country column with help of the EU27.csv in additional data
-# Create dictionary of EU27 countries to apply map function
-countries_df = pd.read_csv("./additional_data/EU27_COUNTRY_LIST.csv")
-countries = dict(zip(countries_df['Initial'].str.strip(), countries_df['Country']))
-print(countries)
-
-# Apply map function to rename the countries
-new_country_column = clean_df['geo'].map(countries)
-clean_df.loc[:,'geo'] = new_country_column
+# 1.3 Replace the geo codes by the integer key of the country dimension (etl/countries.py)
+# All joins below run on the key, the country names are only added when the table is saved
+print(countries())
+with step('map countries', clean_df) as s:
+    clean_df['geo'] = country_ids(clean_df['geo'])
+    s.rows_out(clean_df)
 print((clean_df.head()))
 
 # renaming columns
@@ -99,95 +118,84 @@ print((clean_df.head()))
 # "Methodological improvements in the underlying sampling design or changes in nomenclatura can lead to breaks in the time series."
 # 'd' only in year 2021 for Spain and France
 # Therefore, we can get rid of the Flag column
-print(clean_df['Flag'].unique())
-print(clean_df.loc[clean_df['Flag'] == 'd'])
-print(clean_df.loc[clean_df['Flag'] == 'b'])
+# The flags present in the file are taken from the column profile
+for flag in column_values(profile, 'OBS_FLAG'):
+    print(clean_df.loc[clean_df['Flag'] == flag])
 clean_df.drop(columns=['Flag'], axis=1, inplace=True)
 
 
 # 2. Data Cleaning Step 2
 # 2.1 Explore data with df.info() /df.describe() and clean df if necessary
-# Null Values in Country column are those countries that do not belong to the EU27
-# Therefore removing all rows with Country "NaN"
-# Now, there are no null values in the df anymore
+# Countries that are not in the country dimension have the key UNKNOWN
+# Therefore removing all rows with Country UNKNOWN
+# Now, there are no unknown countries in the df anymore
 print(clean_df.info())
-clean_df2 = clean_df[clean_df['Country'].notna()].copy()
+with step('filter countries', clean_df) as s:
+    clean_df2 = clean_df[clean_df['Country'] != UNKNOWN].copy()
+    s.rows_out(clean_df2)
 print(clean_df2.info())
 
 # 2.2 Compare if each country has the same number of rows
+# 2.3 Compare if each year has the same number of rows
+# The rows of every country and year are counted in one group-by (etl/validation.py)
+with step('coverage', clean_df2) as s:
+    coverage = coverage_matrix(clean_df2)
+    s.rows_out(coverage)
+print(with_country_names(coverage))
+
 # Each item of the countries list has 234 rows
-countries = list(countries_df['Country'])
-for c in countries:
-        print('Country: ' + str(c) + ': '+ str((clean_df2['Country'] == c).sum()))
+print(with_country_names(coverage.sum(axis=1)))
 
-# 2.3 Compare if each year has the same number of rows
 # The years 2003 - 2008 only have 18 rows
 # The years 2009 - 2021 have all 504 rows
 # We want to work only with years, where each country has the same data to compare them completely
 # Therefore, we are removing all rows with the years 2003-2008
-for i in range(1990,2025):
-    print('Year: ' + str(i) + ': '+ str((clean_df2['Year'] == i).sum()))
-clean_df2.drop(clean_df2[(clean_df2['Year'] < 2009)].index, inplace=True)
+print(coverage.sum())
+
+# Every EU27 country needs the same number of rows in every year of the indicator (etl/composite.py),
+# the stage stops here if a country or year is missing (an incremental refresh checks its slices)
+if refresh.full:
+    expectation = Expectation(countries=eu27_ids(), years=INDICATORS['employment'].years, rows=None)
+else:
+    expectation = Expectation(countries=np.intersect1d(slice_country_ids(refresh), eu27_ids()), years=None, rows=None)
+check_coverage(coverage, expectation, 'employment')
+with step('filter years', clean_df2) as s:
+    clean_df2.drop(clean_df2[(clean_df2['Year'] < 2009)].index, inplace=True)
+    s.rows_out(clean_df2)
 print(clean_df2.info())
 print(clean_df2.describe())
 print(clean_df2.head())
 
 # 3. Further individual cleaning
-# Calculate percentage values
-# Create one df with percentage values
-# Create another df with total values --> clean_df4
-clean_df3 = clean_df2.loc[(clean_df2['unit'] == 'PC_POP')].copy()
-clean_df4 = clean_df2.loc[(clean_df2['unit'] == 'THS_PER')].copy()
-clean_df3.drop(columns=['unit'], axis=1, inplace=True)
-clean_df4.drop(columns=['unit'], axis=1, inplace=True)
-
-clean_df3['Total Employment in %'].astype('float')
-clean_df3['Total Employment in %'] = clean_df2['Total Employment in %'].div(100).round(2)
-#print(clean_df3.head())
+# The calculation is written against the frame API of etl/frames.py (etl/indicators.py employment_gap): with
+# VA_BACKEND=polars it is one lazy query that polars optimizes and runs multithreaded, with the default pandas
+# backend every step runs eagerly
+# Both backends give the same table
+# Percentage values of women and men (unit PC_POP) are joined on Country, Year and Age, the gap is M - F,
+# the employed persons in thousands come from the totals (unit THS_PER, sex T)
 
 # 4. Any questions regarding cleaning decisions to discuss?
 # Get Only sex of Total, Male and Female ?
 # Get only one age group or multiple age groups ?
 
-# Setting index to perform mathematical operations
-clean_df3.set_index(['Country', 'Year','Age'], inplace=True)
-clean_df4.set_index(['Country', 'Year','Age'], inplace=True)
-
-# Split datasets into the Genders
-fem_df = clean_df3[clean_df3['Sex'] == 'F'].copy()
-mal_df = clean_df3[clean_df3['Sex'] == 'M'].copy()
-tot_df = clean_df4[clean_df4['Sex'] == 'T'].copy()
-
-# Column is not needed anymore
-fem_df.drop(columns=['Sex'], axis=1, inplace=True)
-mal_df.drop(columns=['Sex'], axis=1, inplace=True)
-tot_df.drop(columns=['Sex'], axis=1, inplace=True)
-
-# Calculate the employment gap between man and woman
-fem_df['Employment Gap in %'] = mal_df['Total Employment in %'].sub(fem_df['Total Employment in %']).round(2)
-
-# Add the total number of employed persons for each row
-fem_df['Employed Persons in Thousands'] = fem_df.index.map(tot_df['Total Employment in %'])
-fem_df['Employed Persons in Thousands'] = fem_df['Employed Persons in Thousands'].astype(int)
-
-# Drop unnecessary columns
-#print(fem_df[fem_df['Employment Gap in %'] == 0.0])
-fem_df.drop(columns=['Total Employment in %'], axis=1, inplace=True)
-
-# Reset index after finishing mathematical operations
-fem_df.reset_index(inplace=True)
-print(fem_df.head())
-
 # Calculating index: (Actual value - worst value)/(Best value - worst value)
 # Taking the max. employment gap from age group 15-64 since this is the age group where we are taking the index to calculate the overall index
-best_value = 0
-worst_value = 1
-fem_df['IndexValueEmployment'] = (fem_df['Employment Gap in %']-worst_value)/(best_value-worst_value)
-#print(fem_df[fem_df['Age'] == 'Y15-64']['IndexValueEmployment'].max())
+# best / worst values are declared in the indicator registry (etl/composite.py): best 0, worst 1
+# The rows of the European Union aggregate are dropped
+best_value = INDICATORS['employment'].best
+worst_value = INDICATORS['employment'].worst
+with step('gap calculation', clean_df2) as s:
+    fem_df = employment_gap(clean_df2, best_value, worst_value, eu27_ids())
+    s.rows_out(fem_df)
+print(fem_df.head())
 
-# Drop European Union Stats
-i = fem_df[(fem_df['Country'] == 'European Union')]
-fem_df.drop(i.index, inplace=True)
+with step('save', fem_df) as s:
+    # Country names for the export
+    fem_df['Country'] = country_names(fem_df['Country'])
 
-# 5. Save cleaned dataframe in folder datasets_cleaned 
-fem_df.to_csv('./datasets_cleaned/Employment by sex and age.csv')
+    # 5. Save cleaned dataframe in folder datasets_cleaned 
+    # (parquet store partitioned by Year, CSV export for the dashboard)
+    save_refreshed(refresh, 'employment', fem_df, keys=['Country', 'Year', 'Age'],
+                   csv='./datasets_cleaned/Employment by sex and age.csv', csv_index=True)
+    commit_watermarks(refresh)
+    s.rows_out(fem_df)
@@ -5,9 +5,21 @@
 # Import packages
 import pandas as pd
 import numpy as np
+from etl.composite import INDICATORS
+from etl.countries import UNKNOWN, countries, country_ids, country_names, eu27_ids
+from etl.frames import col, frame
+from etl.indicators import index_value
+from etl.periods import parse_periods
+from etl.profile import column_profile, describe_column
+from etl.store import save_table
+from etl.validation import Expectation, check_coverage, coverage_matrix, with_country_names
+from etl.telemetry import step
 
 # Reading in raw csv files from datasets_raw
-raw_df = pd.read_csv('./datasets_raw/Members of National Parliaments by sex_EIGE.csv', sep=';', decimal=',') #decimal defined to read in the values as float and not as string)
+# Every logical step records its time, memory and rows in / out (etl/telemetry.py)
+with step('load') as s:
+    raw_df = pd.read_csv('./datasets_raw/Members of National Parliaments by sex_EIGE.csv', sep=';', decimal=',')
+    s.rows_out(raw_df) #decimal defined to read in the values as float and not as string)
 print(raw_df.head())
 print(raw_df.columns)
 # Melting data in the correct format (every dimension and value in a column)
@@ -19,50 +31,60 @@ raw_df.drop(columns=['_sex', '_UNIT', 'EGROUP','geo', 'POSITION'], axis=1, inpla
 print(raw_df.head())
 
 # 1.2 Explore each column and there unique values, especially if categorical data AND Decide how to proceed with this data
+# The exploration prints come from the column profile of the loaded table (etl/profile.py): every column
+# is scanned once and the report is cached next to the raw file, so later runs do not scan it again
+with step('profile', raw_df):
+    profile = column_profile('./datasets_raw/Members of National Parliaments by sex_EIGE.csv', raw_df)
 # Time
 # Time periods are in quarters, since we agreed to base our time series on a yearly basis, we take the values of the first quarters as yearly value
-print(raw_df['time'].unique())
+print(describe_column(profile, 'time'))
 
 # Geo
-print((raw_df['_geo'].unique()))
+print(describe_column(profile, '_geo'))
 
 # Unit
 # We are going with the percent of total, since every parliament has a different size
-print((raw_df['UNIT'].unique()))
+print(describe_column(profile, 'UNIT'))
 
 # EGROUP
 # We are working the data of both parliaments upper/lower (data is more consistent)
-print((raw_df['_EGROUP'].unique()))
+print(describe_column(profile, '_EGROUP'))
 
 # Position
 # We are working with the values of the parliament members and not with the values of the presidents
-print((raw_df['_POSITION'].unique()))
+print(describe_column(profile, '_POSITION'))
 
 # Clean dataset STEP 1 - Filtering relevant rows
 # _EGROUP = 'PARL_ALL'
 # UNIT = 'Percent of total'
 # _POSITION =  'MEMB_PARL'
-clean_df = raw_df.loc[  (raw_df['_EGROUP'] == 'PARL_ALL') & 
-                        (raw_df['UNIT'] == 'Percent of total') &
-                        (raw_df['_POSITION'] == 'MEMB_PARL') &
-                        (raw_df['sex'] == 'Women')
-                        ].copy()
-clean_df.drop(columns=['_EGROUP','UNIT','_POSITION', 'sex'], axis=1, inplace=True)
+with step('filter rows', raw_df) as s:
+    clean_df = raw_df.loc[  (raw_df['_EGROUP'] == 'PARL_ALL') & 
+                            (raw_df['UNIT'] == 'Percent of total') &
+                            (raw_df['_POSITION'] == 'MEMB_PARL') &
+                            (raw_df['sex'] == 'Women')
+                            ].copy()
+    clean_df.drop(columns=['_EGROUP','UNIT','_POSITION', 'sex'], axis=1, inplace=True)
+    s.rows_out(clean_df)
 print(clean_df.head())
 
 # Filtering only first Quarter of every year
-clean_df2 = clean_df[clean_df['time'].str.contains('Q1')].copy()
+# The periods ('2013-Q1') are parsed once into years and quarters (etl/periods.py)
+with step('filter quarters', clean_df) as s:
+    periods = parse_periods(clean_df['time'])
+    first_quarter = periods.sub == 1
+    clean_df2 = clean_df[first_quarter].copy()
+    # the year of the quarter
+    clean_df2['time'] = periods.year[first_quarter].astype(int)
+    s.rows_out(clean_df2)
 print(clean_df2.head())
 
-# 1.3 Rename country column with help of the EU27.csv in additional data
-# Create dictionary of EU27 countries to apply map function
-countries_df = pd.read_csv("./additional_data/EU27_COUNTRY_LIST.csv")
-countries = dict(zip(countries_df['Initial'].str.strip(), countries_df['Country']))
-print(countries)
-
-# Apply map function to rename the countries
-new_country_column = clean_df2['_geo'].map(countries)
-clean_df2.loc[:,'_geo'] = new_country_column
+# 1.3 Replace the geo codes by the integer key of the country dimension (etl/countries.py)
+# The country names are only added when the table is saved
+print(countries())
+with step('map countries', clean_df2) as s:
+    clean_df2['_geo'] = country_ids(clean_df2['_geo'])
+    s.rows_out(clean_df2)
 print((clean_df2.head()))
 
 # renaming columns
@@ -75,55 +97,80 @@ print((clean_df2.head()))
 
 # 2. Data Cleaning Step 2 (handle null values, not valid rows etc.)
 # 2.1 Explore data with df.info() /df.describe() and clean df if necessary
-# Null Values in Country column are those countries that do not belong to the EU27
-# Therefore removing all rows with Country "NaN"
-# Now, there are no null values in the df anymore
+# Countries that are not in the country dimension have the key UNKNOWN
+# Therefore removing all rows with Country UNKNOWN
+# Now, there are no unknown countries in the df anymore
 print(clean_df2.info())
-clean_df3 = clean_df2[clean_df2['Country'].notna()].copy()
+with step('filter countries', clean_df2) as s:
+    clean_df3 = clean_df2[clean_df2['Country'] != UNKNOWN].copy()
+    s.rows_out(clean_df3)
 print(clean_df3.info())
 print(clean_df3.head())
 
-# Strip the "Q1" from the year column
-clean_df3['Year'] = clean_df3['Year'].str[:4].astype(int)
-print(clean_df3.head())
+# The "Q1" was stripped from the year column when the quarters were filtered
 
 
 # 2.2 Compare if each country has the same number of rows
+# 2.3 Compare if each year has the same number of rows
+# The rows of every country and year are counted in one group-by (etl/validation.py)
+with step('coverage', clean_df3) as s:
+    coverage = coverage_matrix(clean_df3)
+    s.rows_out(coverage)
+print(with_country_names(coverage))
+
 # Each item of the countries list has 54 rows except Croatia: oly 48
-countries = list(countries_df['Country'])
-for c in countries:
-        print('Country: ' + str(c) + ': '+ str((clean_df3['Country'] == c).sum()))
+print(with_country_names(coverage.sum(axis=1)))
 
-# 2.3 Compare if each year has the same number of rows
 # The years 2005 and 2006 have three rows less than the other years
 # These are the 6 missing rows from Croatia
 # Therefore, each year before 2007 will be removed to have consistent data
-for i in range(1990,2025):
-    print('Year: ' + str(i) + ': '+ str((clean_df3['Year'] == i).sum()))
-clean_df3.drop(clean_df3[(clean_df3['Year'] < 2007)].index, inplace=True)
+print(coverage.sum())
+
+# Every EU27 country needs the same number of rows in every year of the indicator (etl/composite.py),
+# the stage stops here if a country or year is missing
+check_coverage(coverage, Expectation(countries=eu27_ids(), years=INDICATORS['parliaments'].years, rows=None),
+               'parliaments')
+with step('filter years', clean_df3) as s:
+    clean_df3.drop(clean_df3[(clean_df3['Year'] < 2007)].index, inplace=True)
+    s.rows_out(clean_df3)
 
 print(clean_df3.info())
 print(clean_df3.describe())
 # 3. Further individual cleaning
-clean_df3['Female parliament members in %'].astype(float)
-clean_df3['Female parliament members in %'] = clean_df3['Female parliament members in %'].div(100).round(2)
-print(clean_df3)
-
+# The calculation is written against the frame API of etl/frames.py like the gap calculation of stage 02:
+# with VA_BACKEND=polars it is one lazy query, with the default pandas backend every step runs eagerly
+# The row of the raw file is kept in a column, it is the index of the CSV export
 # Calculating index: (Actual value - worst value)/(Best value - worst value)
 # Taking the minimal value for female parliament members
-best_value = 0.50
-worst_value = 0
-
-clean_df3['IndexValueDecisionMakers'] = (clean_df3['Female parliament members in %']-worst_value)/(best_value-worst_value)
+# best / worst values are declared in the indicator registry (etl/composite.py): best 0.50, worst 0
+best_value = INDICATORS['parliaments'].best
+worst_value = INDICATORS['parliaments'].worst
+
+with step('index calculation', clean_df3) as s:
+    members = frame(clean_df3.rename_axis('row').reset_index())
+    members = members.with_columns(
+        {'Female parliament members in %': (col('Female parliament members in %') / 100).round(2)})
+    members = members.with_columns(
+        {'IndexValueDecisionMakers': index_value(col('Female parliament members in %'), best_value, worst_value)})
+
+    # Drop European Union Stats
+    members = members.filter(col('Country').isin(eu27_ids()))
+
+    # The polars query runs here - the calls above only recorded it
+    clean_df3 = members.collect().set_index('row').rename_axis(None)
+    s.rows_out(clean_df3)
+print(clean_df3)
 print(clean_df3['IndexValueDecisionMakers'].max())
 
-# Drop European Union Stats
-i = clean_df3[(clean_df3['Country'] == 'European Union')]
-clean_df3.drop(i.index, inplace=True)
-print(clean_df3['Country'].unique())
+with step('save', clean_df3) as s:
+    # Country names for the export
+    clean_df3['Country'] = country_names(clean_df3['Country'])
+    print(clean_df3['Country'].unique())
 
-# 5. Save cleaned dataframe in folder datasets_cleaned -- GIVE A UNIQUE NAME!
-clean_df3.to_csv('./datasets_cleaned/Members of national parliaments.csv')
+    # 5. Save cleaned dataframe in folder datasets_cleaned -- GIVE A UNIQUE NAME!
+    # (parquet store partitioned by Year, CSV export for the dashboard)
+    save_table('parliaments', clean_df3, csv='./datasets_cleaned/Members of national parliaments.csv', csv_index=True)
+    s.rows_out(clean_df3)
 
 
 
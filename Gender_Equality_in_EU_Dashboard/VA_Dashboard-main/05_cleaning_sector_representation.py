@@ -1,8 +1,29 @@
 # Import packages
+import numpy as np
 import pandas as pd
+from etl.cube import Cube, to_long_frame
+from etl.eurostat import stream_sdmx_csv
+from etl.composite import INDICATORS
+from etl.countries import UNKNOWN, country_ids, country_names, eu27_codes
+from etl.indicators import index_value
+from etl.partition import map_countries, shared_table
+from etl.periods import annual
+from etl.profile import column_profile, describe_column
+from etl.sectors import DRILLDOWN_KEYS, country_drilldown
+from etl.watermarks import changed_slices, commit_watermarks, save_refreshed, slice_rows
+from etl.telemetry import step
 
 # Reading in raw csv files from datasets_raw
-df = pd.read_csv('./datasets_raw/Economic_sector_gender_representation_2013_2022.csv')
+# The shared loader skips the constant columns DATAFLOW, LAST UPDATE and freq
+# The file is streamed in chunks with every quarter, which are turned into annual figures below (see Time_period)
+# Every logical step records its time, memory and rows in / out (etl/telemetry.py)
+# Incremental refresh (etl/watermarks.py): only the country / year slices that changed since the last run
+# are recomputed and upserted into the cleaned table, the whole table is rebuilt on the first run
+refresh = changed_slices('sectors', './datasets_raw/Economic_sector_gender_representation_2013_2022.csv')
+with step('load') as s:
+    df = stream_sdmx_csv('./datasets_raw/Economic_sector_gender_representation_2013_2022.csv', value_dtype='float64')
+    df = slice_rows(df, refresh)
+    s.rows_out(df)
 
 # Melting data in the correct format (every dimension and value in a column)
 
@@ -13,31 +34,27 @@ print(df.info())
 
 # DATAFLOW
 
-# Contains the datasource, same for all
-print('\n')
-print(df['DATAFLOW'].unique())    
+# Contains the datasource, same for all - not read in by the loader
     
 # LAST_UPDATE:
 
-# When the dataset was last updated, 16/11/22
-print('\n')
-print(df['LAST UPDATE'].unique())
-
-df = df.loc[:, ~df.columns.isin(['DATAFLOW', 'LAST UPDATE'])]  
+# When the dataset was last updated, 16/11/22 - not read in by the loader
 
 # 1.2 Explore each column and there unique values, especially if categorical data AND Decide how to proceed with this data
+# The exploration prints come from the column profile of the loaded table (etl/profile.py): every column
+# is scanned once and the report is cached next to the raw file, so later runs do not scan it again
+with step('profile', df):
+    profile = column_profile('./datasets_raw/Economic_sector_gender_representation_2013_2022.csv', df, cache=refresh.full)
 
 # Frequency:
 
-# Q: Frequency of datapoints are quarterly.
-print('\n')
-print(df['freq'].unique())
+# Q: Frequency of datapoints are quarterly - not read in by the loader
 
 # Unit:
     
 # THS: Data is presented as number of people employed in thousands
 print('\n')
-print(df['unit'].unique())
+print(describe_column(profile, 'unit'))
 
 # Sex:
 
@@ -45,58 +62,58 @@ print(df['unit'].unique())
 # M: Male
 # T: Total
 print('\n')
-print(df['sex'].unique())
+print(describe_column(profile, 'sex'))
 
 # Age:
 
 # One age group, Y15-64, number of people employed between 15 and 64 years old 
 print('\n')
-print(df['age'].unique())
+print(describe_column(profile, 'age'))
 
 # Isco08:
 
 # The categorisation of economic sectors employment are divided into
 print('\n')
-print(df['isco08'].unique())
+print(describe_column(profile, 'isco08'))
 
 # Worktime:
 
 # FT: Full-time employment
 print('\n')
-print(df['worktime'].unique())
+print(describe_column(profile, 'worktime'))
 
 # Geo:
 
 # EU countries included in the dataset, abbrivated
 print('\n')
-print(df['geo'].unique())
+print(describe_column(profile, 'geo'))
 
 # Time_period:
 
 # Quarterly data for the period Q1 2013 to Q2 2022
 print('\n')
-print(df['TIME_PERIOD'].unique())
+print(describe_column(profile, 'TIME_PERIOD'))
 
 # OBS_value:
 
 # Number of people employed in absolute numbers, in thousands, as float
 print('\n')
-print(df['OBS_VALUE'].unique())
+print(describe_column(profile, 'OBS_VALUE'))
 
 # OBS_flag:
 
 # comments from Eurostat on the quality of the data
 print('\n')
-print(df['OBS_FLAG'].unique())
+print(describe_column(profile, 'OBS_FLAG'))
 
-# Splitting TIME_PERIOD column into 'Year' and 'Quarter'
-df[['Year','quarter']] = df.TIME_PERIOD.str.split("-",expand=True,)
 # The other datasets are annual figures, which provide a snapshot at a certain time,
 # thus any quarter will provide a comparabble snapshot 
-df = df[df.quarter == 'Q2']
+# The periods are parsed once into years and quarters and every series gets one annual value
+# (etl/periods.py annual): how='single' takes the Q2 value, 'mean', 'last' and 'weighted' would use all quarters
+with step('annual', df) as s:
+    df = annual(df, ['unit', 'sex', 'age', 'isco08', 'worktime', 'geo'], 'OBS_VALUE', how='single', sub=2)
+    s.rows_out(df)
 
-print(df['OBS_FLAG'].describe())
-print(df['OBS_FLAG'].value_counts())
 
 # Quarter 2 is used as it provides the most datapoints and fewer type of special values than Q1 and Q3.
 # Q4 has the same categories of special values, but overall more missing values.
@@ -105,127 +122,123 @@ print(df['OBS_FLAG'].value_counts())
 # Since we're interested in the 
 
 # Removing the following columns as they are not relevant for calculation. 
-df = df.loc[:, ~df.columns.isin(['freq','unit','age','worktime', 'OBS_FLAG'])]
+df = df.loc[:, ~df.columns.isin(['unit','age','worktime', 'OBS_FLAG', 'coverage'])]
 
 # Renaming columns
 df.rename(columns = {'isco08':'Sector', 'geo':'Country', 'OBS_VALUE':'Value'}, inplace = True)
 
-# 1.3 Rename country column with help of the EU27.csv in additional data
-''' FIX (Ries method) '''
-geo_names = {
-'BE' :'Belgium',
-'BG' :'Bulgaria',
-'CZ' :'Czech Republic',
-'DK' :'Denmark',
-'DE' :'Germany',
-'EE' :'Estonia',
-'IE' :'Ireland',
-'EL' :'Greece',
-'ES' :'Spain',
-'FR' :'France',
-'HR' :'Croatia',
-'IT' :'Italy',
-'CY' :'Cyprus',
-'LV' :'Latvia',
-'LT' :'Lithuania',
-'LU' :'Luxembourg',
-'HU' :'Hungary',
-'MT' :'Malta',
-'NL' :'Netherlands',
-'AT' :'Austria',
-'PL' :'Poland',
-'PT' :'Portugal',
-'RO' :'Romania',
-'SI' :'Slovenia',
-'SK' :'Slovakia',
-'FI' :'Finland',
-'SE' :'Sweden'}
-
-df['Country'] = df['Country'].map(geo_names) 
+# 1.3 Country key of the country dimension
+# The geo codes are replaced by the integer key of the country dimension (etl/countries.py), which is
+# numbered in alphabetical order of the country names, so the cube below is sorted like the pivots by name.
+# Codes outside the EU27 (e.g. the EU aggregate) are dropped
+with step('map countries', df) as s:
+    df['Country'] = country_ids(df['Country'], eu27_only=True)
+    df = df[df['Country'] != UNKNOWN]
+    s.rows_out(df)
 
 # 2. Data Cleaning Step 2 (handle null values, not valid rows etc.)
 
 # Reshaping to calculate female percentage of employment for every sector
-sector_percentage = df.pivot_table(df, index=['Year','Country','Sector'], columns=['sex'])
-print(sector_percentage)
-sector_percentage['percent'] = sector_percentage['Value','F']/sector_percentage['Value','T']
-# selecting the percentage column
-p_sector = sector_percentage.loc[:,'percent']
-p_sector = p_sector.to_frame()
-
-print(sector_percentage)
-print(p_sector)
-
-# Creating a dataframe for the visualtization per sector 
+# The data is held as a dense Year x Country x Sector x sex cube (see etl/cube.py), every step below is an
+# array operation on it instead of a pivot_table / stack round-trip
+with step('pivot', df) as s:
+    values = Cube.from_frame(df, ['Year', 'Country', 'Sector', 'sex'], 'Value')
+    p_sector = values.sel('sex', 'F').with_values(values.sel('sex', 'F').values / values.sel('sex', 'T').values)
+    print(p_sector.values.shape)
+    s.rows_out(p_sector)
+
+# Creating a cube for the visualtization per sector 
 sector_overview = p_sector
 
-# reshaping to sector as columns to calculate average percentage over all sectors
-p_country = p_sector.pivot_table(p_sector, index=['Year','Country'], columns=['Sector'])
-print(p_country.describe())
-# Deleting the total column (specify first levl of column index, then the actual column):
-p_country = p_country.drop(('percent', 'TOTAL'), axis=1)
-# Visual inspection through Excel
-#p_country.to_csv('p_country.csv')
-#p_country.to_excel('p_country.xlsx')
+# Deleting the total column and averaging over all sectors:
+p_country = p_sector.drop('Sector', ['TOTAL'])
 
 # The OC0 column has fewer datapoints, 74, while the remaining sectors have 258-269 datapoints
 # However, since we're interested in the averages gender representation across a country's economy,
 # missing datapoints can be accepted
-#p_country = p_country.drop(('percent', 'OC0'), axis=1)
+#p_country = p_country.drop('Sector', ['OC0'])
 
-print(p_country)
-p_country['sum'] = p_country.sum(axis=1)
-p_country['count'] = p_country.count(axis=1)-1
 # Calculate the average female representation in a country by summing the percentages and dividing by the number of available
-# datapoints (the couont)
-p_country['Average female percentage'] = p_country['sum']/p_country['count']
-print(p_country)
+# datapoints (the count)
+# Countries / years without any data are dropped
+with step('average', p_country) as s:
+    average = p_country.nanmean('Sector').transpose(['Country', 'Year']).dropna()
 
-# Deleting  every column except avg_percent:
-p_country = p_country.drop((['percent','sum', 'count']), axis=1)
-clean_df = p_country.droplevel(('Sector'), axis=1)
-
-# Since the goal is equal gender representation, the female/male gap is calculated as the distance from 50% in either direction
-# The gap is the absolute value of (50% - Female percentage):
-clean_df['Gap'] = abs(0.5 - clean_df['Average female percentage'])
+    # Since the goal is equal gender representation, the female/male gap is calculated as the distance from 50% in either direction
+    # The gap is the absolute value of (50% - Female percentage):
+    gap = average.with_values(abs(0.5 - average.values))
+    s.rows_out(average)
 
 # Calculating index: (Actual value - worst value)/(Best value - worst value)
-Best_value = 0
-Worst_value = 0.5
-clean_df['Index'] = (clean_df['Gap']-Worst_value)/(Best_value-Worst_value)
-
-print(clean_df)
-
-# Pivoting in order to fill in zeros for Nans where there is insufficent data to calculate
+# best / worst values are declared in the indicator registry (etl/composite.py): best 0, worst 0.5
+Best_value = INDICATORS['sectors'].best
+Worst_value = INDICATORS['sectors'].worst
+with step('index calculation', gap) as s:
+    index = gap.with_values(index_value(gap.values, Best_value, Worst_value))
+    s.rows_out(index)
+
+# Filling in zeros for Nans where there is insufficent data to calculate
 # the gap and thereby the index
-fill_na_df = clean_df.pivot_table(clean_df, index=['Country'], columns=['Year'])
-fill_na_df = fill_na_df.fillna(0)
 # Reshaping to 'Country, Year, Average female percentage, gap, Index'
-final_df = fill_na_df.stack()
+with step('long format', index) as s:
+    final_df = to_long_frame({'Average female percentage': average.fillna(0),
+                              'Gap': gap.fillna(0),
+                              'Index': index.fillna(0)})
+    # Country names for the export
+    final_df['Country'] = country_names(final_df['Country'])
+    s.rows_out(final_df)
+print(final_df)
 
 # 2.2 Compare if each country has the same number of rows
 
-control_df = final_df.pivot_table(final_df, index=['Country'], columns=['Year'])
+control_df = final_df.pivot_table(index='Country', columns='Year', values='Index')
 print(control_df.count())
 # 27 datapoints for each year
 
 
 # 2.3 Compare if each year has the same number of rows
-control_df = final_df.pivot_table(final_df, index=['Year'], columns=['Country'])
+control_df = final_df.pivot_table(index='Year', columns='Country', values='Index')
 print(control_df)
 
 
-final_df.to_csv('./datasets_cleaned/Economic sector representation 2013-2022.csv')
+with step('save', final_df) as s:
+    save_refreshed(refresh, 'sectors', final_df, keys=['Country', 'Year'],
+                   csv='./datasets_cleaned/Economic sector representation 2013-2022.csv')
+    s.rows_out(final_df)
 #final_df.to_excel('Economic sector representation 2013-2022.xlsx')
 
-print(sector_overview)
-
 # Reshaping and replacing all sectors with missing values with zero to maintain
-# equal numbers of rows/columns
-sector_overview = sector_overview.pivot_table(sector_overview, index=['Country','Year'], columns=['Sector'])
-sector_overview = sector_overview.drop(['2022','2021'], level='Year')
-sector_overview = sector_overview.fillna(0)
-sector_overview = sector_overview.stack()
+# equal numbers of rows/columns - only Country/Year combinations with at least one sector are kept
+with step('sector overview', sector_overview) as s:
+    sector_overview = sector_overview.transpose(['Country', 'Year', 'Sector']).dropna(['Sector'])
+    sector_overview = sector_overview.drop('Year', [2022, 2021])
+    has_sectors = ~np.isnan(sector_overview.values).all(axis=2)
+    sector_overview = to_long_frame({'percent': sector_overview.fillna(0)}, mask=has_sectors[:, :, None])
+    sector_overview['Country'] = country_names(sector_overview['Country'])
+    s.rows_out(sector_overview)
 print(sector_overview)
-sector_overview.to_csv('./datasets_cleaned/ESR all sectors 2013-2020.csv')
+with step('save sector overview', sector_overview) as s:
+    save_refreshed(refresh, 'sector_overview', sector_overview, keys=['Country', 'Year', 'Sector'],
+                   csv='./datasets_cleaned/ESR all sectors 2013-2020.csv')
+    s.rows_out(sector_overview)
+
+# Sector drill-down (etl/sectors.py): the full matrix of every quarter, worktime and ISCO-08 code
+# with the female share of every cell, for the sector view of the dashboard
+# Every country is calculated by its own worker process (VA_JOBS), the workers read their rows from the
+# shared parquet cache of the raw file and the partial tables are merged in country order
+# An incremental refresh only recalculates the changed slices of the changed countries
+with step('sector drill-down') as s:
+    drilldown_codes = [code for code in (eu27_codes() if refresh.full else refresh.codes) if code in eu27_codes()]
+    drilldown_years = None if refresh.full else {code: [y for g, y in refresh.slices if g == code] for code in drilldown_codes}
+    drilldown = map_countries(country_drilldown,
+                              shared_table('./datasets_raw/Economic_sector_gender_representation_2013_2022.csv'),
+                              drilldown_codes, drilldown_years)
+    drilldown['Country'] = country_names(country_ids(drilldown['Country']))
+    s.rows_out(drilldown)
+print(drilldown)
+with step('save sector drill-down', drilldown) as s:
+    save_refreshed(refresh, 'sector_drilldown', drilldown, keys=DRILLDOWN_KEYS,
+                   csv='./datasets_cleaned/ESR sector drill-down 2013-2022.csv')
+    s.rows_out(drilldown)
+commit_watermarks(refresh)
 #sector_overview.to_excel('ESR all sectors 2013-2020.xlsx')
\ No newline at end of file
@@ -1,8 +1,24 @@
 # Import packages
 import pandas as pd
+from etl.cube import Cube, to_long_frame
+from etl.eurostat import read_sdmx_csv
+from etl.composite import INDICATORS
+from etl.countries import UNKNOWN, country_ids, country_names
+from etl.indicators import index_value
+from etl.profile import column_profile, describe_column
+from etl.watermarks import changed_slices, commit_watermarks, save_refreshed, slice_rows
+from etl.telemetry import step
 
 # Reading in raw csv files from datasets_raw
-df = pd.read_csv('./datasets_raw/Gender pay gap raw.csv')
+# The shared loader skips the constant columns DATAFLOW, LAST UPDATE and freq and caches the parsed file
+# Every logical step records its time, memory and rows in / out (etl/telemetry.py)
+# Incremental refresh (etl/watermarks.py): only the country / year slices that changed since the last run
+# are recomputed and upserted into the cleaned table, the whole table is rebuilt on the first run
+refresh = changed_slices('pay', './datasets_raw/Gender pay gap raw.csv')
+with step('load') as s:
+    df = read_sdmx_csv('./datasets_raw/Gender pay gap raw.csv', value_dtype='float64')
+    df = slice_rows(df, refresh)
+    s.rows_out(df)
 
 # 1. Data Cleaning Step 1
 # 1.1 Identify and delete columns that are not necessary for further process
@@ -11,58 +27,50 @@ print(df.info())
 
 # DATAFLOW
 
-# Contains the datasource, same for all
-print('\n')
-print(df['DATAFLOW'].unique())    
+# Contains the datasource, same for all - not read in by the loader
     
 # LAST_UPDATE:
 
-# When the dataset was last updated, 25/02/22
-print('\n')
-print(df['LAST UPDATE'].unique())
-
-# Removing the columns above
-
-df = df.loc[:, ~df.columns.isin(['DATAFLOW', 'LAST UPDATE'])]
+# When the dataset was last updated, 25/02/22 - not read in by the loader
 
 # 1.2 Explore each column and there unique values, especially if categorical data AND Decide how to proceed with this data
+# The exploration prints come from the column profile of the loaded table (etl/profile.py): every column
+# is scanned once and the report is cached next to the raw file, so later runs do not scan it again
+with step('profile', df):
+    profile = column_profile('./datasets_raw/Gender pay gap raw.csv', df, cache=refresh.full)
 
-# A: Frequency of datapoints are annual.
-print('\n')
-print(df['freq'].unique())
+# A: Frequency of datapoints are annual - not read in by the loader
 
 # Unit:
     
 # PC: Data is the difference in earninggs between females and males as a percentage of males earnings.
 # Closer to zero is therefore better
 print('\n')
-print(df['unit'].unique())
+print(describe_column(profile, 'unit'))
 
 # nace_r2
 # Codenames for the different economic sectors 
 print('\n')
-print(df['nace_r2'].unique())
+print(describe_column(profile, 'nace_r2'))
 
 # Geo:
 
 # EU countries included in the dataset, abbrivated
 print('\n')
-print(df['geo'].unique())
-print(df['geo'].value_counts())
+print(describe_column(profile, 'geo'))
 
 # Time_period:
  
 # Annual data for the period 2009 to 2020
 print('\n')
-print(df['TIME_PERIOD'].unique())
-print(df['TIME_PERIOD'].value_counts())
+print(describe_column(profile, 'TIME_PERIOD'))
 
 # OBS_value:
 
 # Percentage values as float, where the percentage is the 
 # difference between women and men as percentage of men's salary
 print('\n')
-print(df['OBS_VALUE'].unique())
+print(describe_column(profile, 'OBS_VALUE'))
 
 # OBS_flag:
 
@@ -79,8 +87,7 @@ print(df['OBS_VALUE'].unique())
 # Eurostat's data serves as the best available data on the topic, and these
 # remarks are therfore ignored
 print('\n')
-print(df['OBS_FLAG'].unique())
-print(df['OBS_FLAG'].value_counts())
+print(describe_column(profile, 'OBS_FLAG'))
 
 ''' 
 sectors = df.groupby(['nace_r2'])
@@ -97,35 +104,6 @@ print(obs_values.describe())
 Note: Since we're interested in the average gender pay gap across a country's economy, and as long as a country 
 has one or more datapoints, an average will be calculated and Nans will not be replaced with zeros before at the end.'''
 
-geo_names = {
-'BE' :'Belgium',
-'BG' :'Bulgaria',
-'CZ' :'Czech Republic',
-'DK' :'Denmark',
-'DE' :'Germany',
-'EE' :'Estonia',
-'IE' :'Ireland',
-'EL' :'Greece',
-'ES' :'Spain',
-'FR' :'France',
-'HR' :'Croatia',
-'IT' :'Italy',
-'CY' :'Cyprus',
-'LV' :'Latvia',
-'LT' :'Lithuania',
-'LU' :'Luxembourg',
-'HU' :'Hungary',
-'MT' :'Malta',
-'NL' :'Netherlands',
-'AT' :'Austria',
-'PL' :'Poland',
-'PT' :'Portugal',
-'RO' :'Romania',
-'SI' :'Slovenia',
-'SK' :'Slovakia',
-'FI' :'Finland',
-'SE' :'Sweden'}
-
 # A shortened list of codenames for the different sectors:
 ind_names = {'Industry (1)' : 'B-S', 
              'Industry (2)' : 'B-S_X_O', 
@@ -142,61 +120,66 @@ ind_names = {'Industry (1)' : 'B-S',
              'Financial activities' : 'K'}
 
 # Removing the following columns
-df = df.loc[:, ~df.columns.isin(['freq', 'unit', 'OBS_FLAG'])]
+df = df.loc[:, ~df.columns.isin(['unit', 'OBS_FLAG'])]
 
-# 1.3 Renaming columns and mapping country names
+# 1.3 Renaming columns and replacing the geo codes by the country key
 df.rename(columns = {'nace_r2':'Sector', 'geo':'Country', 'TIME_PERIOD':'Year', 'OBS_VALUE':'Value'}, inplace = True)
 
-# Mapping names to abbrivations
-df['Country'] = df['Country'].map(geo_names)
+# The geo codes are replaced by the integer key of the country dimension (etl/countries.py), which is
+# numbered in alphabetical order of the country names, so the cube below is sorted like the pivots by name.
+# Codes outside the EU27 (e.g. the EU aggregate) are dropped
+with step('map countries', df) as s:
+    df['Country'] = country_ids(df['Country'], eu27_only=True)
+    df = df[df['Country'] != UNKNOWN]
+    s.rows_out(df)
 #df['nace_r2'] = df['nace_r2'].map(ind_names) 
 
-# Reshaping to calculate average across all sectors
-temp_df = df.pivot_table(df, index=['Year','Country'], columns=['Sector'])
-
-temp_df['sum'] = temp_df.sum(axis=1)
-temp_df['count'] = temp_df.count(axis=1)-1
-temp_df['average % pay gap'] = temp_df['sum']/temp_df['count']
-print(temp_df)
-
-temp_df = temp_df.droplevel(('Sector'), axis=1)
-# For selcting timeperioeds:
-temp_df = temp_df.loc['2009':'2020':]
-temp_df = temp_df.drop(('Value'), axis=1)
-temp_df = temp_df.drop(('count'), axis=1)
-temp_df = temp_df.drop(('sum'), axis=1)
+# Reshaping to a dense Year x Country x Sector cube (see etl/cube.py) to calculate the average across all sectors
+with step('pivot', df) as s:
+    values = Cube.from_frame(df, ['Year', 'Country', 'Sector'], 'Value')
+    average = values.nanmean('Sector').transpose(['Country', 'Year'])
+    # For selcting timeperioeds:
+    average = average.isel('Year', (average.labels[1] >= 2009) & (average.labels[1] <= 2020))
+    # Countries / years without any data are dropped
+    average = average.dropna()
+    s.rows_out(average)
+print(average.values)
 
 # Calculating index: (Actual value - worst value)/(Best value - worst value)
-Best_value = 0
-Worst_value = 100
-temp_df['Index'] = (temp_df['average % pay gap']-Worst_value)/(Best_value-Worst_value)
-
-# Pivoting in order to fill in zeros for Nans where there is insufficent data to calculate
+# best / worst values are declared in the indicator registry (etl/composite.py): best 0, worst 100
+Best_value = INDICATORS['pay'].best
+Worst_value = INDICATORS['pay'].worst
+with step('index calculation', average) as s:
+    index = average.with_values(index_value(average.values, Best_value, Worst_value))
+    s.rows_out(index)
+
+# Filling in zeros for Nans where there is insufficent data to calculate
 # the gap and thereby the index
-filling_zeros_df = temp_df.pivot_table(temp_df, index=['Year'], columns=['Country'])
-filling_zeros_df = filling_zeros_df.fillna(0)
-filling_zeros_df = filling_zeros_df.stack()
-
 # Reshaping to 'Country, Year, average % pay gap, Index'
-filling_zeros_df = filling_zeros_df.pivot_table(temp_df, index=['Country'], columns=['Year'])
-filling_zeros_df = filling_zeros_df.stack()
-final_df = filling_zeros_df[['average % pay gap', 'Index']]
+with step('long format', index) as s:
+    final_df = to_long_frame({'average % pay gap': average.fillna(0), 'Index': index.fillna(0)})
+    # Country names for the export
+    final_df['Country'] = country_names(final_df['Country'])
+    s.rows_out(final_df)
 
 
 print(final_df)
 
-final_df.to_csv('./datasets_cleaned/Gender Pay Gap 2009-2020.csv')
+with step('save', final_df) as s:
+    save_refreshed(refresh, 'pay', final_df, keys=['Country', 'Year'], csv='./datasets_cleaned/Gender Pay Gap 2009-2020.csv')
+    commit_watermarks(refresh)
+    s.rows_out(final_df)
 #final_df.to_excel('Gender Pay Gap 2009-2020.xlsx')
 
 
 # 2.2 Compare if each country has the same number of rows
 
-control = final_df.pivot_table(final_df, index=['Country'], columns=['Year'])
+control = final_df.pivot_table(index='Country', columns='Year', values='Index')
 print(control.count())
 # 27 counts for every year                   
 
 # 2.3 Compare if each year has the same number of rows
-control = final_df.pivot_table(final_df, index=['Year'], columns=['Country'])
+control = final_df.pivot_table(index='Year', columns='Country', values='Index')
 print(control.count())
 # 12 counts for every country
 
@@ -1,37 +1,24 @@
 # Import packages
 import pandas as pd
+from etl.cube import Cube, to_long_frame
+from etl.eurostat import read_sdmx_csv
+from etl.composite import INDICATORS
+from etl.countries import UNKNOWN, country_ids, country_names
+from etl.indicators import index_value
+from etl.profile import column_profile, describe_column
+from etl.watermarks import changed_slices, commit_watermarks, save_refreshed, slice_rows
+from etl.telemetry import step
 
 # Reading in raw csv files from datasets_raw
-df = pd.read_csv('./datasets_raw/Pension gap raw.csv')
-geo_names = {
-'BE' :'Belgium',
-'BG' :'Bulgaria',
-'CZ' :'Czech Republic',
-'DK' :'Denmark',
-'DE' :'Germany',
-'EE' :'Estonia',
-'IE' :'Ireland',
-'EL' :'Greece',
-'ES' :'Spain',
-'FR' :'France',
-'HR' :'Croatia',
-'IT' :'Italy',
-'CY' :'Cyprus',
-'LV' :'Latvia',
-'LT' :'Lithuania',
-'LU' :'Luxembourg',
-'HU' :'Hungary',
-'MT' :'Malta',
-'NL' :'Netherlands',
-'AT' :'Austria',
-'PL' :'Poland',
-'PT' :'Portugal',
-'RO' :'Romania',
-'SI' :'Slovenia',
-'SK' :'Slovakia',
-'FI' :'Finland',
-'SE' :'Sweden'}
-
+# The shared loader skips the constant columns DATAFLOW, LAST UPDATE and freq and caches the parsed file
+# Every logical step records its time, memory and rows in / out (etl/telemetry.py)
+# Incremental refresh (etl/watermarks.py): only the country / year slices that changed since the last run
+# are recomputed and upserted into the cleaned table, the whole table is rebuilt on the first run
+refresh = changed_slices('pension', './datasets_raw/Pension gap raw.csv')
+with step('load') as s:
+    df = read_sdmx_csv('./datasets_raw/Pension gap raw.csv', value_dtype='float64')
+    df = slice_rows(df, refresh)
+    s.rows_out(df)
 ind_names = {'Industry (1)' : 'B-S', 
              'Industry (2)' : 'B-S_X_O', 
              'Business economy' : 'B-N', 
@@ -52,55 +39,48 @@ print(df.columns)
 
 # DATAFLOW
 
-# Contains the datasource, same for all
-print('\n')
-print(df['DATAFLOW'].unique())      
+# Contains the datasource, same for all - not read in by the loader
     
 # LAST_UPDATE:
 
-# When the dataset was last updated, 06/10/22
-print('\n')
-print(df['LAST UPDATE'].unique())
-
-# Removing the columns above
-df = df.loc[:, ~df.columns.isin(['DATAFLOW', 'LAST UPDATE'])]
+# When the dataset was last updated, 06/10/22 - not read in by the loader
 
 # 1.2 Explore each column and there unique values, especially if categorical data AND Decide how to proceed with this data
+# The exploration prints come from the column profile of the loaded table (etl/profile.py): every column
+# is scanned once and the report is cached next to the raw file, so later runs do not scan it again
+with step('profile', df):
+    profile = column_profile('./datasets_raw/Pension gap raw.csv', df, cache=refresh.full)
 
-# Frequency of datapoints are annual.
-print('\n')
-print(df['freq'].unique())
+# Frequency of datapoints are annual - not read in by the loader
 
 # Age:
 # The data concerns pensionst between 65 and 74
 print('\n')
-print(df['age'].unique())
+print(describe_column(profile, 'age'))
 
 # Unit:
     
 # AVG: Data is the average difference in pension between females and males as a percentage of males earnings.
 # Closer to zero is therefore better
 print('\n')
-print(df['unit'].unique())
+print(describe_column(profile, 'unit'))
 
 # Geo:
 
 # 27 EU countries included in the dataset, abbrivated
 print('\n')
-print(df['geo'].unique())
-print(df['geo'].value_counts())
+print(describe_column(profile, 'geo'))
 
 # Time_period: 
 # Annual data for the period 2012 to 2021
 print('\n')
-print(df['TIME_PERIOD'].unique())
-print(df['TIME_PERIOD'].value_counts())
+print(describe_column(profile, 'TIME_PERIOD'))
 
 # OBS_value:
 
 # Percentage values as float values
 print('\n')
-print(df['OBS_VALUE'].info())
+print(describe_column(profile, 'OBS_VALUE'))
 
 # OBS_flag:
 
@@ -110,41 +90,53 @@ print(df['OBS_VALUE'].info())
 # Eurostat's data serves as the best available data on the topic, and these
 # remarks are therfore ignored
 print('\n')
-print(df['OBS_FLAG'].unique())
-print(df['OBS_FLAG'].value_counts())
+print(describe_column(profile, 'OBS_FLAG'))
 
 # Removing further unnecessary columns:
-df = df.loc[:, ~df.columns.isin(['freq', 'age', 'unit'])]
+df = df.loc[:, ~df.columns.isin(['age', 'unit'])]
 
 # Renaming columns
 df.rename(columns = {'geo':'Country', 'TIME_PERIOD':'Year', 'OBS_VALUE':'Difference in pension'}, inplace = True)
 
-# 1.3 Rename country column with help of the EU27.csv in additional data
-# Mapping names to abbrivations
-df['Country'] = df['Country'].map(geo_names)
+# 1.3 Country key of the country dimension
+# The geo codes are replaced by the integer key of the country dimension (etl/countries.py), which is
+# numbered in alphabetical order of the country names, so the cube below is sorted like the pivots by name.
+# Codes outside the EU27 (e.g. the EU aggregate) are dropped
+with step('map countries', df) as s:
+    df['Country'] = country_ids(df['Country'], eu27_only=True)
+    df = df[df['Country'] != UNKNOWN]
+    s.rows_out(df)
 
 print(df.columns)
 
 # One missing value, which will be filled with zero after calculating the index
 print(df['Difference in pension'].describe())
 
-calc_df = df.pivot_table(index=['Country','Year'], values='Difference in pension')
-print(calc_df)
+# Dense Country x Year cube (see etl/cube.py), the one missing value stays NaN
+with step('pivot', df) as s:
+    calc = Cube.from_frame(df, ['Country', 'Year'], 'Difference in pension').dropna()
+    s.rows_out(calc)
+print(calc.values)
 
 
 # Calculating index: (Actual value - worst value)/(Best value - worst value)
-Best_value = 0
-Worst_value = 100
-calc_df['Index'] = (calc_df['Difference in pension']-Worst_value)/(Best_value-Worst_value)
+# best / worst values are declared in the indicator registry (etl/composite.py): best 0, worst 100
+Best_value = INDICATORS['pension'].best
+Worst_value = INDICATORS['pension'].worst
+with step('index calculation', calc) as s:
+    index = calc.with_values(index_value(calc.values, Best_value, Worst_value))
+    s.rows_out(index)
 
 
 # 2. Data Cleaning Step 2 (handle null values, not valid rows etc.)
 
-# Pivoting in order to fill in zeros for Nans 
-fill_na_df = calc_df.pivot_table(calc_df, index=['Country'], columns=['Year'])
-fill_na_df = fill_na_df.fillna(0)
-# Reshaping to 'Country, Year, Average female percentage, gap, Index'
-final_df = fill_na_df.stack()
+# Filling in zeros for Nans 
+# Reshaping to 'Country, Year, Difference in pension, Index'
+with step('long format', index) as s:
+    final_df = to_long_frame({'Difference in pension': calc.fillna(0), 'Index': index.fillna(0)})
+    # Country names for the export
+    final_df['Country'] = country_names(final_df['Country'])
+    s.rows_out(final_df)
 
 # 2.1 Explore data with df.info() /df.describe() and clean df if necessary
 
@@ -154,16 +146,19 @@ print(final_df.describe())
 
 # 2.2 Compare if each country has the same number of rows
 
-control = final_df.pivot_table(final_df, index=['Country'], columns=['Year'])
+control = final_df.pivot_table(index='Country', columns='Year', values='Index')
 print(control.count())
 # 27 counts for every year = every country                  
 
 # 2.3 Compare if each year has the same number of rows
-control = final_df.pivot_table(final_df, index=['Year'], columns=['Country'])
+control = final_df.pivot_table(index='Year', columns='Country', values='Index')
 print(control.count())
 # 10 counts for every country = every year
 
 
 # Saving output
-final_df.to_csv('./datasets_cleaned/Pension gap 2012-2021.csv')
+with step('save', final_df) as s:
+    save_refreshed(refresh, 'pension', final_df, keys=['Country', 'Year'], csv='./datasets_cleaned/Pension gap 2012-2021.csv')
+    commit_watermarks(refresh)
+    s.rows_out(final_df)
 #final_df.to_excel('Pension gap 2012-2021.xlsx')
\ No newline at end of file
@@ -0,0 +1,30 @@
+# Import packages
+import os
+from etl.rollups import ROLLUP_DIR, compute_rollups, load_master_index, write_rollups
+from etl.telemetry import step
+
+# Reading in the master index (parquet store, or datasets_cleaned/master_index_df.csv)
+# Every logical step records its time, memory and rows in / out (etl/telemetry.py)
+with step('load') as s:
+    master_index_df = load_master_index()
+    s.rows_out(master_index_df)
+print(master_index_df.head())
+
+# Rollups of the dashboard (etl/rollups.py): rank of every country within each year, EU27 mean / median
+# and the change to the previous year, for every IndexValue* column and IndexTotal
+with step('rollups', master_index_df) as s:
+    rollups = compute_rollups(master_index_df)
+    s.rows_out(rollups)
+print(rollups.head())
+
+# Top 5 countries of the latest year
+latest = rollups[(rollups['Year'] == rollups['Year'].max()) & (rollups['Measure'] == 'IndexTotal')]
+print(latest.sort_values('Rank').head())
+
+# Save the artifact in datasets_cleaned/rollups: Arrow table, one compressed JSON per year,
+# the sparkline series of every indicator and the manifest index.json
+with step('save', rollups) as s:
+    written = write_rollups(master_index_df)
+    s.rows_out(rollups)
+for path in written:
+    print(os.path.relpath(path, os.path.dirname(ROLLUP_DIR)), os.path.getsize(path), 'bytes')
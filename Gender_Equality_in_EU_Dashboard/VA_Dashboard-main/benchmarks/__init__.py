@@ -0,0 +1,2 @@
+# Benchmarks for the cleaning stages - run from the VA_Dashboard-main folder, e.g.
+#   python -m benchmarks.bench_indicators
@@ -0,0 +1,69 @@
+# Benchmark of the gap / index calculation of the care and violence notebooks:
+# the original iterrows() loops with single .loc writes against etl.indicators
+#
+#   python -m benchmarks.bench_indicators [rows ...]
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from etl.indicators import gap, index_value
+
+
+# care-shaped input: Country, Year, Value for females and males, ~30% missing (0) values
+def make_care_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    countries = np.repeat(np.arange(rows // 25 + 1), 25)[:rows]
+    years = np.tile(np.arange(2000, 2025), rows // 25 + 1)[:rows]
+    frames = []
+    for _ in range(2):
+        values = rng.uniform(1, 60, rows).round(1)
+        values[rng.random(rows) < 0.3] = 0
+        frames.append(pd.DataFrame({'Country': countries, 'Year': years, 'Value': values}))
+    return frames
+
+
+# the loops of 04_cleaning_care.ipynb
+def care_loops(female, male, best_value=0, worst_value=100):
+    master = male.drop('Value', axis=1)
+    for index, row in female.iterrows():
+        if row['Value'] == 0 or male.loc[index, 'Value'] == 0:
+            master.loc[index, 'care_gap_%_active_population'] = 0
+        else:
+            master.loc[index, 'care_gap_%_active_population'] = row['Value'] - male.loc[index, 'Value']
+    for index, row in master.iterrows():
+        if row['care_gap_%_active_population'] != 0:
+            master.loc[index, 'IndexValueCare'] = (row['care_gap_%_active_population'] - worst_value) / (best_value - worst_value)
+        else:
+            master.loc[index, 'IndexValueCare'] = 0
+    return master
+
+
+def care_vectorized(female, male, best_value=0, worst_value=100):
+    master = male.drop('Value', axis=1)
+    master['care_gap_%_active_population'] = gap(female['Value'], male['Value'], zero_as_missing=True)
+    master['IndexValueCare'] = index_value(master['care_gap_%_active_population'], best_value, worst_value, zero_as_missing=True)
+    return master
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(sizes):
+    print('rows'.rjust(8), 'iterrows [s]'.rjust(14), 'vectorized [s]'.rjust(15), 'speedup'.rjust(9))
+    for rows in sizes:
+        female, male = make_care_frames(rows)
+        expected, loop_seconds = timed(care_loops, female, male)
+        result, vector_seconds = timed(care_vectorized, female, male)
+        pd.testing.assert_frame_equal(result, expected)
+        print(str(rows).rjust(8), ('%.4f' % loop_seconds).rjust(14), ('%.4f' % vector_seconds).rjust(15),
+              ('%.0fx' % (loop_seconds / vector_seconds)).rjust(9))
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [675, 6750])
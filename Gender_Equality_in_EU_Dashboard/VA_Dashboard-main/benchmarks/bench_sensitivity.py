@@ -0,0 +1,47 @@
+# Benchmark of the parameter sweep of the composite index (etl/sensitivity.py)
+# Checks that the registry setting reproduces IndexTotal of build_master_index, then times Monte-Carlo
+# sweeps of increasing size over the bounds, the weights and the type of mean, and prints the
+# countries whose rank moves the most.
+#
+#   python -m benchmarks.bench_sensitivity [--scenarios 1000 10000 100000] [--chunk 1000] [--csv summary.csv]
+
+import argparse
+import time
+
+import numpy as np
+
+from etl.composite import build_master_index
+from etl.sensitivity import base_params, composite_totals, load_sweep_inputs, monte_carlo, sweep
+
+
+def main(sizes, chunk=1000, csv=None):
+    inputs = load_sweep_inputs()
+    master_index_df = build_master_index()
+    difference = np.abs(composite_totals(inputs, base_params(inputs))[0] - master_index_df['IndexTotal'].to_numpy())
+    print('registry setting vs master index: max difference ' + str(difference.max()))
+
+    print('scenarios'.rjust(10), 'time [s]'.rjust(9), 'scenarios/s'.rjust(12))
+    summary = None
+    for n in sizes:
+        params = monte_carlo(inputs, n, powers=(0, 1, -1))
+        start = time.perf_counter()
+        summary = sweep(inputs, params, chunk=chunk)
+        seconds = time.perf_counter() - start
+        print(str(n).rjust(10), ('%.2f' % seconds).rjust(9), ('%.0f' % (n / seconds)).rjust(12))
+
+    latest = summary[summary['Year'] == summary['Year'].max()]
+    print('\nrank spread in ' + str(latest['Year'].iloc[0]) + ' (5% - 95% of the scenarios)')
+    spread = latest.assign(spread=latest['p95_rank'] - latest['p05_rank']).sort_values('spread', ascending=False)
+    print(spread[['Country', 'base_rank', 'p05_rank', 'median_rank', 'p95_rank', 'top3_share']].head(10).to_string(index=False))
+    if csv:
+        summary.to_csv(csv, index=False)
+
+
+parser = argparse.ArgumentParser(description='Time the sensitivity sweep of the composite index')
+parser.add_argument('--scenarios', type=int, nargs='+', default=[1000, 10000, 100000], help='sweep sizes')
+parser.add_argument('--chunk', type=int, default=1000, help='scenarios per batch')
+parser.add_argument('--csv', help='write the rank summary of the last sweep to this file')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    main(args.scenarios, args.chunk, args.csv)
@@ -0,0 +1,77 @@
+# Benchmark of the query service (etl/service.py)
+# Times point, range and top-k queries on the loaded tables (without and with the response cache) and
+# the round trip of HTTP requests over one keep-alive connection to a service started in this process.
+#
+#   python -m benchmarks.bench_service [--repeat 20000] [--requests 2000]
+
+import argparse
+import asyncio
+import time
+
+from etl.service import IndexQueries, serve
+
+QUERIES = [
+    ('point', '/point?table=pay&country=Spain&year=2013'),
+    ('range', '/range?table=master_index&country=ES&from=2013&to=2020&columns=IndexValuePay'),
+    ('top-k', '/top?table=master_index&year=2019&column=IndexTotal&k=5'),
+]
+
+
+def time_queries(queries, repeat):
+    print('query'.ljust(7), 'uncached [us]'.rjust(14), 'cached [us]'.rjust(12))
+    for name, target in QUERIES:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            queries.cache.clear()
+            queries.answer(target)
+        uncached = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(repeat):
+            queries.answer(target)
+        cached = (time.perf_counter() - start) / repeat
+        print(name.ljust(7), ('%.1f' % (uncached * 1e6)).rjust(14), ('%.1f' % (cached * 1e6)).rjust(12))
+
+
+async def time_http(queries, requests, port):
+    server = asyncio.create_task(serve('127.0.0.1', port, queries=queries))
+    await asyncio.sleep(0.2)
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    start = time.perf_counter()
+    for i in range(requests):
+        target = QUERIES[i % len(QUERIES)][1]
+        writer.write(('GET ' + target + ' HTTP/1.1\r\nHost: localhost\r\n\r\n').encode())
+        await writer.drain()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line == b'\r\n':
+                break
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+        await reader.readexactly(length)
+    seconds = time.perf_counter() - start
+    writer.close()
+    await writer.wait_closed()
+    # let the service see the closed connection before it stops
+    await asyncio.sleep(0.1)
+    server.cancel()
+    print('\nHTTP keep-alive: ' + str(requests) + ' requests in %.2fs, %.0f requests/s, %.0f us per request'
+          % (seconds, requests / seconds, seconds / requests * 1e6))
+
+
+def main(repeat, requests, port):
+    start = time.perf_counter()
+    queries = IndexQueries()
+    print('tables loaded in %.2fs' % (time.perf_counter() - start))
+    time_queries(queries, repeat)
+    asyncio.run(time_http(queries, requests, port))
+
+
+parser = argparse.ArgumentParser(description='Time the queries of the index service')
+parser.add_argument('--repeat', type=int, default=20000, help='repetitions of every query')
+parser.add_argument('--requests', type=int, default=2000, help='HTTP requests')
+parser.add_argument('--port', type=int, default=8766, help='port of the service started for the benchmark')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    main(args.repeat, args.requests, args.port)
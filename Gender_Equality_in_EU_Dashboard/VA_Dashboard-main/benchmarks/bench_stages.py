@@ -0,0 +1,107 @@
+# Benchmark of every cleaning stage (02 - 07, the violence / care notebooks) and the master index
+# on synthetic inputs at several multiples of the real data size (see benchmarks/synthetic.py).
+# Every stage runs in its own process on the synthetic folder, so the reported peak memory (max RSS)
+# belongs to that stage alone. The stages run in pipeline order, so the master index is built from
+# the cleaned tables of the same scale.
+#
+#   python -m benchmarks.bench_stages [--scales 1 10 100] [--stages pay pension ...]
+#                                     [--workdir DIR] [--warm] [--json results.json]
+#
+# By default the parquet cache of the raw files is removed before every stage, so the times include
+# parsing the raw files. --warm keeps the cache of the previous run of the same scale.
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from etl import telemetry
+from etl.pipeline import LOG_DIR, STAGES, run_code
+from benchmarks.synthetic import RAW_DIR, generate
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# executed in the child process: cwd and VA_DASHBOARD_DIR point at the synthetic folder
+def run_child(name):
+    stage = {stage.name: stage for stage in STAGES}[name]
+    os.makedirs(LOG_DIR, exist_ok=True)
+    start = time.perf_counter()
+    with open(os.path.join(LOG_DIR, name + '.log'), 'w') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        telemetry.begin(name)
+        run_code(os.path.join(REPO_DIR, stage.code))
+        telemetry.finish()
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(json.dumps({'seconds': seconds, 'peak_bytes': peak}))
+
+
+# size of the files the stage reads: the raw downloads, or the cleaned tables of the earlier stages
+# for the master index and the rollups
+def input_bytes(folder, stage):
+    paths = [os.path.join(folder, p) for p in stage.inputs]
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+def bench_stage(folder, stage, warm):
+    if not warm:
+        shutil.rmtree(os.path.join(folder, RAW_DIR, '.cache'), ignore_errors=True)
+    env = dict(os.environ, VA_DASHBOARD_DIR=folder,
+               PYTHONPATH=os.pathsep.join([REPO_DIR] + [p for p in [os.environ.get('PYTHONPATH')] if p]))
+    process = subprocess.run([sys.executable, '-m', 'benchmarks.bench_stages', '--child', stage.name],
+                             cwd=folder, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        sys.stderr.write(process.stderr)
+        return None
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main(scales, names=None, workdir=None, warm=False, json_file=None):
+    stages = [stage for stage in STAGES if not names or stage.name in names]
+    workdir = workdir or tempfile.mkdtemp(prefix='va_bench_')
+    results = []
+    print('scale'.rjust(6), 'stage'.ljust(12), 'input [MB]'.rjust(11), 'time [s]'.rjust(9), 'peak [MB]'.rjust(10))
+    for scale in scales:
+        folder = os.path.join(workdir, 'scale_' + str(scale))
+        if not os.path.isdir(os.path.join(folder, RAW_DIR)):
+            start = time.perf_counter()
+            generate(folder, scale)
+            print(str(scale).rjust(6), 'generated in %.1fs' % (time.perf_counter() - start))
+        for stage in stages:
+            result = bench_stage(folder, stage, warm)
+            size = input_bytes(folder, stage)
+            if result is None:
+                print(str(scale).rjust(6), stage.name.ljust(12), ('%.2f' % (size / 1e6)).rjust(11),
+                      'failed, see ' + os.path.join(folder, LOG_DIR, stage.name + '.log'))
+                continue
+            print(str(scale).rjust(6), stage.name.ljust(12), ('%.2f' % (size / 1e6)).rjust(11),
+                  ('%.2f' % result['seconds']).rjust(9), ('%.0f' % (result['peak_bytes'] / 1e6)).rjust(10))
+            results.append(dict(result, scale=scale, stage=stage.name, input_bytes=size))
+    if json_file:
+        with open(json_file, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+parser = argparse.ArgumentParser(description='Time and peak memory of every stage on synthetic inputs')
+parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100], help='multiples of the real input sizes')
+parser.add_argument('--stages', nargs='+', help='stages to run: ' + ', '.join(s.name for s in STAGES))
+parser.add_argument('--workdir', help='folder for the synthetic inputs (default: a new temporary folder)')
+parser.add_argument('--warm', action='store_true', help='keep the parquet cache of the raw files between runs')
+parser.add_argument('--json', help='write the results to this file')
+parser.add_argument('--child', help=argparse.SUPPRESS)
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    if args.child:
+        run_child(args.child)
+    else:
+        main(args.scales, args.stages, args.workdir, args.warm, args.json)
@@ -0,0 +1,70 @@
+# Parity of the dataframe backends (etl/frames.py)
+# Runs the stages that calculate on the frame API once per backend on the synthetic inputs (see
+# benchmarks/synthetic.py), each run a full refresh in its own process, and checks that every backend
+# writes the same cleaned CSV byte for byte. Prints the time of every run.
+#
+#   python -m benchmarks.parity_backends [--scales 1 10] [--backends pandas polars] [--workdir DIR]
+#
+# Exits with 1 when the outputs of the backends differ.
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+from etl.frames import BACKENDS
+from etl.pipeline import STAGES
+from benchmarks.bench_stages import bench_stage
+from benchmarks.synthetic import RAW_DIR, generate
+
+# stages whose calculation runs on the frame API
+FRAME_STAGES = ['employment', 'parliaments']
+
+
+def output_digests(folder, stage):
+    digests = {}
+    for path in stage.outputs:
+        with open(os.path.join(folder, path), 'rb') as f:
+            digests[path] = hashlib.sha256(f.read()).hexdigest()
+    return digests
+
+
+def main(scales, backends, workdir=None):
+    workdir = workdir or tempfile.mkdtemp(prefix='va_parity_')
+    stages = [stage for stage in STAGES if stage.name in FRAME_STAGES]
+    same = True
+    print('scale'.rjust(6), 'stage'.ljust(12), 'backend'.ljust(8), 'time [s]'.rjust(9), 'output')
+    for scale in scales:
+        folder = os.path.join(workdir, 'scale_' + str(scale))
+        if not os.path.isdir(os.path.join(folder, RAW_DIR)):
+            generate(folder, scale)
+        for stage in stages:
+            reference = None
+            for backend in backends:
+                os.environ['VA_BACKEND'] = backend
+                os.environ['VA_FULL_REFRESH'] = '1'
+                start = time.perf_counter()
+                result = bench_stage(folder, stage, warm=True)
+                seconds = time.perf_counter() - start
+                if result is None:
+                    print(str(scale).rjust(6), stage.name.ljust(12), backend.ljust(8), 'failed')
+                    same = False
+                    continue
+                digests = output_digests(folder, stage)
+                reference = reference or digests
+                status = 'same' if digests == reference else 'DIFFERENT'
+                same = same and digests == reference
+                print(str(scale).rjust(6), stage.name.ljust(12), backend.ljust(8), ('%.2f' % seconds).rjust(9), status)
+    return same
+
+
+parser = argparse.ArgumentParser(description='Check that every dataframe backend gives the same cleaned tables')
+parser.add_argument('--scales', type=int, nargs='+', default=[1], help='multiples of the real input sizes')
+parser.add_argument('--backends', nargs='+', default=BACKENDS, help='backends to compare')
+parser.add_argument('--workdir', help='folder for the synthetic inputs (default: a new temporary folder)')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    sys.exit(0 if main(args.scales, args.backends, args.workdir) else 1)
@@ -0,0 +1,166 @@
+# Synthetic Eurostat-shaped inputs for the stage benchmarks
+# Builds a folder with the layout of VA_Dashboard-main (datasets_raw, additional_data, datasets_cleaned)
+# whose raw files are <scale> times the size of the real downloads:
+#   - SDMX-CSV: the real file is repeated <scale> times. Every copy after the first gets its own
+#     labels for one dimension that the stage carries through its calculation (e.g. sector 'OC1_S2')
+#     and values scaled by a random factor, so the copies are not filtered away while reading.
+#   - Eurostat XLSX: every sheet of the workbook is copied (the data sheets of all dimension values,
+#     not only the ones the stages read, and the summary / structure sheets). The data sheets keep
+#     their metadata rows, country rows and legend, the real years are followed by (scale - 1) times
+#     as many new years with the values of the real years scaled by a random factor.
+#   - The parliaments download is not checked in, so it is generated from scratch in the layout
+#     the stage reads (';' separated, ',' as decimal mark, quarterly periods), with random values
+#     for every country and quarter of 2005 - 2022 and of (scale - 1) times as many later years.
+# The inputs grow by new dimension values or years, never by repeating the rows of a country and year,
+# so the coverage expectations of the stages (etl/validation.py) hold at every scale.
+# The first copy is always the real data, so scale 1 reproduces the real inputs.
+#
+#   python -m benchmarks.synthetic <folder> [scale]
+
+import os
+import shutil
+import sys
+import warnings
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from etl.countries import COUNTRIES_FILE, countries
+from etl.eurostat import BASE_DIR
+from etl.excel import GEO_LABEL, HEADER_LABEL
+
+RAW_DIR = 'datasets_raw'
+
+# SDMX-CSV file -> dimension that gets new labels in every copy
+SDMX_INPUTS = {
+    'Employment and activity by sex and age - annual data_eurostat_2022.csv': 'age',
+    'Economic_sector_gender_representation_2013_2022.csv': 'isco08',
+    'Gender pay gap raw.csv': 'nace_r2',
+    'Pension gap raw.csv': 'age',
+}
+
+# Eurostat workbooks
+XLSX_INPUTS = ['violence_master.xlsx', 'eurostat_inactive_population_caring.xlsx']
+
+PARLIAMENTS_FILE = 'Members of National Parliaments by sex_EIGE.csv'
+# years of the generated parliaments download at scale 1
+PARLIAMENTS_YEARS = (2005, 2022)
+
+
+# values of the copy: numbers times a random factor, empty / non-numeric values unchanged
+def _scaled_values(values, rng):
+    numbers = pd.to_numeric(values, errors='coerce')
+    factor = rng.uniform(0.9, 1.1, len(values))
+    scaled = (numbers * factor).round(1).astype(str)
+    return values.where(numbers.isna(), scaled)
+
+
+# the copies are appended one at a time, so only one copy of the real file is held in memory
+def synthetic_sdmx_csv(source, target, dimension, scale, rng):
+    df = pd.read_csv(source, dtype=str, keep_default_na=False)
+    df.to_csv(target, index=False)
+    for copy in range(1, scale):
+        part = df.copy()
+        part[dimension] = part[dimension] + '_S' + str(copy)
+        part['OBS_VALUE'] = _scaled_values(part['OBS_VALUE'], rng)
+        part.to_csv(target, index=False, header=False, mode='a')
+
+
+def _scaled_cells(cells, rng):
+    return [round(value * rng.uniform(0.9, 1.1), 1) if isinstance(value, (int, float)) else value
+            for value in cells]
+
+
+# rows of a data sheet with (scale - 1) times as many years after the real ones
+# every year has a value column, optionally followed by a flag column (see etl/excel.py)
+# sheets without a 'TIME' row (summary, structure) are copied as they are
+def _extended_sheet(rows, scale, rng):
+    header = next((i for i, row in enumerate(rows) if row and row[0] == HEADER_LABEL), None)
+    if header is None or scale == 1:
+        return rows
+    # data block: the rows between the 'GEO (Labels)' row and the first empty row
+    start = next(i for i in range(header, len(rows)) if rows[i] and rows[i][0] == GEO_LABEL) + 1
+    end = next((i for i in range(start, len(rows)) if not rows[i] or rows[i][0] in (None, '')), len(rows))
+    columns = [i for i, year in enumerate(rows[header]) if i > 0 and year not in (None, '')]
+    width = columns[1] - columns[0] if len(columns) > 1 else 1
+    first, years = columns[0], len(columns)
+    last_year = int(rows[header][columns[-1]])
+    length = first + years * width
+
+    new_years = range(last_year + 1, last_year + 1 + (scale - 1) * years)
+    extended = [list(row) for row in rows[:start]]
+    extended[header] += [c for year in new_years for c in [str(year)] + [''] * (width - 1)]
+    extended[start - 1] += [''] * (len(new_years) * width)
+    for row in rows[start:end]:
+        row = list(row) + [''] * (length - len(row))
+        block = row[first:length]
+        extended.append(row + [c for _ in range(1, scale) for c in _scaled_cells(block, rng)])
+    extended.extend(list(row) for row in rows[end:])
+    return extended
+
+
+def synthetic_eurostat_xlsx(source, target, scale, rng):
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
+        workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    output = openpyxl.Workbook(write_only=True)
+    try:
+        for sheet in workbook.sheetnames:
+            worksheet = workbook[sheet]
+            worksheet.reset_dimensions()
+            rows = [list(row) for row in worksheet.iter_rows(values_only=True)]
+            target_sheet = output.create_sheet(sheet)
+            for row in _extended_sheet(rows, scale, rng):
+                target_sheet.append(row)
+    finally:
+        workbook.close()
+    output.save(target)
+
+
+# members of national parliaments in the columns used by 03_cleaning_members of national parliaments.py
+# one row per country, quarter, parliament group, position, sex and unit of the years 2005 - 2022,
+# every further copy adds the quarters of the next 18 years
+def synthetic_parliaments_csv(target, scale, rng):
+    years = PARLIAMENTS_YEARS[1] - PARLIAMENTS_YEARS[0] + 1
+    for copy in range(scale):
+        first = PARLIAMENTS_YEARS[0] + copy * years
+        quarters = [str(year) + '-Q' + str(q) for year in range(first, first + years) for q in range(1, 5)]
+        index = pd.MultiIndex.from_product([list(countries()['Code']), quarters, ['PARL_ALL', 'PARL_UP', 'PARL_LO'],
+                                            ['MEMB_PARL', 'PRES'], ['Women', 'Men', 'Total'],
+                                            ['Percent of total', 'Number']],
+                                           names=['_geo', 'time', '_EGROUP', '_POSITION', 'sex', 'UNIT'])
+        df = index.to_frame(index=False)
+        # the coded duplicates of the label columns, dropped by the stage
+        df['_sex'] = df['sex'].str[0]
+        df['_UNIT'] = np.where(df['UNIT'] == 'Number', 'NR', 'PC')
+        df['EGROUP'] = df['_EGROUP']
+        df['geo'] = df['_geo']
+        df['POSITION'] = df['_POSITION']
+        df['value'] = rng.uniform(5, 60, len(df)).round(1)
+        df.to_csv(target, sep=';', decimal=',', index=False, header=copy == 0, mode='w' if copy == 0 else 'a')
+
+
+# Build the synthetic folder - returns {raw file: size in bytes}
+def generate(folder, scale=1, seed=0):
+    rng = np.random.default_rng(seed)
+    raw_dir = os.path.join(folder, RAW_DIR)
+    os.makedirs(raw_dir, exist_ok=True)
+    os.makedirs(os.path.join(folder, 'additional_data'), exist_ok=True)
+    os.makedirs(os.path.join(folder, 'datasets_cleaned'), exist_ok=True)
+    shutil.copy(COUNTRIES_FILE, os.path.join(folder, 'additional_data', os.path.basename(COUNTRIES_FILE)))
+
+    for name, dimension in SDMX_INPUTS.items():
+        synthetic_sdmx_csv(os.path.join(BASE_DIR, RAW_DIR, name), os.path.join(raw_dir, name), dimension, scale, rng)
+    for name in XLSX_INPUTS:
+        synthetic_eurostat_xlsx(os.path.join(BASE_DIR, RAW_DIR, name), os.path.join(raw_dir, name), scale, rng)
+    synthetic_parliaments_csv(os.path.join(raw_dir, PARLIAMENTS_FILE), scale, rng)
+
+    return {name: os.path.getsize(os.path.join(raw_dir, name))
+            for name in sorted(os.listdir(raw_dir)) if not name.startswith('.')}
+
+
+if __name__ == '__main__':
+    sizes = generate(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+    for name, size in sizes.items():
+        print(('%.2f MB' % (size / 1e6)).rjust(10), name)
@@ -0,0 +1,3 @@
+# Shared helpers for the cleaning stages in VA_Dashboard-main
+# The numbered cleaning scripts and notebooks import from here instead of
+# copying the same loading / reshaping code into every file
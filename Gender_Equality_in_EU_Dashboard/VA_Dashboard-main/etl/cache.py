@@ -0,0 +1,82 @@
+# Columnar cache for parsed raw files
+# Parsed tables are stored as parquet in datasets_raw/.cache, named after the raw file and
+# the first 16 characters of its sha256. A changed raw file gets a new name, so an old cache
+# is never read by mistake; older versions are removed when the new one is written.
+
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import pandas as pd
+
+CACHE_DIR_NAME = '.cache'
+
+
+# sha256 of a file, read in blocks so large bulk downloads are not held in memory
+# the hash is remembered per path, size and modification time, so a stage that reads the parsed
+# table and the column profile of the same raw file hashes it only once
+def file_hash(path, block_size=1 << 20):
+    stat = os.stat(path)
+    return _file_hash(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, block_size)
+
+
+@lru_cache(maxsize=None)
+def _file_hash(path, size, mtime, block_size):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# cache file for a raw file with the given hash
+# part: optional name of a piece of the raw file that is cached separately, e.g. an Excel sheet
+# ext: file type of the cache, e.g. '.json' for the column profile (etl/profile.py)
+def cache_path(path, digest, part=None, ext='.parquet'):
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if part is not None:
+        stem = stem + '.' + part.replace('.', '_')
+    return os.path.join(folder, stem + '.' + digest[:16] + ext)
+
+
+# remove cache files of older versions of the same raw file
+def _drop_stale_cache(cache_file):
+    folder = os.path.dirname(cache_file)
+    stem = os.path.basename(cache_file).rsplit('.', 2)[0]
+    for name in os.listdir(folder):
+        other = os.path.join(folder, name)
+        if other != cache_file and name.rsplit('.', 2)[0] == stem:
+            os.remove(other)
+
+
+def write_cache(df, cache_file):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    try:
+        df.to_parquet(cache_file, index=False)
+    except ImportError:
+        # no parquet engine installed - keep working without the cache
+        return
+    _drop_stale_cache(cache_file)
+
+
+# None if there is no parquet engine to read the cache with
+def read_cache(cache_file, columns=None):
+    try:
+        return pd.read_parquet(cache_file, columns=columns)
+    except ImportError:
+        return None
+
+
+# JSON reports about a raw file (e.g. its column profile), cached like the parsed tables
+def write_json_cache(report, cache_file):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    with open(cache_file, 'w') as f:
+        json.dump(report, f, indent=1)
+    _drop_stale_cache(cache_file)
+
+
+def read_json_cache(cache_file):
+    with open(cache_file) as f:
+        return json.load(f)
@@ -0,0 +1,121 @@
+# Indicator registry and composite gender-equality index
+# Every indicator declares where its cleaned table lives, which column holds its index value,
+# the best / worst values used to scale it and the years it covers. The composite index is
+# built from the registry: all indicators are aligned on a (CountryId, Year) key in one pass into
+# a single float matrix, and the total is the geometric mean of the non-zero index values,
+# computed as the mean of their logarithms.
+# Adding an indicator only needs a new entry in INDICATORS.
+
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from etl.countries import UNKNOWN, country_ids, country_names
+from etl.eurostat import BASE_DIR
+from etl.store import has_table, read_csv_export, read_table
+
+CLEANED_DIR = os.path.join(BASE_DIR, 'datasets_cleaned')
+
+# name: short name, same as the pipeline stage that produces the table
+# file: cleaned table in datasets_cleaned
+# column: column of the index value in that table
+# value: column of the measured value the index value is scaled from (e.g. the gap)
+# output: column name in master_index_df
+# best / worst: values that are scaled to 1 and 0 - None where the stage derives it from the data
+# years: (first, last) year covered by the cleaned table
+# filters: {column: value} rows to use when the table has more dimensions than Country and Year
+Indicator = namedtuple('Indicator', ['name', 'file', 'column', 'value', 'output', 'best', 'worst', 'years', 'filters'])
+
+INDICATORS = {i.name: i for i in [
+    # worst value: average of the maximum values of the three forms of violence (see 03_cleaning_violence.ipynb)
+    Indicator('violence', 'masterviolence_pht_df.csv', 'IndexValueViolence', 'Average_no_female_victims_per_100k',
+              'IndexValueViolence',
+              0, None, (2008, 2020), {}),
+    Indicator('care', 'master_care_df.csv', 'IndexValueCare', 'care_gap_%_active_population', 'IndexValueCare',
+              0, 100, (2000, 2021), {}),
+    Indicator('sectors', 'Economic sector representation 2013-2022.csv', 'Index', 'Gap', 'IndexValueEcoSector',
+              0, 0.5, (2013, 2022), {}),
+    # broadest age group 15-64
+    Indicator('employment', 'Employment by sex and age.csv', 'IndexValueEmployment', 'Employment Gap in %',
+              'IndexValueEmployment',
+              0, 1, (2009, 2021), {'Age': 'Y15-64'}),
+    Indicator('pay', 'Gender Pay Gap 2009-2020.csv', 'Index', 'average % pay gap', 'IndexValuePay',
+              0, 100, (2009, 2020), {}),
+    Indicator('parliaments', 'Members of national parliaments.csv', 'IndexValueDecisionMakers',
+              'Female parliament members in %', 'IndexValueDecisionMakers',
+              0.50, 0, (2007, 2022), {}),
+    Indicator('pension', 'Pension gap 2012-2021.csv', 'Index', 'Difference in pension', 'IndexValuePension',
+              0, 100, (2012, 2021), {}),
+]}
+
+# years covered by every indicator - the composite index can only be calculated for these
+def common_years(indicators=None):
+    indicators = list((indicators or INDICATORS).values())
+    first = max(i.years[0] for i in indicators)
+    last = min(i.years[1] for i in indicators)
+    return first, last
+
+
+# (Country, Year, value) of one indicator, filtered to its rows of interest
+# measures: columns to return after Country and Year (default: the index value column)
+# Country holds the key of the country dimension - EU aggregates are not part of the country comparison
+# read from the parquet store (only the partitions of the requested years), or from the CSV export
+# in datasets_cleaned when the stage has not written to the store yet - both give the same values
+def load_indicator(indicator, years=None, folder=CLEANED_DIR, measures=None):
+    measures = measures or [indicator.column]
+    columns = ['Country', 'Year'] + measures + [c for c in indicator.filters if c not in measures]
+    if folder == CLEANED_DIR and has_table(indicator.name):
+        df = read_table(indicator.name, columns=columns, years=years)
+    else:
+        df = read_csv_export(os.path.join(folder, indicator.file), usecols=columns)
+    df['Country'] = country_ids(df['Country'], eu27_only=True)
+    mask = df['Country'] != UNKNOWN
+    for column, value in indicator.filters.items():
+        mask &= df[column] == value
+    if years is not None:
+        mask &= df['Year'].between(years[0], years[1])
+    return df.loc[mask, ['Country', 'Year'] + measures]
+
+
+# Align every indicator on a shared (Country, Year) key
+# returns (keys DataFrame with Country / Year sorted, float matrix of shape (rows, indicators))
+# only keys present in every indicator are kept
+def align_indicators(tables):
+    countries = pd.Index(sorted(set().union(*(t['Country'] for t in tables))))
+    years = pd.Index(sorted(set().union(*(t['Year'] for t in tables))))
+    matrix = np.full((len(countries) * len(years), len(tables)), np.nan)
+    for k, table in enumerate(tables):
+        flat = countries.get_indexer(table['Country']) * len(years) + years.get_indexer(table['Year'])
+        matrix[flat, k] = table.iloc[:, 2].to_numpy(dtype='float64')
+    present = ~np.isnan(matrix).any(axis=1)
+    codes = np.flatnonzero(present)
+    keys = pd.DataFrame({'Country': countries.take(codes // len(years)),
+                         'Year': years.take(codes % len(years))})
+    return keys, matrix[present]
+
+
+# Geometric mean of the non-zero values of every row, as the mean of the logarithms
+# Index values of 0 (or below) are missing data points and are left out, rows without any value get 0
+def geometric_mean(matrix):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.where(matrix > 0, np.log(np.where(matrix > 0, matrix, 1.0)), np.nan)
+        count = (~np.isnan(logs)).sum(axis=1)
+        total = np.exp(np.nansum(logs, axis=1) / count)
+    return np.where(count > 0, total, 0.0)
+
+
+# Build master_index_df: Country, Year, one column per indicator and IndexTotal
+# years: defaults to the years covered by every indicator
+def build_master_index(indicators=None, years=None, folder=CLEANED_DIR):
+    indicators = indicators or INDICATORS
+    years = years or common_years(indicators)
+    tables = [load_indicator(i, years, folder) for i in indicators.values()]
+    keys, matrix = align_indicators(tables)
+    master_index_df = keys
+    master_index_df['Country'] = country_names(keys['Country'])
+    for k, indicator in enumerate(indicators.values()):
+        master_index_df[indicator.output] = matrix[:, k]
+    master_index_df['IndexTotal'] = geometric_mean(matrix)
+    return master_index_df
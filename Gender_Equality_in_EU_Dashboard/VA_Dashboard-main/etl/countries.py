@@ -0,0 +1,89 @@
+# Country dimension shared by every stage
+# additional_data/countries.csv holds one row per country: a small integer key (CountryId), the
+# Eurostat geo code, the display name used in datasets_cleaned, EU27 membership and the other
+# spellings found in the raw files (e.g. 'Czechia', 'Germany (until 1990 former territory of the FRG)').
+# Stages turn codes / names into the integer key right after reading, run their filters, joins and
+# group-bys on it and only add the display names when the table is exported.
+# The keys are numbered in alphabetical order of the display names, so sorting by key gives the
+# same country order as sorting by name. The rows of the file are in the EU protocol order.
+
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from etl.eurostat import BASE_DIR
+
+COUNTRIES_FILE = os.path.join(BASE_DIR, 'additional_data', 'countries.csv')
+
+# key of values that are not in the dimension (non-EU countries, other aggregates)
+UNKNOWN = -1
+
+
+# the dimension table, indexed by CountryId (rows in protocol order)
+@lru_cache(maxsize=None)
+def countries(path=COUNTRIES_FILE):
+    df = pd.read_csv(path, dtype={'CountryId': 'int8', 'EU27': 'bool'}, keep_default_na=False)
+    return df.set_index('CountryId')
+
+
+# CountryId of the EU27 member states, in protocol order
+def eu27_ids():
+    dim = countries()
+    return dim.index[dim['EU27']].to_numpy()
+
+
+# Eurostat geo codes of the EU27 member states (e.g. as a filter for stream_sdmx_csv)
+# aggregate: include the code of the EU27 aggregate
+def eu27_codes(aggregate=False):
+    dim = countries()
+    return list(dim.loc[dim['EU27'] | aggregate, 'Code'])
+
+
+# {code / name / alias: CountryId}
+@lru_cache(maxsize=None)
+def _lookup():
+    dim = countries()
+    lookup = {}
+    for country_id, row in dim.iterrows():
+        for value in [row['Code'], row['Country']] + [a for a in row['Aliases'].split('|') if a]:
+            lookup[value] = country_id
+    return lookup
+
+
+# CountryId of a single Eurostat code, name or alias - UNKNOWN if it is not in the dimension
+def country_id(value):
+    return _lookup().get(str(value).strip(), UNKNOWN)
+
+
+# Integer key of a column of Eurostat codes, names or aliases - int8, UNKNOWN for values outside the dimension
+# eu27_only: the EU aggregate gets UNKNOWN as well
+# For categorical columns only the categories are looked up, not every row
+def country_ids(values, eu27_only=False):
+    values = pd.Series(values)
+    lookup = _lookup()
+    if eu27_only:
+        members = set(eu27_ids())
+        lookup = {k: v for k, v in lookup.items() if v in members}
+    if values.dtype.name == 'category':
+        categories = values.cat.categories.astype(str).str.strip()
+        keys = np.array([lookup.get(c, UNKNOWN) for c in categories] + [UNKNOWN], dtype='int8')
+        ids = keys[values.cat.codes.to_numpy()]
+    else:
+        ids = np.array([lookup.get(str(v).strip(), UNKNOWN) for v in values], dtype='int8')
+    return pd.Series(ids, index=values.index)
+
+
+# Display names of a column of CountryIds (for the export)
+def country_names(ids):
+    ids = pd.Series(ids)
+    names = countries()['Country']
+    return pd.Series(names.reindex(ids.to_numpy()).to_numpy(), index=ids.index, dtype='object')
+
+
+# Keep the rows of the EU27 member states, in the protocol order of the dimension table
+# (the row order of the old merge with the EU27 country list)
+def eu27_rows(df, column='Country'):
+    order = pd.DataFrame({column: eu27_ids()})
+    return order.merge(df, on=column, how='inner')
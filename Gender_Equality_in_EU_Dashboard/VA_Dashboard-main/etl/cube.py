@@ -0,0 +1,119 @@
+# Dense labelled cube for the Country x Year x Sector/Sex calculations
+# The sector, pay and pension stages used to go long -> pivot_table -> add sum/count columns ->
+# droplevel -> pivot_table -> fillna(0) -> stack, copying the whole table at every step.
+# A Cube holds one float64 NumPy array plus the sorted labels of every dimension, so the same
+# steps become reductions over an axis and the long format is only built once for the export.
+
+import numpy as np
+import pandas as pd
+
+
+class Cube:
+
+    def __init__(self, dims, labels, values):
+        self.dims = list(dims)
+        self.labels = [pd.Index(l) for l in labels]
+        self.values = np.asarray(values, dtype='float64')
+        if self.values.shape != tuple(len(l) for l in self.labels):
+            raise ValueError('values of shape ' + str(self.values.shape) + ' do not match the labels')
+
+    # Build a cube from a long DataFrame - one axis per dimension column, labels sorted like pivot_table
+    # Rows with a missing label are ignored, duplicated cells are averaged (NaN values are skipped)
+    @classmethod
+    def from_frame(cls, df, dims, value):
+        codes, labels = [], []
+        for dim in dims:
+            dim_codes, dim_labels = pd.factorize(df[dim], sort=True)
+            codes.append(dim_codes)
+            labels.append(dim_labels)
+        shape = tuple(len(l) for l in labels)
+
+        valid = np.ones(len(df), dtype=bool)
+        for dim_codes in codes:
+            valid &= dim_codes >= 0
+        data = df[value].to_numpy(dtype='float64')
+        valid &= ~np.isnan(data)
+        flat = np.ravel_multi_index([c[valid] for c in codes], shape) if len(shape) else np.zeros(0, int)
+
+        size = int(np.prod(shape))
+        sums = np.bincount(flat, weights=data[valid], minlength=size)
+        counts = np.bincount(flat, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+        return cls(dims, labels, values.reshape(shape))
+
+    def axis(self, dim):
+        return self.dims.index(dim)
+
+    # same labels, new values (e.g. the result of an element-wise calculation)
+    def with_values(self, values):
+        return Cube(self.dims, self.labels, values)
+
+    # slice out one label of a dimension, e.g. cube.sel('sex', 'F')
+    def sel(self, dim, label):
+        axis = self.axis(dim)
+        position = self.labels[axis].get_loc(label)
+        return Cube(self.dims[:axis] + self.dims[axis + 1:],
+                    self.labels[:axis] + self.labels[axis + 1:],
+                    np.take(self.values, position, axis=axis))
+
+    # keep only the given labels of a dimension (in their current order)
+    def isel(self, dim, mask):
+        axis = self.axis(dim)
+        mask = np.asarray(mask, dtype=bool)
+        labels = list(self.labels)
+        labels[axis] = labels[axis][mask]
+        return Cube(self.dims, labels, np.compress(mask, self.values, axis=axis))
+
+    def drop(self, dim, labels):
+        return self.isel(dim, ~self.labels[self.axis(dim)].isin(labels))
+
+    # Mean over one dimension ignoring NaN, NaN where there is no value at all
+    # The reduced dimension is summed as the contiguous last axis, which gives the same
+    # summation order and rounding as DataFrame.sum(axis=1) on the pivoted table
+    def nanmean(self, dim):
+        axis = self.axis(dim)
+        rows = np.moveaxis(self.values, axis, -1)
+        present = ~np.isnan(rows)
+        total = np.ascontiguousarray(np.where(present, rows, 0.0)).sum(axis=-1)
+        count = present.sum(axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+        return Cube(self.dims[:axis] + self.dims[axis + 1:],
+                    self.labels[:axis] + self.labels[axis + 1:], mean)
+
+    # Drop labels that only have NaN values, for every dimension (like pivot_table(dropna=True))
+    def dropna(self, dims=None):
+        cube = self
+        for dim in dims or self.dims:
+            axis = cube.axis(dim)
+            other = tuple(a for a in range(cube.values.ndim) if a != axis)
+            cube = cube.isel(dim, ~np.isnan(cube.values).all(axis=other))
+        return cube
+
+    def fillna(self, value):
+        return self.with_values(np.where(np.isnan(self.values), value, self.values))
+
+    # reorder the dimensions, e.g. cube.transpose(['Country', 'Year'])
+    def transpose(self, dims):
+        axes = [self.axis(d) for d in dims]
+        return Cube(dims, [self.labels[a] for a in axes], np.transpose(self.values, axes))
+
+
+# Export cubes with the same dimensions to one long DataFrame (one column per cube)
+# Rows are ordered like the labels (first dimension slowest), i.e. like DataFrame.stack()
+# mask: optional boolean array (broadcast to the cube shape) of the cells to export
+def to_long_frame(cubes, mask=None):
+    first = next(iter(cubes.values()))
+    shape = first.values.shape
+    grid = np.indices(shape).reshape(len(shape), -1)
+    keep = np.ones(grid.shape[1], dtype=bool) if mask is None else np.broadcast_to(mask, shape).ravel()
+
+    columns = {}
+    for dim, labels, codes in zip(first.dims, first.labels, grid):
+        columns[dim] = labels.take(codes[keep])
+    for name, cube in cubes.items():
+        if cube.dims != first.dims or cube.values.shape != shape:
+            raise ValueError('cube ' + name + ' does not have the same dimensions')
+        columns[name] = cube.values.ravel()[keep]
+    return pd.DataFrame(columns)
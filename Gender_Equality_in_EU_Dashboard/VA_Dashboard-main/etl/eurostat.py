@@ -0,0 +1,153 @@
+# Loader for the Eurostat SDMX-CSV downloads in datasets_raw
+# Every SDMX-CSV file has the same layout:
+#   DATAFLOW, LAST UPDATE, freq, <dimensions...>, TIME_PERIOD, OBS_VALUE, OBS_FLAG
+# DATAFLOW, LAST UPDATE and freq hold the same string on every row, so we never load them.
+# The remaining columns are parsed once with compact dtypes and kept in a columnar
+# cache next to the raw file, which is reused until the raw file changes.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from etl.cache import cache_path, file_hash, read_cache, write_cache
+from etl.periods import parse_periods
+
+# Columns with one constant value per download - dropped by every cleaning stage
+SDMX_CONSTANT_COLUMNS = ['DATAFLOW', 'LAST UPDATE', 'freq']
+# Columns that are not dimensions of the dataflow
+SDMX_MEASURE_COLUMNS = ['TIME_PERIOD', 'OBS_VALUE', 'OBS_FLAG']
+
+# the VA_Dashboard-main folder - VA_DASHBOARD_DIR points the loaders, the country dimension and the
+# store at another folder with the same layout (e.g. the synthetic inputs of the benchmarks)
+BASE_DIR = os.environ.get('VA_DASHBOARD_DIR') or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# column names from the header line of an SDMX-CSV file
+def sdmx_columns(path):
+    with open(path, encoding='utf-8-sig') as f:
+        return f.readline().rstrip('\r\n').split(',')
+
+
+# dimension columns of the file, e.g. ['unit', 'sex', 'age', 'isco08', 'worktime', 'geo']
+def sdmx_dimensions(path):
+    return [c for c in sdmx_columns(path) if c not in SDMX_CONSTANT_COLUMNS + SDMX_MEASURE_COLUMNS]
+
+
+# dtypes used while parsing: every dimension and the flag as category, values as float64
+# TIME_PERIOD is read as category and turned into int16 afterwards for annual data
+def _parse_dtypes(columns):
+    dtypes = {}
+    for c in columns:
+        dtypes[c] = 'float64' if c == 'OBS_VALUE' else 'category'
+    return dtypes
+
+
+# annual periods ('2013') become int16 years, quarterly/monthly ('2013-Q2') stay categorical
+def _compact_time_period(df):
+    if 'TIME_PERIOD' not in df.columns:
+        return df
+    categories = df['TIME_PERIOD'].cat.categories
+    if len(categories) and categories.astype(str).str.fullmatch(r'\d{4}').all():
+        df['TIME_PERIOD'] = df['TIME_PERIOD'].astype(str).astype('int16')
+    return df
+
+
+# Read an SDMX-CSV file without the constant columns
+# columns: subset of columns to return (default: every dimension, TIME_PERIOD, OBS_VALUE and OBS_FLAG)
+# value_dtype: dtype of OBS_VALUE - float32 halves the memory, but stages that publish
+#              values to datasets_cleaned should keep float64 so the CSVs do not change
+# cache: reuse / write the parquet cache in datasets_raw/.cache
+def read_sdmx_csv(path, columns=None, value_dtype='float32', cache=True):
+    header = sdmx_columns(path)
+    stored = [c for c in header if c not in SDMX_CONSTANT_COLUMNS]
+    if columns is None:
+        columns = stored
+    missing = [c for c in columns if c not in stored]
+    if missing:
+        raise KeyError('Columns not in ' + os.path.basename(path) + ': ' + str(missing))
+
+    df = None
+    if cache:
+        cache_file = cache_path(path, file_hash(path))
+        if os.path.exists(cache_file):
+            df = read_cache(cache_file, columns)
+
+    if df is None:
+        # the cache always holds every non-constant column, so other stages can project from it
+        parse = stored if cache else columns
+        df = pd.read_csv(path, usecols=parse, dtype=_parse_dtypes(parse))
+        df = _compact_time_period(df)
+        if cache:
+            write_cache(df, cache_file)
+        df = df[columns]
+
+    if 'OBS_VALUE' in df.columns and df['OBS_VALUE'].dtype != value_dtype:
+        df['OBS_VALUE'] = df['OBS_VALUE'].astype(value_dtype)
+    return df
+
+
+# boolean mask of the rows of one chunk that pass every filter
+# the checks run on the categories of each column, so every distinct code is tested only once
+def _chunk_mask(chunk, filters, years, quarters):
+    mask = np.ones(len(chunk), dtype=bool)
+    for column, allowed in filters.items():
+        if isinstance(allowed, str):
+            allowed = [allowed]
+        mask &= chunk[column].isin(allowed).to_numpy()
+    if years is not None or quarters is not None:
+        periods = parse_periods(chunk['TIME_PERIOD'].cat.categories)
+        keep = np.ones(len(periods.year), dtype=bool)
+        if years is not None:
+            first, last = years
+            if first is not None:
+                keep &= periods.year >= first
+            if last is not None:
+                keep &= periods.year <= last
+        if quarters is not None:
+            keep &= (periods.per_year == 4) & np.isin(periods.sub, [int(q.lstrip('Q')) for q in quarters])
+        codes = chunk['TIME_PERIOD'].cat.codes.to_numpy()
+        mask &= (codes >= 0) & np.append(keep, False)[codes]
+    return mask
+
+
+# Stream an SDMX-CSV file in chunks and keep only the rows that pass the filters,
+# so peak memory depends on the size of the filtered result and not on the raw file
+# filters: {dimension: value or list of values}, e.g. {'indic_em': 'EMP_LFS', 'geo': eu27_codes()} (see etl/countries.py)
+# years: (first, last) inclusive, either side can be None
+# quarters: list of quarters to keep for quarterly data, e.g. ['Q2']
+# columns / value_dtype: as in read_sdmx_csv
+def stream_sdmx_csv(path, filters=None, years=None, quarters=None, columns=None,
+                    value_dtype='float32', chunksize=500000):
+    filters = filters or {}
+    stored = [c for c in sdmx_columns(path) if c not in SDMX_CONSTANT_COLUMNS]
+    if columns is None:
+        columns = stored
+    needed = list(columns) + [c for c in filters if c not in columns]
+    if (years is not None or quarters is not None) and 'TIME_PERIOD' not in needed:
+        needed.append('TIME_PERIOD')
+    missing = [c for c in needed if c not in stored]
+    if missing:
+        raise KeyError('Columns not in ' + os.path.basename(path) + ': ' + str(missing))
+
+    # keep the header order of the file
+    needed = [c for c in stored if c in needed]
+    parts = []
+    reader = pd.read_csv(path, usecols=needed, dtype=_parse_dtypes(needed), chunksize=chunksize)
+    for chunk in reader:
+        chunk = chunk[_chunk_mask(chunk, filters, years, quarters)]
+        if len(chunk):
+            parts.append(chunk[columns])
+
+    if not parts:
+        df = pd.DataFrame({c: pd.Series(dtype=_parse_dtypes([c])[c]) for c in columns})
+    else:
+        df = pd.concat(parts, ignore_index=True)
+        # categories differ between chunks, so concat falls back to object columns
+        for c in columns:
+            if c != 'OBS_VALUE' and df[c].dtype != 'category':
+                df[c] = df[c].astype('category')
+    df = _compact_time_period(df)
+    if 'OBS_VALUE' in df.columns:
+        df['OBS_VALUE'] = df['OBS_VALUE'].astype(value_dtype)
+    return df
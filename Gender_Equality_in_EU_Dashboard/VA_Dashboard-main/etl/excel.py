@@ -0,0 +1,89 @@
+# Extractor for the Eurostat XLSX downloads in datasets_raw
+# Every data sheet of a Eurostat workbook has the same layout:
+#   a block of metadata rows, a 'TIME' row with the years, a 'GEO (Labels)' row,
+#   one row per country (value column per year, optionally followed by a flag column),
+#   an empty row and the legend of special values.
+# Missing values are stored as ':'. The workbook is opened once in read-only mode for
+# all requested sheets, and every tidy sheet is cached as parquet next to the workbook.
+
+import os
+import warnings
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from etl.cache import cache_path, file_hash, read_cache, write_cache
+
+NULL_MARKER = ':'
+HEADER_LABEL = 'TIME'
+GEO_LABEL = 'GEO (Labels)'
+
+
+# Turn the rows of one sheet into a tidy DataFrame with the columns Country, Year, Value, Flag
+# Country keeps the label of the sheet, Value is NaN where Eurostat reports ':'
+def _tidy_sheet(rows, sheet_name):
+    header = None
+    countries, years, values, flags = [], [], [], []
+    for row in rows:
+        first = row[0] if len(row) else None
+        if header is None:
+            if first == HEADER_LABEL:
+                # columns with a year are value columns, an empty header is the flag of the column before
+                header = [(i, int(year)) for i, year in enumerate(row) if i > 0 and year not in (None, '')]
+                value_columns = {i for i, _ in header}
+            continue
+        if first == GEO_LABEL:
+            continue
+        if first is None or first == '':
+            # end of the data block - the legend follows
+            break
+        for i, year in header:
+            value = row[i] if i < len(row) else None
+            flag = row[i + 1] if i + 1 < len(row) and i + 1 not in value_columns else None
+            countries.append(first)
+            years.append(year)
+            values.append(np.nan if value in (None, '', NULL_MARKER) else value)
+            flags.append(None if flag in (None, '') else flag)
+    if header is None:
+        raise ValueError('No ' + HEADER_LABEL + ' row found in ' + sheet_name)
+    return pd.DataFrame({'Country': pd.Series(countries, dtype='object'),
+                         'Year': pd.Series(years, dtype='int16'),
+                         'Value': pd.Series(values, dtype='float64'),
+                         'Flag': pd.Series(flags, dtype='object').astype(pd.CategoricalDtype(sorted(set(flags) - {None})))})
+
+
+# Read several sheets of a Eurostat workbook in one pass
+# returns {sheet name: tidy DataFrame (Country, Year, Value, Flag)}
+# cache: reuse / write the parquet cache in datasets_raw/.cache, one file per sheet
+def read_eurostat_sheets(path, sheets, cache=True):
+    result = {}
+    digest = file_hash(path) if cache else None
+    todo = []
+    for sheet in sheets:
+        cache_file = cache_path(path, digest, sheet) if cache else None
+        if cache and os.path.exists(cache_file):
+            cached = read_cache(cache_file)
+            if cached is not None:
+                cached['Flag'] = cached['Flag'].astype('category')
+                result[sheet] = cached
+                continue
+        todo.append(sheet)
+
+    if todo:
+        with warnings.catch_warnings():
+            # Eurostat workbooks have no default style
+            warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
+            workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            for sheet in todo:
+                worksheet = workbook[sheet]
+                # the stored sheet dimensions are wrong in some downloads
+                worksheet.reset_dimensions()
+                df = _tidy_sheet(worksheet.iter_rows(values_only=True), sheet)
+                if cache:
+                    write_cache(df, cache_path(path, digest, sheet))
+                result[sheet] = df
+        finally:
+            workbook.close()
+    return {sheet: result[sheet] for sheet in sheets}
@@ -0,0 +1,212 @@
+# Dataframe backends for the calculations of the cleaning stages
+# A stage writes its calculation once against the small frame API below (filter, with_columns, select,
+# rename, join, with_row_number, collect) with column expressions built from col(...), e.g.
+#   fem = frame(df).filter(col('Sex') == 'F').with_columns({'Gap': (col('M') - col('F')).round(2)})
+#   fem_df = fem.collect()
+# and the backend of the run executes it:
+#   pandas (default): every call runs eagerly on a DataFrame, like the stages were written before
+#   polars:           the calls only build a lazy query; collect() optimizes the whole chain
+#                     (filters pushed down, the shared scan reused by both sides of a join) and runs it
+#                     multithreaded. Needs the optional polars package.
+# The backend is picked per run with VA_BACKEND=pandas|polars, or per frame with frame(df, backend).
+# collect() always returns a pandas DataFrame, so the export code does not change.
+# Rounding and division by a number follow numpy on both backends (x * 10^d, round half to even, / 10^d),
+# so both give the same bits.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+BACKENDS = ['pandas', 'polars']
+
+
+def default_backend():
+    return os.environ.get('VA_BACKEND') or 'pandas'
+
+
+# Column expression with an implementation for each backend
+# pandas: function DataFrame -> Series (or scalar), polars: function () -> polars expression
+class Expr:
+
+    def __init__(self, pandas, polars):
+        self.pandas = pandas
+        self.polars = polars
+
+    def _binary(self, other, operator):
+        other = _as_expr(other)
+        return Expr(lambda df: operator(self.pandas(df), other.pandas(df)),
+                    lambda: operator(self.polars(), other.polars()))
+
+    def __add__(self, other):
+        return self._binary(other, lambda a, b: a + b)
+
+    def __sub__(self, other):
+        return self._binary(other, lambda a, b: a - b)
+
+    def __rsub__(self, other):
+        return _as_expr(other)._binary(self, lambda a, b: a - b)
+
+    def __mul__(self, other):
+        return self._binary(other, lambda a, b: a * b)
+
+    def __truediv__(self, other):
+        if isinstance(other, Expr):
+            return self._binary(other, lambda a, b: a / b)
+        # polars divides by a scalar with the reciprocal (x * (1 / d)), which is off by one bit for
+        # e.g. 28.5 / 100 - the division runs on numpy instead, as in pandas
+        return Expr(lambda df: self.pandas(df) / other, lambda: _divide(self.polars(), other))
+
+    def __eq__(self, other):
+        return self._binary(other, lambda a, b: a == b)
+
+    def __ne__(self, other):
+        return self._binary(other, lambda a, b: a != b)
+
+    def __lt__(self, other):
+        return self._binary(other, lambda a, b: a < b)
+
+    def __ge__(self, other):
+        return self._binary(other, lambda a, b: a >= b)
+
+    def __and__(self, other):
+        return self._binary(other, lambda a, b: a & b)
+
+    def round(self, decimals):
+        factor = 10.0 ** decimals
+        return Expr(lambda df: self.pandas(df).round(decimals),
+                    lambda: _divide((self.polars() * factor).round(0, mode='half_to_even'), factor))
+
+    # dtype: numpy dtype name, e.g. 'int64'
+    def cast(self, dtype):
+        return Expr(lambda df: self.pandas(df).astype(dtype),
+                    lambda: self.polars().cast(_polars_dtype(dtype)))
+
+    def isin(self, values):
+        values = list(values)
+        return Expr(lambda df: self.pandas(df).isin(values),
+                    lambda: self.polars().is_in(values))
+
+    # this value where condition holds, otherwise other
+    def where(self, condition, other):
+        condition, other = _as_expr(condition), _as_expr(other)
+        return Expr(lambda df: pd.Series(self.pandas(df)).where(condition.pandas(df), other.pandas(df)),
+                    lambda: _polars().when(condition.polars()).then(self.polars()).otherwise(other.polars()))
+
+
+# polars expression divided by a number, on numpy
+def _divide(expression, divisor):
+    pl = _polars()
+    return expression.map_batches(lambda s: pl.Series(s.name, s.to_numpy() / divisor, nan_to_null=True),
+                                  return_dtype=pl.Float64, is_elementwise=True)
+
+
+def _as_expr(value):
+    if isinstance(value, Expr):
+        return value
+    return Expr(lambda df: value, lambda: _polars().lit(value))
+
+
+def col(name):
+    return Expr(lambda df: df[name], lambda: _polars().col(name))
+
+
+def _polars():
+    import polars
+    return polars
+
+
+def _polars_dtype(dtype):
+    pl = _polars()
+    return {'int8': pl.Int8, 'int16': pl.Int16, 'int32': pl.Int32, 'int64': pl.Int64,
+            'float64': pl.Float64}[str(dtype)]
+
+
+# Eager frame on a pandas DataFrame - every call returns a new frame
+class PandasFrame:
+
+    backend = 'pandas'
+
+    def __init__(self, df):
+        self.df = df
+
+    def filter(self, condition):
+        return PandasFrame(self.df[condition.pandas(self.df).to_numpy()].reset_index(drop=True))
+
+    # columns: {name: expression}, evaluated on the frame before the call
+    def with_columns(self, columns):
+        df = self.df.copy(deep=False)
+        for name, expression in columns.items():
+            df[name] = expression.pandas(self.df)
+        return PandasFrame(df)
+
+    def select(self, columns):
+        return PandasFrame(self.df[list(columns)])
+
+    def rename(self, columns):
+        return PandasFrame(self.df.rename(columns=columns))
+
+    # left join keeps the rows of this frame in their order
+    def join(self, other, on, how='left'):
+        return PandasFrame(self.df.merge(other.df, on=on, how=how, sort=False))
+
+    # number of the row (0, 1, ...) in a new column, e.g. to keep it as the index of the export
+    def with_row_number(self, name):
+        df = self.df.copy(deep=False)
+        df.insert(0, name, np.arange(len(df), dtype='int64'))
+        return PandasFrame(df)
+
+    def collect(self):
+        return self.df
+
+
+# Lazy polars query - nothing runs before collect()
+class PolarsFrame:
+
+    backend = 'polars'
+
+    def __init__(self, query):
+        self.query = query
+
+    def filter(self, condition):
+        return PolarsFrame(self.query.filter(condition.polars()))
+
+    def with_columns(self, columns):
+        return PolarsFrame(self.query.with_columns([e.polars().alias(n) for n, e in columns.items()]))
+
+    def select(self, columns):
+        return PolarsFrame(self.query.select(list(columns)))
+
+    def rename(self, columns):
+        return PolarsFrame(self.query.rename(columns))
+
+    def join(self, other, on, how='left'):
+        return PolarsFrame(self.query.join(other.query, on=on, how=how, maintain_order='left'))
+
+    # polars numbers the rows as unsigned integers, cast like the int64 of the pandas frame
+    def with_row_number(self, name):
+        return PolarsFrame(self.query.with_row_index(name).with_columns(_polars().col(name).cast(_polars().Int64)))
+
+    def collect(self):
+        df = self.query.collect().to_pandas()
+        # categorical columns come back with the categories of the polars string cache
+        for column in df.columns:
+            if df[column].dtype.name == 'category':
+                df[column] = df[column].cat.remove_unused_categories()
+        return df
+
+
+# Frame of the chosen backend on a pandas DataFrame
+# without the polars package the calculation runs on pandas
+def frame(df, backend=None):
+    backend = backend or default_backend()
+    if backend not in BACKENDS:
+        raise KeyError('Unknown backend ' + backend + ', choose one of ' + str(BACKENDS))
+    if backend == 'polars':
+        try:
+            pl = _polars()
+        except ImportError:
+            print('polars is not installed - running on pandas')
+            return PandasFrame(df)
+        return PolarsFrame(pl.from_pandas(df).lazy())
+    return PandasFrame(df)
@@ -0,0 +1,86 @@
+# Gap and index calculations shared by all indicator stages
+# All functions work on whole columns (NumPy arrays or pandas Series) at once instead of
+# looping over the rows with iterrows() and writing single cells with .loc
+
+import numpy as np
+import pandas as pd
+
+from etl.frames import Expr, col, frame
+
+
+# same type as the input: a Series keeps its index, everything else becomes an array
+def _like(template, values):
+    if isinstance(template, pd.Series):
+        return pd.Series(values, index=template.index)
+    return values
+
+
+# Gap between two columns (a - b)
+# zero_as_missing: 0 / NaN on either side means there is no data point, so the gap is set to 0
+#                  (the conservative rule of the care and violence notebooks)
+def gap(a, b, zero_as_missing=True):
+    if isinstance(a, pd.Series) and isinstance(b, pd.Series):
+        # rows are matched by index like a.loc[i] - b.loc[i]
+        b = b.reindex(a.index)
+    a_values = np.asarray(a, dtype='float64')
+    b_values = np.asarray(b, dtype='float64')
+    result = a_values - b_values
+    if zero_as_missing:
+        missing = (a_values == 0) | (b_values == 0) | np.isnan(a_values) | np.isnan(b_values)
+        result = np.where(missing, 0.0, result)
+    return _like(a, result)
+
+
+# Index value scaled between the worst (0) and the best (1) possible value:
+#   (Actual value - worst value)/(Best value - worst value)
+# inspired by https://ourworldindata.org/human-development-index
+# zero_as_missing: actual values of 0 are missing data points and get the index 0
+# actual can also be a column expression of etl/frames.py, the result is an expression then
+def index_value(actual, best, worst, zero_as_missing=False):
+    if isinstance(actual, Expr):
+        result = (actual - worst) / (best - worst)
+        return result.where(actual != 0, 0.0) if zero_as_missing else result
+    values = np.asarray(actual, dtype='float64')
+    result = (values - worst) / (best - worst)
+    if zero_as_missing:
+        result = np.where(values != 0, result, 0.0)
+    return _like(actual, result)
+
+
+# Employment gap of stage 02 on the frame API (etl/frames.py), run by the backend of the run or the given one
+# df: cleaned rows with Country, Year, Sex, Age, unit (PC_POP / THS_PER) and 'Total Employment in %'
+# Returns one row per country, year and age with the gap of the percentages (M - F), the employed persons in
+# thousands and the index; the index of the table numbers the rows like the CSV export
+def employment_gap(df, best, worst, countries, backend=None):
+    # Create one frame with percentage values and another frame with total values --> totals
+    base = frame(df, backend)
+    percent = base.filter(col('unit') == 'PC_POP').with_columns(
+        {'Total Employment in %': (col('Total Employment in %') / 100).round(2)})
+    totals = base.filter(col('unit') == 'THS_PER')
+
+    # Split datasets into the Genders, joined on Country, Year and Age to perform mathematical operations
+    keys = ['Country', 'Year', 'Age']
+    fem = percent.filter(col('Sex') == 'F').select(keys + ['Total Employment in %']).rename(
+        {'Total Employment in %': 'F'})
+    mal = percent.filter(col('Sex') == 'M').select(keys + ['Total Employment in %']).rename(
+        {'Total Employment in %': 'M'})
+    tot = totals.filter(col('Sex') == 'T').select(keys + ['Total Employment in %']).rename(
+        {'Total Employment in %': 'Employed Persons in Thousands'})
+    gaps = fem.join(mal, on=keys).join(tot, on=keys)
+
+    # Calculate the employment gap between man and woman
+    # and the total number of employed persons for each row
+    gaps = gaps.with_columns({'Employment Gap in %': (col('M') - col('F')).round(2),
+                              'Employed Persons in Thousands': col('Employed Persons in Thousands').cast('int64')})
+
+    # The number of the row is the index of the CSV export
+    gaps = gaps.with_row_number('row')
+    gaps = gaps.with_columns({'IndexValueEmployment': index_value(col('Employment Gap in %'), best, worst)})
+
+    # Drop European Union Stats
+    gaps = gaps.filter(col('Country').isin(countries))
+
+    # The polars query runs here - the calls above only recorded it
+    result = gaps.select(['row'] + keys + ['Employment Gap in %', 'Employed Persons in Thousands',
+                                           'IndexValueEmployment']).collect()
+    return result.set_index('row').rename_axis(None)
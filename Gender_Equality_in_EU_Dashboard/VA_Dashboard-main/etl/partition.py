@@ -0,0 +1,70 @@
+# Per-country partitions of a stage, processed in a process pool
+# A calculation that is independent per country (e.g. the sector drill-down of stage 05) is split into
+# one task per country. The workers do not get the data pickled: they all read their rows from the same
+# read-only parquet cache of the raw file (datasets_raw/.cache, see etl/eurostat.py), memory-mapped and
+# filtered to their country. The partial results are merged in the order of the country dimension
+# (alphabetical by name), independent of which worker finished first, so every run gives the same table.
+#
+#   cache_file = shared_table('./datasets_raw/...csv')
+#   df = map_countries(calculate, cache_file, codes, years)
+# with calculate(cache_file, code, years) -> DataFrame, a module level function (picklable).
+# The number of worker processes is VA_JOBS (default: the number of cores), VA_JOBS=1 runs in process.
+# The workers report their RSS at the end of every task to the step telemetry of the stage.
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from etl import telemetry
+from etl.cache import cache_path, file_hash
+from etl.countries import country_ids
+from etl.eurostat import read_sdmx_csv
+
+
+def default_jobs():
+    return int(os.environ.get('VA_JOBS') or os.cpu_count() or 1)
+
+
+# Parquet cache of an SDMX-CSV file that the workers share - parsed once if it does not exist yet
+def shared_table(path):
+    cache_file = cache_path(path, file_hash(path))
+    if not os.path.exists(cache_file):
+        read_sdmx_csv(path, columns=['geo'])
+    if not os.path.exists(cache_file):
+        raise ImportError('The workers read the parquet cache of ' + os.path.basename(path)
+                          + ', which needs a parquet engine (pyarrow)')
+    return cache_file
+
+
+# Rows of one country from the shared cache
+def read_partition(cache_file, code, columns=None):
+    return pd.read_parquet(cache_file, columns=columns, filters=[('geo', '==', code)], memory_map=True)
+
+
+# executed in a worker process: the result of the task and the RSS of the worker after it
+def _task(function, cache_file, code, years):
+    return function(cache_file, code, years), telemetry.current_rss()
+
+
+# Run function(cache_file, code, years) for every geo code and concatenate the results
+# in the order of the country dimension
+# years: {geo code: list of years} to recompute per country (None: every year)
+def map_countries(function, cache_file, codes, years=None, jobs=None):
+    codes = list(codes)
+    years = years or {}
+    jobs = min(jobs or default_jobs(), len(codes)) or 1
+    if jobs == 1:
+        parts = [function(cache_file, code, years.get(code)) for code in codes]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(_task, function, cache_file, code, years.get(code)) for code in codes]
+            parts, rss = zip(*[future.result() for future in futures])
+        telemetry.workers_rss(rss)
+        parts = list(parts)
+    order = np.argsort(country_ids(codes).to_numpy(), kind='stable')
+    parts = [parts[i] for i in order if parts[i] is not None and len(parts[i])]
+    if not parts:
+        return None
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,126 @@
+# Eurostat time periods and their annual aggregation
+# The downloads publish annual ('2013'), half-yearly ('2013-S1'), quarterly ('2013-Q2') and monthly
+# ('2013-M05', '2013-05') periods, and the EIGE file quarters like '2013-Q1'. parse_periods() parses the
+# codes into integer arrays once: every distinct code is parsed a single time and the rows take their
+# values through the factorized codes, so there is no string operation per row.
+#
+#   periods = parse_periods(df['TIME_PERIOD'])
+#   periods.year        int16 year of every row
+#   periods.sub         int8 number of the quarter / month / half year in the year (0 for annual periods)
+#   periods.per_year    int8 number of periods per year (1, 2, 4 or 12)
+#
+# annual() turns sub-annual values into annual figures, with one group-by for all series:
+#   'single':   the value of one sub-period, e.g. sub=2 for Q2 (the snapshot the stages used so far)
+#   'mean':     mean of the available sub-periods
+#   'last':     value of the latest available sub-period of the year
+#   'weighted': coverage-weighted mean - every sub-period counts with the number of days it covers
+# Every annual row also gets the coverage of its year: the share of the sub-periods with a value.
+
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+Periods = namedtuple('Periods', ['year', 'sub', 'per_year'])
+
+METHODS = ['single', 'mean', 'last', 'weighted']
+
+# 2013 | 2013-Q2 | 2013Q2 | 2013-M05 | 2013-S1 | 2013-H1 | 2013-05
+_PERIOD = re.compile(r'^\s*(\d{4})(?:-?([QMSH])(\d{1,2})|-(\d{2}))?\s*$')
+_PER_YEAR = {None: 1, 'Q': 4, 'M': 12, 'S': 2, 'H': 2}
+
+
+def _parse_code(code):
+    match = _PERIOD.match(str(code))
+    if match is None:
+        raise ValueError('Unknown time period ' + repr(code))
+    year, letter, number, month = match.groups()
+    if month is not None:
+        letter, number = 'M', month
+    per_year = _PER_YEAR[letter]
+    sub = 0 if letter is None else int(number)
+    if letter is not None and not 1 <= sub <= per_year:
+        raise ValueError('Unknown time period ' + repr(code))
+    return int(year), sub, per_year
+
+
+# Parse a column of period codes (strings, categories or integer years) into Periods
+def parse_periods(values):
+    values = pd.Series(values)
+    if pd.api.types.is_integer_dtype(values.dtype):
+        # annual periods that the loader already turned into years
+        n = len(values)
+        return Periods(values.to_numpy().astype('int16'), np.zeros(n, dtype='int8'), np.ones(n, dtype='int8'))
+    if values.dtype.name == 'category':
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    if (codes < 0).any():
+        raise ValueError('Missing time period in ' + str(int((codes < 0).sum())) + ' rows')
+    parsed = np.array([_parse_code(code) for code in uniques], dtype='int64').reshape(-1, 3)
+    return Periods(parsed[codes, 0].astype('int16'), parsed[codes, 1].astype('int8'), parsed[codes, 2].astype('int8'))
+
+
+# Position of every period on a time line of its frequency, e.g. year * 4 + quarter - 1
+# (annual periods: the year)
+def period_ordinal(periods):
+    per_year = periods.per_year.astype('int32')
+    return periods.year.astype('int32') * per_year + np.maximum(periods.sub.astype('int32') - 1, 0)
+
+
+# Number of days every period covers (leap years included)
+def period_days(periods):
+    months = 12 // periods.per_year.astype('int64')
+    first_month = (np.maximum(periods.sub.astype('int64'), 1) - 1) * months
+    start = ((periods.year.astype('int64') - 1970) * 12 + first_month).astype('datetime64[M]')
+    end = start + months.astype('timedelta64[M]')
+    return (end.astype('datetime64[D]') - start.astype('datetime64[D]')).astype('int64')
+
+
+# Annual figures of a table with sub-annual values
+# keys: columns of a series, e.g. ['geo', 'isco08', 'sex'], value: column to aggregate
+# period: column with the period codes, or periods: the result of parse_periods for the rows
+# how: one of METHODS, sub: the sub-period for 'single' (e.g. 2 for Q2)
+# min_coverage: drop the years in which less than this share of the sub-periods have a value
+# returns keys + Year + value + coverage, one row per series and year, sorted by the keys and the year;
+# years without a value (or without the sub-period for 'single') get NaN
+def annual(df, keys, value, period='TIME_PERIOD', periods=None, how='mean', sub=None, min_coverage=0.0):
+    if how not in METHODS:
+        raise KeyError('Unknown method ' + how + ', choose one of ' + str(METHODS))
+    if how == 'single' and sub is None:
+        raise ValueError("how='single' needs the sub-period, e.g. sub=2 for Q2")
+    if periods is None:
+        periods = parse_periods(df[period])
+    groups = df[list(keys)].assign(Year=periods.year)
+    codes = groups.groupby(list(keys) + ['Year'], sort=True, observed=True, dropna=False).ngroup().to_numpy()
+    n = int(codes.max()) + 1 if len(codes) else 0
+    first = np.full(n, len(codes), dtype='int64')
+    np.minimum.at(first, codes, np.arange(len(codes)))
+
+    data = df[value].to_numpy(dtype='float64')
+    present = ~np.isnan(data)
+    per_year = np.zeros(n, dtype='int64')
+    np.maximum.at(per_year, codes, periods.per_year.astype('int64'))
+    coverage = np.bincount(codes[present], minlength=n) / np.maximum(per_year, 1)
+
+    if how == 'last':
+        # the row with the highest sub-period of every group among the rows with a value
+        rows = np.flatnonzero(present)
+        rows = rows[np.lexsort((periods.sub[rows], codes[rows]))]
+        last = np.flatnonzero(np.append(codes[rows][1:] != codes[rows][:-1], True))
+        result = np.full(n, np.nan)
+        result[codes[rows[last]]] = data[rows[last]]
+    else:
+        use = present if how != 'single' else present & (periods.sub == sub)
+        weights = period_days(periods).astype('float64') if how == 'weighted' else np.ones(len(codes))
+        weights = np.where(use, weights, 0.0)
+        totals = np.bincount(codes, weights=np.where(use, data, 0.0) * weights, minlength=n)
+        sums = np.bincount(codes, weights=weights, minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = np.where(sums > 0, totals / sums, np.nan)
+
+    table = groups.iloc[first].reset_index(drop=True)
+    table[value] = result
+    table['coverage'] = coverage
+    return table[coverage >= min_coverage].reset_index(drop=True)
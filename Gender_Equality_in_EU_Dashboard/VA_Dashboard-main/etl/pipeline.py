@@ -0,0 +1,229 @@
+# Dependency graph of the cleaning stages and an incremental, parallel runner
+# Each stage declares the script/notebook that implements it, the raw files it reads and the
+# files it writes to datasets_cleaned. A stage is rerun only when the content hash of its code
+# or of one of its inputs changed since its last successful run. Stages whose inputs are ready
+# run at the same time in a process pool; the composite index waits for all indicator stages.
+
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import runpy
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from graphlib import TopologicalSorter
+
+from etl import telemetry
+from etl.cache import file_hash
+from etl.eurostat import BASE_DIR
+
+# all paths are relative to the VA_Dashboard-main folder (BASE_DIR), the scripts expect to run from there
+STATE_FILE = '.pipeline_state.json'
+LOG_DIR = 'logs'
+COUNTRY_LIST = 'additional_data/countries.csv'
+
+Stage = namedtuple('Stage', ['name', 'code', 'inputs', 'outputs'])
+
+STAGES = [
+    Stage('employment', '02_cleaning_gender gaps_labour market.py',
+          ['datasets_raw/Employment and activity by sex and age - annual data_eurostat_2022.csv', COUNTRY_LIST],
+          ['datasets_cleaned/Employment by sex and age.csv']),
+    Stage('parliaments', '03_cleaning_members of national parliaments.py',
+          ['datasets_raw/Members of National Parliaments by sex_EIGE.csv', COUNTRY_LIST],
+          ['datasets_cleaned/Members of national parliaments.csv']),
+    Stage('violence', '03_cleaning_violence.ipynb',
+          ['datasets_raw/violence_master.xlsx', COUNTRY_LIST],
+          ['datasets_cleaned/masterviolence_pht_df.csv']),
+    Stage('care', '04_cleaning_care.ipynb',
+          ['datasets_raw/eurostat_inactive_population_caring.xlsx', COUNTRY_LIST],
+          ['datasets_cleaned/master_care_df.csv']),
+    Stage('sectors', '05_cleaning_sector_representation.py',
+          ['datasets_raw/Economic_sector_gender_representation_2013_2022.csv', COUNTRY_LIST],
+          ['datasets_cleaned/Economic sector representation 2013-2022.csv',
+           'datasets_cleaned/ESR all sectors 2013-2020.csv',
+           'datasets_cleaned/ESR sector drill-down 2013-2022.csv']),
+    Stage('pay', '06_cleaning gender pay gap.py',
+          ['datasets_raw/Gender pay gap raw.csv', COUNTRY_LIST],
+          ['datasets_cleaned/Gender Pay Gap 2009-2020.csv']),
+    Stage('pension', '07_cleaning_pension_gap.py',
+          ['datasets_raw/Pension gap raw.csv', COUNTRY_LIST],
+          ['datasets_cleaned/Pension gap 2012-2021.csv']),
+    Stage('index', 'index_sheet_test.ipynb',
+          ['datasets_cleaned/masterviolence_pht_df.csv',
+           'datasets_cleaned/master_care_df.csv',
+           'datasets_cleaned/Economic sector representation 2013-2022.csv',
+           'datasets_cleaned/Employment by sex and age.csv',
+           'datasets_cleaned/Gender Pay Gap 2009-2020.csv',
+           'datasets_cleaned/Members of national parliaments.csv',
+           'datasets_cleaned/Pension gap 2012-2021.csv',
+           COUNTRY_LIST],
+          ['datasets_cleaned/master_index_df.csv']),
+    Stage('rollups', '08_dashboard_rollups.py',
+          ['datasets_cleaned/master_index_df.csv',
+           'datasets_cleaned/masterviolence_pht_df.csv',
+           'datasets_cleaned/master_care_df.csv',
+           'datasets_cleaned/Economic sector representation 2013-2022.csv',
+           'datasets_cleaned/Employment by sex and age.csv',
+           'datasets_cleaned/Gender Pay Gap 2009-2020.csv',
+           'datasets_cleaned/Members of national parliaments.csv',
+           'datasets_cleaned/Pension gap 2012-2021.csv'],
+          ['datasets_cleaned/rollups/index.json', 'datasets_cleaned/rollups/rollups.arrow']),
+]
+
+
+# stage name -> names of the stages writing one of its inputs
+def dependency_graph(stages=STAGES):
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            producers[output] = stage.name
+    return {stage.name: {producers[i] for i in stage.inputs if i in producers} for stage in stages}
+
+
+# hash of the shared helper package - a change here can change the output of every stage
+def _etl_hash():
+    digest = hashlib.sha256()
+    package = os.path.join(BASE_DIR, 'etl')
+    for name in sorted(os.listdir(package)):
+        if name.endswith('.py'):
+            digest.update(name.encode())
+            digest.update(file_hash(os.path.join(package, name)).encode())
+    return digest.hexdigest()
+
+
+# fingerprint of a stage: its code, the etl package and the content of every input
+def stage_fingerprint(stage, etl_hash):
+    digest = hashlib.sha256(etl_hash.encode())
+    for path in [stage.code] + stage.inputs:
+        digest.update(path.encode())
+        digest.update(file_hash(os.path.join(BASE_DIR, path)).encode())
+    return digest.hexdigest()
+
+
+def load_state():
+    path = os.path.join(BASE_DIR, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state):
+    with open(os.path.join(BASE_DIR, STATE_FILE), 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+
+# notebooks are run by executing their code cells in order, like "Run All" in Jupyter
+def _run_notebook(path):
+    with open(path) as f:
+        notebook = json.load(f)
+    source = '\n'.join(''.join(cell['source']) for cell in notebook['cells'] if cell['cell_type'] == 'code')
+    exec(compile(source, path, 'exec'), {'__name__': '__main__'})
+
+
+# run the script or notebook of a stage in the current process and working directory
+def run_code(path):
+    if path.endswith('.ipynb'):
+        _run_notebook(path)
+    else:
+        runpy.run_path(path, run_name='__main__')
+
+
+# executed in a worker process - the prints of the stage go to logs/<stage>.log,
+# the step telemetry of the stage to telemetry/<stage>/<run id>.json
+# returns the run time and the telemetry alerts of the stage
+def run_stage(stage, run_id=None):
+    os.chdir(BASE_DIR)
+    os.makedirs(LOG_DIR, exist_ok=True)
+    start = time.perf_counter()
+    with open(os.path.join(LOG_DIR, stage.name + '.log'), 'w') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        telemetry.begin(stage.name, run_id)
+        try:
+            run_code(stage.code)
+        finally:
+            run = telemetry.finish()
+    return time.perf_counter() - start, run['alerts'] if run else []
+
+
+def _missing(paths):
+    return [p for p in paths if not os.path.exists(os.path.join(BASE_DIR, p))]
+
+
+# Run every stage whose code or inputs changed (or all of them with force=True)
+# selected: optional list of stage names - their upstream stages are checked as well
+# returns {stage name: 'ran' | 'skipped' | 'blocked'}
+def run_pipeline(selected=None, force=False, jobs=None, dry_run=False, stages=STAGES):
+    by_name = {stage.name: stage for stage in stages}
+    graph = dependency_graph(stages)
+    if selected:
+        unknown = [name for name in selected if name not in by_name]
+        if unknown:
+            raise KeyError('Unknown stages: ' + str(unknown))
+        wanted, todo = set(), list(selected)
+        while todo:
+            name = todo.pop()
+            if name not in wanted:
+                wanted.add(name)
+                todo.extend(graph[name])
+        graph = {name: deps for name, deps in graph.items() if name in wanted}
+
+    state = load_state()
+    etl_hash = _etl_hash()
+    # one telemetry run id for all stages of this pipeline run
+    run_id = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+    result = {}
+    sorter = TopologicalSorter(graph)
+    sorter.prepare()
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while sorter.is_active():
+            for name in sorter.get_ready():
+                stage = by_name[name]
+                missing = _missing([stage.code] + stage.inputs)
+                if missing:
+                    # e.g. a raw file that is not checked in - keep the existing outputs if there are any
+                    if _missing(stage.outputs):
+                        raise FileNotFoundError('Stage ' + name + ' is missing inputs ' + str(missing))
+                    print('[' + name + '] blocked, missing ' + str(missing) + ' - keeping existing outputs')
+                    result[name] = 'blocked'
+                    sorter.done(name)
+                    continue
+                fingerprint = stage_fingerprint(stage, etl_hash)
+                if not force and state.get(name) == fingerprint and not _missing(stage.outputs):
+                    print('[' + name + '] up to date')
+                    result[name] = 'skipped'
+                    sorter.done(name)
+                elif dry_run:
+                    print('[' + name + '] would run')
+                    result[name] = 'ran'
+                    sorter.done(name)
+                else:
+                    print('[' + name + '] running ' + stage.code)
+                    running[pool.submit(run_stage, stage, run_id)] = (name, fingerprint)
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, fingerprint = running.pop(future)
+                try:
+                    seconds, alerts = future.result()
+                except Exception:
+                    save_state(state)
+                    print('[' + name + '] failed, see ' + os.path.join(LOG_DIR, name + '.log'))
+                    raise
+                print('[' + name + '] done in ' + str(round(seconds, 2)) + 's')
+                for alert in alerts:
+                    print('[' + name + '] telemetry alert - ' + alert)
+                # store the fingerprint of the inputs the stage actually ran on
+                state[name] = fingerprint
+                result[name] = 'ran'
+                sorter.done(name)
+
+    if not dry_run:
+        save_state(state)
+    return result
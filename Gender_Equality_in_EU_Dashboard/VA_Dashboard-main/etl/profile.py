@@ -0,0 +1,95 @@
+# Column profile of a raw table
+# Section 1.2 of the cleaning stages explores every column with unique() / value_counts(), which is
+# one full scan per call (and a sort of every distinct float for OBS_VALUE).
+# The profiler factorizes each column once and takes the number of distinct values, the missing
+# values, the value counts and min / max from the codes. The report is cached as JSON next to the
+# parsed table in datasets_raw/.cache, so later runs on the same raw file read the report instead
+# of scanning the table again. The stages print it and take their decisions (e.g. which flags to
+# look at) from it.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from etl.cache import cache_path, file_hash, read_json_cache, write_json_cache
+
+# value counts are kept for columns with at most this many distinct values (codes, flags, years),
+# measured columns like OBS_VALUE only get their min / max
+MAX_VALUE_COUNTS = 100
+
+
+# numpy scalars -> python values for the JSON report
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# Profile of one column from a single factorization
+# categorical columns already hold their codes, so they are not hashed again
+def profile_column(values):
+    if values.dtype.name == 'category':
+        codes = values.cat.codes.to_numpy()
+        uniques = values.cat.categories.to_numpy()
+    else:
+        codes, uniques = pd.factorize(values)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    # unused categories are not values of the column
+    used = counts > 0
+    uniques, counts = uniques[used], counts[used]
+
+    column = {'dtype': str(values.dtype), 'nulls': int((codes < 0).sum()), 'distinct': int(len(uniques)),
+              'min': None, 'max': None}
+    if len(uniques):
+        try:
+            column['min'], column['max'] = _plain(uniques.min()), _plain(uniques.max())
+        except TypeError:
+            # mixed types, e.g. numbers and strings in an object column
+            pass
+    if len(uniques) <= MAX_VALUE_COUNTS:
+        # in the order of value_counts(): most frequent first
+        order = np.argsort(-counts, kind='stable')
+        column['values'] = [[_plain(uniques[i]), int(counts[i])] for i in order]
+    return column
+
+
+def profile_frame(df):
+    return {'rows': int(len(df)), 'columns': {c: profile_column(df[c]) for c in df.columns}}
+
+
+# Profile of the table a stage read from a raw file, cached in datasets_raw/.cache
+# key: short name of the rows the stage read, when it filters while reading (e.g. 'Q2'),
+#      so stages reading different parts of the same file keep their own report
+# The cached report is used as long as the raw file and the columns of the table are the same
+def column_profile(path, df, key=None, cache=True):
+    part = 'profile' if key is None else 'profile-' + key
+    cache_file = cache_path(path, file_hash(path), part=part, ext='.json')
+    if cache and os.path.exists(cache_file):
+        report = read_json_cache(cache_file)
+        if list(report['columns']) == [str(c) for c in df.columns]:
+            return report
+    report = dict(profile_frame(df), source=os.path.basename(path), key=key)
+    if cache:
+        write_json_cache(report, cache_file)
+    return report
+
+
+# Distinct values of a column in the report, most frequent first
+# None if the column has more than MAX_VALUE_COUNTS values
+def column_values(report, column):
+    values = report['columns'][column].get('values')
+    return None if values is None else [value for value, count in values]
+
+
+# Text of one column of the report for the exploration prints, e.g.
+#   sex: category, 3 distinct, 0 missing, min F, max T
+#     T: 1512
+#     ...
+def describe_column(report, column):
+    info = report['columns'][column]
+    text = (column + ': ' + info['dtype'] + ', ' + str(info['distinct']) + ' distinct, '
+            + str(info['nulls']) + ' missing')
+    if info['min'] is not None:
+        text += ', min ' + str(info['min']) + ', max ' + str(info['max'])
+    for value, count in info.get('values', []):
+        text += '\n  ' + str(value) + ': ' + str(count)
+    return text
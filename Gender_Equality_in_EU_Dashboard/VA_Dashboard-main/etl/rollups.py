@@ -0,0 +1,144 @@
+# Precomputed rollups for the dashboard
+# The dashboard used to read master_index_df.csv and the seven indicator CSVs and to compute the EU
+# averages, rankings and country series on every load. The rollups are computed once per pipeline run
+# and written to datasets_cleaned/rollups:
+#   rollups.arrow       one row per Country x Year x measure (every IndexValue* column and IndexTotal):
+#                       value, rank within the year (1 = highest), change to the previous year and the
+#                       EU27 mean / median of the year - Arrow IPC, zstd compressed
+#                       index values of 0 (or below) are missing data points (as in composite.geometric_mean):
+#                       they are published as missing, get no rank and no change and are left out of the
+#                       EU27 mean / median
+#   <year>.json.gz      the same figures of one year, per country as arrays in the order of 'measures'
+#   series.json.gz      sparkline series of every country and measure over all years of the indicator
+#   index.json          the years, measures, countries and files of the artifact
+# The JSON files are also written brotli compressed (.json.br) when the brotli package is installed.
+# gzip files are written without a timestamp, so an unchanged index gives the same bytes.
+
+import gzip
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from etl.composite import CLEANED_DIR, INDICATORS, load_indicator
+from etl.countries import country_names
+from etl.store import has_table, read_csv_export, read_table
+
+ROLLUP_DIR = os.path.join(CLEANED_DIR, 'rollups')
+MASTER_INDEX_CSV = os.path.join(CLEANED_DIR, 'master_index_df.csv')
+TOTAL = 'IndexTotal'
+
+
+# master_index_df from the parquet store, or from the CSV export before the store exists
+def load_master_index():
+    if has_table('master_index'):
+        df = read_table('master_index')
+        return df.drop(columns=[c for c in df.columns if c.startswith('Unnamed')])
+    return read_csv_export(MASTER_INDEX_CSV, index_col=0)
+
+
+# measures of the master index: the IndexValue* column of every indicator and the total
+def index_measures(master_index_df):
+    return [i.output for i in INDICATORS.values() if i.output in master_index_df.columns] + [TOTAL]
+
+
+# Long table of the rollups: Country, Year, Measure, Value, Rank, Delta, EU27Mean, EU27Median
+# every statistic is one group-by over all measures at once, missing values (0 or below) are NaN
+def compute_rollups(master_index_df):
+    measures = index_measures(master_index_df)
+    long = master_index_df.melt(id_vars=['Country', 'Year'], value_vars=measures, var_name='Measure',
+                                value_name='Value')
+    long['Measure'] = pd.Categorical(long['Measure'], categories=measures)
+    long = long.sort_values(['Measure', 'Country', 'Year'], kind='stable').reset_index(drop=True)
+    long['Value'] = long['Value'].where(long['Value'] > 0)
+
+    by_year = long.groupby(['Measure', 'Year'], observed=True)['Value']
+    long['Rank'] = by_year.rank(method='min', ascending=False).astype('Int16')
+    long['Delta'] = long.groupby(['Measure', 'Country'], observed=True)['Value'].diff()
+    long['EU27Mean'] = by_year.transform('mean')
+    long['EU27Median'] = by_year.transform('median')
+    return long
+
+
+# Sparkline series of every indicator over all the years of its cleaned table
+# returns {measure: {country: [first year, values...]}}, missing years and values (0 or below) are None
+def sparklines(indicators=None):
+    series = {}
+    for indicator in (indicators or INDICATORS).values():
+        df = load_indicator(indicator, indicator.years)
+        table = df.pivot_table(index='Country', columns='Year', values=indicator.column, aggfunc='first')
+        years = range(indicator.years[0], indicator.years[1] + 1)
+        table = table.reindex(columns=years)
+        names = country_names(table.index)
+        series[indicator.output] = {name: [years[0]] + [_index_number(v) for v in row]
+                                    for name, row in zip(names, table.to_numpy())}
+    return series
+
+
+# per-year document: {year, measures, eu27: {mean, median}, countries: {name: {values, ranks, deltas}}}
+def year_document(rollups, year):
+    part = rollups[rollups['Year'] == year]
+    measures = list(part['Measure'].cat.categories)
+    document = {'year': int(year), 'measures': measures,
+                'eu27': {'mean': [], 'median': []}, 'countries': {}}
+    for measure, rows in part.groupby('Measure', observed=True, sort=True):
+        document['eu27']['mean'].append(_number(rows['EU27Mean'].iloc[0]))
+        document['eu27']['median'].append(_number(rows['EU27Median'].iloc[0]))
+    for country, rows in part.groupby('Country', sort=False):
+        rows = rows.sort_values('Measure')
+        document['countries'][country] = {
+            'values': [_number(v) for v in rows['Value']],
+            'ranks': [None if pd.isna(r) else int(r) for r in rows['Rank']],
+            'deltas': [_number(v) for v in rows['Delta']]}
+    return document
+
+
+def _number(value):
+    return None if pd.isna(value) else float(value)
+
+
+# index values of 0 (or below) are missing data points
+def _index_number(value):
+    return None if pd.isna(value) or value <= 0 else float(value)
+
+
+def _write_json(document, path):
+    data = json.dumps(document, separators=(',', ':')).encode()
+    written = [path + '.gz']
+    # mtime=0: the same document gives the same file
+    with open(path + '.gz', 'wb') as f:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0, compresslevel=9) as compressed:
+            compressed.write(data)
+    try:
+        import brotli
+    except ImportError:
+        return written
+    with open(path + '.br', 'wb') as f:
+        f.write(brotli.compress(data, quality=11))
+    return written + [path + '.br']
+
+
+# Build every file of the rollup artifact, returns the paths written
+def write_rollups(master_index_df=None, folder=ROLLUP_DIR):
+    master_index_df = load_master_index() if master_index_df is None else master_index_df
+    rollups = compute_rollups(master_index_df)
+    os.makedirs(folder, exist_ok=True)
+
+    table = pa.Table.from_pandas(rollups.assign(Country=rollups['Country'].astype('category')),
+                                 preserve_index=False)
+    feather.write_feather(table, os.path.join(folder, 'rollups.arrow'), compression='zstd')
+    written = [os.path.join(folder, 'rollups.arrow')]
+
+    years = sorted(int(y) for y in rollups['Year'].unique())
+    for year in years:
+        written += _write_json(year_document(rollups, year), os.path.join(folder, str(year) + '.json'))
+    written += _write_json(sparklines(), os.path.join(folder, 'series.json'))
+
+    manifest = {'years': years, 'measures': list(rollups['Measure'].cat.categories),
+                'countries': sorted(rollups['Country'].unique()),
+                'files': sorted(os.path.basename(p) for p in written)}
+    with open(os.path.join(folder, 'index.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return written + [os.path.join(folder, 'index.json')]
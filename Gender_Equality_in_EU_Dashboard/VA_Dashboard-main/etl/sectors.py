@@ -0,0 +1,43 @@
+# Sector drill-down of the sector representation stage (05)
+# The cleaned tables of stage 05 only use the Q2 figures and average the ISCO-08 sectors per country.
+# The drill-down keeps the full matrix for the sector view of the dashboard: every quarter, every
+# worktime and every ISCO-08 code, with the female share of the employed persons of each cell.
+# It is calculated per country in a process pool (etl/partition.py), every worker reads the rows of its
+# country from the shared parquet cache of the raw file.
+
+import numpy as np
+import pandas as pd
+
+from etl.cube import Cube, to_long_frame
+from etl.partition import read_partition
+from etl.periods import parse_periods
+
+DRILLDOWN_KEYS = ['Country', 'Year', 'Quarter', 'Worktime', 'Sector']
+
+
+# Drill-down of one country: Country (geo code), Year, Quarter, Worktime, Sector, the employed women and
+# persons in thousands and their ratio, for every cell with a total
+# years: only these years (None: every year)
+def country_drilldown(cache_file, code, years=None):
+    df = read_partition(cache_file, code, columns=['sex', 'isco08', 'worktime', 'geo', 'TIME_PERIOD', 'OBS_VALUE'])
+    # Year and Quarter of TIME_PERIOD ('2013-Q2', etl/periods.py)
+    periods = parse_periods(df['TIME_PERIOD'])
+    df['Year'] = periods.year.astype(int)
+    df['Quarter'] = np.array(['', 'Q1', 'Q2', 'Q3', 'Q4'])[periods.sub]
+    if years is not None:
+        df = df[df['Year'].isin(years)]
+    if not len(df):
+        return None
+
+    values = Cube.from_frame(df, ['Year', 'Quarter', 'worktime', 'isco08', 'sex'], 'OBS_VALUE')
+    female, total = values.sel('sex', 'F'), values.sel('sex', 'T')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percent = female.with_values(female.values / total.values)
+    # cells without a female figure (confidential or not published) stay missing, they are no 0% share
+    drilldown = to_long_frame({'Female employed in thousands': female,
+                               'Employed in thousands': total,
+                               'percent': percent},
+                              mask=~np.isnan(total.values))
+    drilldown = drilldown.rename(columns={'worktime': 'Worktime', 'isco08': 'Sector'})
+    drilldown.insert(0, 'Country', code)
+    return drilldown
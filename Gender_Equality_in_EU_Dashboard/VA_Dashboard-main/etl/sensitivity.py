@@ -0,0 +1,178 @@
+# Sensitivity of the composite index to its parameters
+# The composite depends on hand-picked bounds (best / worst value of every indicator in the registry),
+# on equal weights and on the geometric mean. A sweep evaluates the composite for many alternative
+# settings (scenarios) at once: the measured values of all indicators are aligned once into a
+# (Country x Year, indicator) matrix, and the index values and totals of a batch of scenarios are
+# one broadcast NumPy computation over (scenario, Country x Year, indicator). Per scenario only the
+# ranks of the countries within each year are kept, accumulated into a rank histogram, so no
+# DataFrame is built per scenario.
+#
+# Parameters of a sweep (S scenarios, K indicators in registry order):
+#   best, worst: (S, K) bounds that are scaled to 1 and 0
+#   weights:     (S, K) weight of every indicator, relative within a scenario
+#   power:       (S,) exponent of the weighted power mean: 0 geometric (the composite), 1 arithmetic,
+#                -1 harmonic
+# Index values of 0 or below are missing data points, like in geometric_mean (etl/composite.py):
+# cells without a value in the cleaned table stay missing in every scenario, and values beyond the
+# worst bound of a scenario drop out of that scenario's total.
+
+import itertools
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from etl.composite import INDICATORS, align_indicators, common_years, load_indicator
+from etl.countries import country_names
+
+# keys: Country / Year of the rows, values: (rows, K) measured values, present: (rows, K) cells with data
+# best / worst: (K,) bounds of the registry (data-derived bounds recovered from the cleaned tables)
+# names: indicator names in column order
+SweepInputs = namedtuple('SweepInputs', ['keys', 'values', 'present', 'best', 'worst', 'names'])
+
+
+# bound that the stage derived from the data (None in the registry), recovered from the pairs of
+# measured value v and index value i: i = (v - worst) / (best - worst)
+def _implied_bound(values, index, best, worst):
+    usable = (values != 0) & (index != 0) & (index != 1) & ~np.isnan(values) & ~np.isnan(index)
+    v, i = values[usable], index[usable]
+    if worst is None:
+        return float(np.median((v - i * best) / (1 - i)))
+    return float(np.median((v - (1 - i) * worst) / i))
+
+
+# The measured values of every indicator aligned on the (Country, Year) key of the composite
+def load_sweep_inputs(indicators=None, years=None):
+    indicators = indicators or INDICATORS
+    years = years or common_years(indicators)
+    tables = [load_indicator(i, years, measures=[i.column, i.value]) for i in indicators.values()]
+    keys, index = align_indicators([t[['Country', 'Year', i.column]] for t, i in zip(tables, indicators.values())])
+    _, values = align_indicators([t[['Country', 'Year', i.value]] for t, i in zip(tables, indicators.values())])
+
+    best, worst = [], []
+    for k, indicator in enumerate(indicators.values()):
+        b, w = indicator.best, indicator.worst
+        if b is None:
+            b = _implied_bound(values[:, k], index[:, k], None, w)
+        if w is None:
+            w = _implied_bound(values[:, k], index[:, k], b, None)
+        best.append(b)
+        worst.append(w)
+    return SweepInputs(keys, values, index > 0, np.array(best, dtype='float64'), np.array(worst, dtype='float64'),
+                       list(indicators))
+
+
+# The registry setting as a single scenario
+def base_params(inputs):
+    return {'best': inputs.best[None, :], 'worst': inputs.worst[None, :],
+            'weights': np.ones((1, len(inputs.names))), 'power': np.zeros(1)}
+
+
+# Monte-Carlo sample of n scenarios around the registry setting
+# spread: the bounds move by up to this fraction of (best - worst) in either direction
+# weights: draw the weights from a flat Dirichlet distribution (False: equal weights)
+# powers: exponents of the power mean to draw from
+def monte_carlo(inputs, n, spread=0.25, weights=True, powers=(0,), seed=0):
+    rng = np.random.default_rng(seed)
+    k = len(inputs.names)
+    scale = np.abs(inputs.best - inputs.worst)
+    best = inputs.best + rng.uniform(-spread, spread, (n, k)) * scale
+    worst = inputs.worst + rng.uniform(-spread, spread, (n, k)) * scale
+    w = rng.dirichlet(np.ones(k), n) * k if weights else np.ones((n, k))
+    return {'best': best, 'worst': worst, 'weights': w, 'power': rng.choice(np.asarray(powers, dtype='float64'), n)}
+
+
+# Full grid over alternative settings - every combination is one scenario
+# best / worst: {indicator name: [alternative values]}, the other indicators keep their registry bounds
+# weights: {indicator name: [alternative weights]}, powers: exponents of the power mean
+def grid(inputs, best=None, worst=None, weights=None, powers=(0,)):
+    axes = []
+    for kind, options in [('best', best or {}), ('worst', worst or {}), ('weights', weights or {})]:
+        for name, values in options.items():
+            axes.append((kind, inputs.names.index(name), list(values)))
+    combinations = list(itertools.product(*[values for _, _, values in axes], list(powers)))
+    n, k = len(combinations), len(inputs.names)
+    params = {'best': np.tile(inputs.best, (n, 1)), 'worst': np.tile(inputs.worst, (n, 1)),
+              'weights': np.ones((n, k)), 'power': np.array([c[-1] for c in combinations], dtype='float64')}
+    for s, combination in enumerate(combinations):
+        for (kind, column, _), value in zip(axes, combination):
+            params[kind][s, column] = value
+    return params
+
+
+# Composite totals of a batch of scenarios: (S, rows)
+# weighted power mean of the index values above 0 of every row, rows without any get 0
+def composite_totals(inputs, params):
+    best, worst = params['best'][:, None, :], params['worst'][:, None, :]
+    index = (inputs.values[None, :, :] - worst) / (best - worst)
+    used = inputs.present[None, :, :] & (index > 0)
+    weights = np.where(used, params['weights'][:, None, :], 0.0)
+    total_weight = weights.sum(axis=2)
+    safe = np.where(used, index, 1.0)
+    power = params['power'][:, None]
+    geometric = power == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # geometric mean as the mean of the logarithms, other means on the powers of the values
+        logs = (weights * np.log(safe)).sum(axis=2) / total_weight
+        powered = (weights * safe ** np.where(geometric, 1.0, power)[:, :, None]).sum(axis=2) / total_weight
+        totals = np.where(geometric, np.exp(logs), powered ** (1 / np.where(geometric, 1.0, power)))
+    return np.where(total_weight > 0, totals, 0.0)
+
+
+# Rank of every row among the countries of its year, 1 = highest total: (S, rows)
+def year_ranks(totals, years):
+    ranks = np.empty(totals.shape, dtype='int64')
+    for year in np.unique(years):
+        rows = np.flatnonzero(years == year)
+        # descending totals, ties keep the key order
+        order = np.argsort(-totals[:, rows], axis=1, kind='stable')
+        positions = np.empty(order.shape, dtype='int64')
+        np.put_along_axis(positions, order, np.arange(1, len(rows) + 1)[None, :], axis=1)
+        ranks[:, rows] = positions
+    return ranks
+
+
+# Evaluate all scenarios and summarise the rank distribution of every country and year
+# chunk: scenarios per batch - a batch holds chunk x rows x indicators floats
+# returns a DataFrame with one row per Country / Year: rank under the registry setting, mean / std /
+# min / quantiles / max of the rank over all scenarios and the share of scenarios in the top 3 / top 10;
+# the rank histogram (rows x ranks counts) is in .attrs['histogram']
+def sweep(inputs, params, chunk=1000):
+    years = inputs.keys['Year'].to_numpy()
+    n_rows = len(inputs.keys)
+    n_ranks = int(pd.Series(years).value_counts().max())
+    histogram = np.zeros((n_rows, n_ranks + 1), dtype='int64')
+    total, square = np.zeros(n_rows), np.zeros(n_rows)
+    n = len(params['power'])
+    for start in range(0, n, chunk):
+        batch = {key: value[start:start + chunk] for key, value in params.items()}
+        ranks = year_ranks(composite_totals(inputs, batch), years)
+        # rank histogram of every row: one bincount over (row, rank) pairs
+        flat = (np.arange(n_rows)[None, :] * (n_ranks + 1) + ranks).ravel()
+        histogram += np.bincount(flat, minlength=histogram.size).reshape(histogram.shape)
+        total += ranks.sum(axis=0)
+        square += (ranks.astype('float64') ** 2).sum(axis=0)
+
+    base = year_ranks(composite_totals(inputs, base_params(inputs)), years)[0]
+    cumulative = histogram.cumsum(axis=1) / n
+    rank_values = np.arange(n_ranks + 1)
+
+    # smallest rank whose cumulative share reaches q
+    def quantile(q):
+        return rank_values[np.argmax(cumulative >= q - 1e-12, axis=1)]
+
+    mean = total / n
+    summary = pd.DataFrame({'Country': country_names(inputs.keys['Country']).to_numpy(),
+                            'Year': years,
+                            'base_rank': base,
+                            'mean_rank': mean,
+                            'std_rank': np.sqrt(np.maximum(square / n - mean ** 2, 0)),
+                            'min_rank': rank_values[np.argmax(histogram > 0, axis=1)],
+                            'p05_rank': quantile(0.05),
+                            'median_rank': quantile(0.5),
+                            'p95_rank': quantile(0.95),
+                            'max_rank': n_ranks - np.argmax(histogram[:, ::-1] > 0, axis=1),
+                            'top3_share': histogram[:, 1:4].sum(axis=1) / n,
+                            'top10_share': histogram[:, 1:11].sum(axis=1) / n})
+    summary.attrs['histogram'] = histogram[:, 1:]
+    return summary
@@ -0,0 +1,318 @@
+# Local query service over the composite index
+# Answers the questions analysts and the front end used to look up in the CSV exports, e.g.
+#   GET /point?table=pay&country=Spain&year=2013
+#   GET /range?table=master_index&country=ES&from=2013&to=2020&columns=IndexValuePay
+#   GET /top?table=master_index&year=2019&column=IndexTotal&k=5
+#   GET /tables
+# master_index and every indicator table of the registry (etl/composite.py) are loaded once into arrays
+# sorted by CountryId and Year: a binary search finds the rows of the country and a second one the years
+# among them, so a point query is two binary searches and a range query one slice.
+# The ranking of every column within every year is sorted at load time, a top-k query is a slice of it.
+# Responses are kept in an LRU cache. The service watches the cleaned store and the CSV exports and
+# reloads the tables (and empties the cache) when a stage wrote new results.
+# Only the standard library (asyncio) and the packages of the pipeline are used.
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from etl.composite import CLEANED_DIR, INDICATORS, load_indicator
+from etl.countries import UNKNOWN, country_id, country_ids, country_names
+from etl.rollups import load_master_index
+from etl.store import STORE_DIR
+
+CACHE_SIZE = 4096
+# seconds between two checks of the cleaned store for changes
+RELOAD_INTERVAL = 2.0
+
+# countries / years: CountryId and Year of every row, sorted by country, then year
+# names: country name of every row, columns: {column: float64 values in row order}
+# rankings: {(column, year): rows of the year with a value, highest value first}
+Table = namedtuple('Table', ['name', 'countries', 'years', 'names', 'columns', 'rankings'])
+
+
+# Table of a DataFrame with Country (names) and Year, values: the numeric columns to serve
+# indexes: the columns of index values among them (default: all) - index values of 0 (or below) are
+# missing data points (see composite.geometric_mean) and are left out of the rankings
+def index_table(name, df, values, indexes=None):
+    indexes = values if indexes is None else indexes
+    ids = country_ids(df['Country']).to_numpy().astype('int32')
+    years = df['Year'].to_numpy().astype('int32')
+    keep = ids != UNKNOWN
+    ids, years = ids[keep], years[keep]
+    order = np.lexsort((years, ids))
+    columns = {c: df[c].to_numpy(dtype='float64')[keep][order] for c in values}
+    ids, years = ids[order], years[order]
+
+    rankings = {}
+    for column, data in columns.items():
+        # by year, then by value descending - the rows without a value are left out
+        present = ~np.isnan(data)
+        if column in indexes:
+            present &= data > 0
+        rows = np.flatnonzero(present)
+        rows = rows[np.lexsort((-data[rows], years[rows]))]
+        bounds = np.flatnonzero(np.diff(years[rows])) + 1
+        for part in np.split(rows, bounds):
+            if len(part):
+                rankings[(column, int(years[part[0]]))] = part
+    return Table(name, ids, years, list(country_names(ids)), columns, rankings)
+
+
+# master_index and the indicator tables (index value and measured value of every indicator)
+def load_tables():
+    tables = {}
+    master_index_df = load_master_index()
+    values = [c for c in master_index_df.columns if c not in ('Country', 'Year')]
+    tables['master_index'] = index_table('master_index', master_index_df, values)
+    for indicator in INDICATORS.values():
+        measures = [indicator.column, indicator.value]
+        df = load_indicator(indicator, indicator.years, measures=measures)
+        df = df.assign(Country=country_names(df['Country']).to_numpy())
+        tables[indicator.name] = index_table(indicator.name, df, measures, [indicator.column])
+    return tables
+
+
+# size and modification time of every file the tables are read from
+# (the CSV exports and the parquet store below them)
+def data_signature(folder=CLEANED_DIR):
+    signature = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if d != 'watermarks')
+        for name in sorted(files):
+            if name.endswith(('.parquet', '.csv')):
+                stat = os.stat(os.path.join(root, name))
+                signature.append((root, name, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+
+class QueryError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# The queries over the loaded tables with the LRU cache of the encoded responses
+class IndexQueries:
+
+    def __init__(self, tables=None, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.signature = data_signature()
+        self.tables = load_tables() if tables is None else tables
+        self.loaded = time.time()
+
+    # (signature, tables) loaded again when the cleaned store changed since the last load, else None
+    # only reads - safe to run in a worker thread while the event loop answers requests
+    def load_if_changed(self):
+        signature = data_signature()
+        if signature == self.signature:
+            return None
+        return signature, load_tables()
+
+    # swap in the new tables and empty the cache in one step - called on the event loop, between two
+    # requests, so no response computed from the old tables ends up in the cache of the new ones
+    def swap(self, signature, tables):
+        self.tables, self.signature, self.loaded = tables, signature, time.time()
+        self.cache = OrderedDict()
+
+    # reload when the cleaned store changed since the last load - True if it did
+    def reload_if_changed(self):
+        loaded = self.load_if_changed()
+        if loaded is None:
+            return False
+        self.swap(*loaded)
+        return True
+
+    def _table(self, name):
+        if name not in self.tables:
+            raise QueryError(404, 'Unknown table ' + str(name) + ', choose one of ' + ', '.join(self.tables))
+        return self.tables[name]
+
+    @staticmethod
+    def _country(value):
+        country = country_id(value)
+        if country == UNKNOWN:
+            raise QueryError(404, 'Unknown country ' + str(value))
+        return country
+
+    @staticmethod
+    def _columns(table, columns):
+        if not columns:
+            return list(table.columns)
+        unknown = [c for c in columns if c not in table.columns]
+        if unknown:
+            raise QueryError(400, 'Unknown columns ' + ', '.join(unknown) + ' in ' + table.name)
+        return columns
+
+    @staticmethod
+    def _row(table, position, columns):
+        row = {'Country': table.names[position], 'Year': int(table.years[position])}
+        for column in columns:
+            value = table.columns[column][position]
+            row[column] = None if np.isnan(value) else float(value)
+        return row
+
+    # (start, end) of the rows of a country, its years are table.years[start:end] in ascending order
+    @staticmethod
+    def _country_rows(table, country):
+        return (int(np.searchsorted(table.countries, country, side='left')),
+                int(np.searchsorted(table.countries, country, side='right')))
+
+    def point(self, table, country, year, columns=None):
+        table = self._table(table)
+        start, end = self._country_rows(table, self._country(country))
+        position = start + int(np.searchsorted(table.years[start:end], year))
+        if position == end or table.years[position] != year:
+            raise QueryError(404, 'No row for ' + str(country) + ' ' + str(year) + ' in ' + table.name)
+        return self._row(table, position, self._columns(table, columns))
+
+    # rows of a country from year first to year last (both included)
+    def range(self, table, country, first, last, columns=None):
+        table = self._table(table)
+        if first > last:
+            raise QueryError(400, 'Year from ' + str(first) + ' is after year to ' + str(last))
+        start, end = self._country_rows(table, self._country(country))
+        years = table.years[start:end]
+        end = start + int(np.searchsorted(years, last, side='right'))
+        start = start + int(np.searchsorted(years, first, side='left'))
+        columns = self._columns(table, columns)
+        return [self._row(table, p, columns) for p in range(start, end)]
+
+    # k rows of a year with the highest (ascending: lowest) value of a column
+    # Rank: position in the ranking of the year, 1 = highest value
+    def top(self, table, column, year, k=5, ascending=False):
+        table = self._table(table)
+        if k < 1:
+            raise QueryError(400, 'k must be at least 1, got ' + str(k))
+        self._columns(table, [column])
+        ranking = table.rankings.get((column, int(year)))
+        if ranking is None:
+            raise QueryError(404, 'No values of ' + column + ' in ' + str(year) + ' in ' + table.name)
+        ranks = np.arange(1, len(ranking) + 1)
+        if ascending:
+            ranking, ranks = ranking[::-1], ranks[::-1]
+        return [dict(self._row(table, p, [column]), Rank=int(r)) for p, r in zip(ranking[:k], ranks[:k])]
+
+    def describe(self):
+        return {name: {'columns': list(t.columns), 'rows': int(len(t.years)),
+                       'years': [int(t.years.min()), int(t.years.max())] if len(t.years) else None}
+                for name, t in self.tables.items()}
+
+    # Answer a request path ('/point?table=...') - returns (status, JSON bytes)
+    def answer(self, target):
+        url = urlsplit(target)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path == '/health':
+            # live counters - never cached
+            return 200, json.dumps(self._dispatch(url.path, params)).encode()
+        cache_key = url.path + '?' + '&'.join(k + '=' + params[k] for k in sorted(params))
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            self.cache.move_to_end(cache_key)
+            self.hits += 1
+            return 200, cached
+        self.misses += 1
+        try:
+            result = self._dispatch(url.path, params)
+        except QueryError as error:
+            return error.status, json.dumps({'error': str(error)}).encode()
+        except (KeyError, ValueError) as error:
+            return 400, json.dumps({'error': 'Bad request: ' + str(error)}).encode()
+        body = json.dumps(result, separators=(',', ':')).encode()
+        self.cache[cache_key] = body
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return 200, body
+
+    def _dispatch(self, path, params):
+        columns = [c for c in params.get('columns', '').split(',') if c] or None
+        if path == '/point':
+            return self.point(params['table'], params['country'], int(params['year']), columns)
+        if path == '/range':
+            return self.range(params['table'], params['country'], int(params['from']), int(params['to']), columns)
+        if path == '/top':
+            return self.top(params['table'], params['column'], int(params['year']), int(params.get('k', 5)),
+                            params.get('order', 'desc') == 'asc')
+        if path == '/tables':
+            return self.describe()
+        if path == '/health':
+            return {'tables': len(self.tables), 'loaded': self.loaded, 'cache': len(self.cache),
+                    'hits': self.hits, 'misses': self.misses}
+        raise QueryError(404, 'Unknown path ' + path + ', use /point, /range, /top, /tables or /health')
+
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+def _response(status, body, keep_alive):
+    head = ('HTTP/1.1 ' + str(status) + ' ' + _REASONS.get(status, '') + '\r\n'
+            'Content-Type: application/json\r\n'
+            'Content-Length: ' + str(len(body)) + '\r\n'
+            'Connection: ' + ('keep-alive' if keep_alive else 'close') + '\r\n\r\n')
+    return head.encode() + body
+
+
+# One HTTP/1.1 connection: GET requests, kept alive until the client closes it
+async def _handle(queries, reader, writer):
+    try:
+        while True:
+            request = await reader.readline()
+            if not request:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip().lower()
+            parts = request.decode('latin-1').split()
+            keep_alive = headers.get('connection') != 'close' and parts[-1:] == ['HTTP/1.1']
+            if len(parts) < 2 or parts[0] != 'GET':
+                status, body = 405, json.dumps({'error': 'Only GET requests'}).encode()
+            else:
+                status, body = queries.answer(parts[1])
+            writer.write(_response(status, body, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+# load the tables in a worker thread when the cleaned store changed, swap them in on the event loop
+async def _watch(queries, interval):
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            loaded = await loop.run_in_executor(None, queries.load_if_changed)
+            if loaded is not None:
+                queries.swap(*loaded)
+                print('reloaded the tables from ' + STORE_DIR)
+        except Exception as error:
+            # e.g. a stage is writing the store right now - try again at the next check
+            print('reload failed: ' + str(error))
+
+
+async def serve(host='127.0.0.1', port=8765, interval=RELOAD_INTERVAL, queries=None):
+    queries = queries or IndexQueries()
+    server = await asyncio.start_server(lambda r, w: _handle(queries, r, w), host, port)
+    watcher = asyncio.create_task(_watch(queries, interval))
+    print('serving ' + ', '.join(queries.tables) + ' on http://' + host + ':' + str(port))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
@@ -0,0 +1,203 @@
+# Partitioned columnar store for the cleaned tables
+# Every cleaned table is written as a parquet dataset partitioned by indicator and Year:
+#   datasets_cleaned/store/indicator=<name>/Year=<year>/part-0.parquet
+# with an explicit schema (no unnamed index column, countries dictionary-encoded, years as int16).
+# Readers memory-map the files and only open the partitions of the requested years, and only
+# decode the requested columns. The CSV export to datasets_cleaned stays available.
+# An incremental refresh (etl/watermarks.py) only rewrites the partitions of the years it recomputed.
+
+import io
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyarrow.fs
+
+from etl.eurostat import BASE_DIR
+
+STORE_DIR = os.path.join(BASE_DIR, 'datasets_cleaned', 'store')
+PARTITION_COLUMN = 'Year'
+
+_YEAR_PARTITIONING = ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.int16())]), flavor='hive')
+
+
+def _table_dir(name, folder=STORE_DIR):
+    return os.path.join(folder, 'indicator=' + name)
+
+
+# explicit arrow type per column, derived from the pandas dtype
+def _arrow_field(name, dtype):
+    if name == PARTITION_COLUMN:
+        return pa.field(name, pa.int16())
+    if pd.api.types.is_float_dtype(dtype):
+        return pa.field(name, pa.float64())
+    if pd.api.types.is_integer_dtype(dtype):
+        return pa.field(name, pa.int64())
+    if pd.api.types.is_bool_dtype(dtype):
+        return pa.field(name, pa.bool_())
+    # Country, Sector, Age, ... - few distinct strings
+    return pa.field(name, pa.dictionary(pa.int32(), pa.string()))
+
+
+def table_schema(df):
+    return pa.schema([_arrow_field(name, dtype) for name, dtype in df.dtypes.items()])
+
+
+def has_table(name, folder=STORE_DIR):
+    return os.path.isdir(_table_dir(name, folder))
+
+
+# strings for the dictionary columns (missing values stay missing), years as int16
+def _prepare(df):
+    df = df.reset_index(drop=True)
+    df[PARTITION_COLUMN] = df[PARTITION_COLUMN].astype('int16')
+    for column in df.columns:
+        if df[column].dtype == 'object' or df[column].dtype.name == 'category':
+            values = df[column].astype(object)
+            present = values.notna()
+            values[present] = values[present].astype(str)
+            values[~present] = None
+            df[column] = values
+    return df
+
+
+# every partition is written with a plain (synchronous) parquet writer - the dataset writer
+# can leave arrow threads running that abort the interpreter when the stage exits
+def _write_partition(table_dir, year, part, schema):
+    partition = os.path.join(table_dir, PARTITION_COLUMN + '=' + str(year))
+    os.makedirs(partition, exist_ok=True)
+    table = pa.Table.from_pandas(part.drop(columns=PARTITION_COLUMN), schema=schema, preserve_index=False)
+    # write next to the old file and swap, so readers never see half a partition
+    pq.write_table(table, os.path.join(partition, 'part-0.parquet.tmp'))
+    os.replace(os.path.join(partition, 'part-0.parquet.tmp'), os.path.join(partition, 'part-0.parquet'))
+
+
+# Write a cleaned table to the store (replacing the previous version) and optionally as CSV
+# csv: path of the CSV export, csv_index: write the DataFrame index to the CSV like before
+def save_table(name, df, csv=None, csv_index=False, folder=STORE_DIR):
+    if csv is not None:
+        df.to_csv(csv, index=csv_index)
+    if PARTITION_COLUMN not in df.columns:
+        raise KeyError('Table ' + name + ' has no ' + PARTITION_COLUMN + ' column to partition by')
+
+    df = _prepare(df)
+    schema = table_schema(df.drop(columns=PARTITION_COLUMN))
+
+    # write next to the old version and swap, so readers never see half a table
+    target = _table_dir(name, folder)
+    staging = target + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for year, part in df.groupby(PARTITION_COLUMN, sort=True):
+        _write_partition(staging, year, part, schema)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+
+
+# rows of a DataFrame that belong to one of the (Country, Year) slices
+def _in_slices(countries, years, slices):
+    return pd.MultiIndex.from_arrays([countries, years]).isin(list(slices))
+
+
+# Replace the rows of some Country x Year slices in the CSV export, keeping the row order and the index
+# column of the other rows. Both tables are handled as text, so untouched rows are written back byte
+# for byte and the recomputed rows are formatted by to_csv like in a full rebuild.
+def _upsert_csv(csv, df, slices, keys, csv_index):
+    old = pd.read_csv(csv, dtype=str, keep_default_na=False)
+    new = pd.read_csv(io.StringIO(df.to_csv(index=csv_index)), dtype=str, keep_default_na=False)
+    slices = {(str(country), str(year)) for country, year in slices}
+    in_slice = _in_slices(old['Country'], old['Year'], slices)
+
+    # the recomputed row of every old row of the slices (-1: the row is gone)
+    position = pd.MultiIndex.from_frame(new[keys]).get_indexer(pd.MultiIndex.from_frame(old[keys]))
+    replaced = in_slice & (position >= 0)
+    # recomputed rows take the place (and the index label) of the rows they replace
+    columns = [c for c in new.columns if c not in keys and not (csv_index and c == new.columns[0])]
+    old.loc[replaced, columns] = new[columns].to_numpy()[position[replaced]]
+    old = old[~in_slice | replaced]
+    # new rows (e.g. a year that was not published before) go to the end
+    added = np.ones(len(new), dtype=bool)
+    added[position[replaced]] = False
+    merged = pd.concat([old, new[added & _in_slices(new['Country'], new['Year'], slices)]], ignore_index=True)
+    if csv_index:
+        # the unnamed index column of the CSV export
+        merged = merged.rename(columns={merged.columns[0]: ''})
+    merged.to_csv(csv, index=False)
+
+
+# Incremental refresh: replace the rows of some Country x Year slices of a stored table
+# df: the recomputed rows, slices: the (Country name, Year) pairs that were recomputed
+# keys: columns that identify a row, e.g. ['Country', 'Year', 'Age']
+# Only the partitions of the years of the slices are rewritten. Rows of the slices that are not in
+# df any more are removed, rows outside the slices are kept as they are.
+def upsert_table(name, df, slices, keys, csv=None, csv_index=False, folder=STORE_DIR):
+    if csv is not None:
+        _upsert_csv(csv, df, slices, keys, csv_index)
+    slices = {(str(country), int(year)) for country, year in slices}
+    years = sorted({year for country, year in slices})
+
+    df = _prepare(df)
+    df = df[_in_slices(df['Country'], df[PARTITION_COLUMN].astype(int), slices)]
+    dataset = _dataset(name, folder)
+    old = dataset.to_table(filter=ds.field(PARTITION_COLUMN).isin(years)).to_pandas()
+    old = _prepare(old[df.columns])
+    old = old[~_in_slices(old['Country'], old[PARTITION_COLUMN].astype(int), slices)]
+    schema = dataset.schema.remove(dataset.schema.get_field_index(PARTITION_COLUMN))
+
+    target = _table_dir(name, folder)
+    merged = pd.concat([old, df], ignore_index=True).sort_values('Country', kind='stable')
+    for year in years:
+        part = merged[merged[PARTITION_COLUMN] == year]
+        if len(part):
+            _write_partition(target, year, part, schema)
+        else:
+            shutil.rmtree(os.path.join(target, PARTITION_COLUMN + '=' + str(year)), ignore_errors=True)
+
+
+def _dataset(name, folder=STORE_DIR):
+    if not has_table(name, folder):
+        raise FileNotFoundError('No table ' + name + ' in ' + folder)
+    filesystem = pyarrow.fs.LocalFileSystem(use_mmap=True)
+    return ds.dataset(_table_dir(name, folder), format='parquet', partitioning=_YEAR_PARTITIONING,
+                      filesystem=filesystem)
+
+
+# Read a table from the store
+# columns: only decode these columns (default: all)
+# years: (first, last) inclusive - only the partitions of these years are opened
+def read_table(name, columns=None, years=None, folder=STORE_DIR):
+    dataset = _dataset(name, folder)
+    condition = None
+    if years is not None:
+        first, last = years
+        condition = (ds.field(PARTITION_COLUMN) >= first) & (ds.field(PARTITION_COLUMN) <= last)
+    table = dataset.to_table(columns=columns, filter=condition)
+    df = table.to_pandas()
+    # the partition column comes back as the last column - put it back after Country
+    if PARTITION_COLUMN in df.columns:
+        df[PARTITION_COLUMN] = df[PARTITION_COLUMN].astype('int16')
+        order = [c for c in df.columns if c != PARTITION_COLUMN]
+        order.insert(order.index('Country') + 1 if 'Country' in order else 0, PARTITION_COLUMN)
+        df = df[order]
+    sort = [c for c in ('Country', PARTITION_COLUMN) if c in df.columns]
+    return df.sort_values(sort, kind='stable').reset_index(drop=True) if sort else df
+
+
+# Read the CSV export of a cleaned table with the float64 values that were written - pandas' default
+# float parser can be 1 ulp off, the round-trip parser gives the same values as the parquet store
+def read_csv_export(path, **kwargs):
+    return pd.read_csv(path, float_precision='round_trip', **kwargs)
+
+
+# parquet files that a read of the given years opens - handy to check partition pruning
+def partition_files(name, years=None, folder=STORE_DIR):
+    dataset = _dataset(name, folder)
+    if years is None:
+        return list(dataset.files)
+    first, last = years
+    condition = (ds.field(PARTITION_COLUMN) >= first) & (ds.field(PARTITION_COLUMN) <= last)
+    return [fragment.path for fragment in dataset.get_fragments(filter=condition)]
@@ -0,0 +1,190 @@
+# Step telemetry of the cleaning stages
+# The stages wrap their logical steps (load, filter, map countries, pivot, index calculation, save) in
+#   with step('filter', clean_df) as s:
+#       clean_df2 = ...
+#       s.rows_out(clean_df2)
+# and every step records its wall time, the resident memory (RSS) of the process at the end of the step
+# and its change over the step, the largest RSS of the worker processes that ran tasks of the step
+# (etl/partition.py), the peak of the memory traced by tracemalloc (when VA_TRACEMALLOC=1, it slows the
+# stage down), and the rows going in and out.
+# The run records the high-water mark of the process (ru_maxrss) once - in a reused pool worker of the
+# pipeline it includes the stages the worker ran before, so it is not broken down by step.
+# The records of one run of a stage are written as JSON to telemetry/<stage>/<run id>.json and compared
+# with the previous run of the stage: steps that got much slower or lost rows are reported as alerts.
+# Stages with an incremental refresh (etl/watermarks.py) record the refresh mode of the run, and a run is
+# only compared with the previous run of the same mode - an incremental run writes far fewer rows.
+
+import atexit
+import datetime
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from etl.eurostat import BASE_DIR
+
+TELEMETRY_DIR = os.path.join(BASE_DIR, 'telemetry')
+
+# alert when a step takes SLOWDOWN times as long as in the previous run (and at least MIN_SECONDS)
+SLOWDOWN = 1.5
+MIN_SECONDS = 0.5
+# alert when a step returns ROW_DROP (fraction) fewer rows than in the previous run
+ROW_DROP = 0.05
+
+_run = {'stage': None, 'run_id': None, 'records': [], 'written': False, 'refresh': None, 'workers_rss': None}
+
+
+def _rows(data):
+    if data is None:
+        return None
+    try:
+        return int(len(data))
+    except TypeError:
+        # e.g. a Cube - number of cells
+        return int(getattr(data, 'values', data).size)
+
+
+# high-water mark of the RSS of the process since it started
+def _max_rss():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# current RSS of the process - None where /proc is not available
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+# RSS of worker processes at the end of their tasks (called by etl/partition.py in the parent),
+# recorded with the step that is running
+def workers_rss(values):
+    values = [v for v in values if v is not None]
+    if values:
+        _run['workers_rss'] = max(values + [_run['workers_rss'] or 0])
+
+
+class _Step:
+
+    def __init__(self, name, rows_in):
+        self.record = {'step': name, 'rows_in': rows_in, 'rows_out': None}
+
+    # rows (or cells) of the result of the step
+    def rows_out(self, data):
+        self.record['rows_out'] = _rows(data)
+
+
+# Start collecting the records of a stage run (called by the pipeline before the stage runs)
+def begin(stage, run_id=None):
+    _run.update(stage=stage, run_id=run_id or datetime.datetime.now().strftime('%Y%m%dT%H%M%S'),
+                records=[], written=False, refresh=None, workers_rss=None)
+    if os.environ.get('VA_TRACEMALLOC') == '1' and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+# name of a stage run directly (not through the pipeline): the pipeline stage of the script, if it is one
+def _default_stage():
+    from etl.pipeline import STAGES
+    script = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] not in ('', '-c') else ''
+    for stage in STAGES:
+        if stage.code == script:
+            return stage.name
+    return os.path.splitext(script)[0] or 'interactive'
+
+
+# Record one logical step of a stage
+# data_in: the DataFrame (or Cube) the step starts from, for the row count
+@contextmanager
+def step(name, data_in=None):
+    if _run['stage'] is None:
+        begin(_default_stage())
+    current = _Step(name, _rows(data_in))
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    _run['workers_rss'] = None
+    rss = current_rss()
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.record['seconds'] = round(time.perf_counter() - start, 6)
+        current.record['rss_bytes'] = current_rss()
+        if rss is not None and current.record['rss_bytes'] is not None:
+            current.record['rss_change_bytes'] = current.record['rss_bytes'] - rss
+        if _run['workers_rss'] is not None:
+            current.record['workers_max_rss_bytes'] = _run['workers_rss']
+        if tracemalloc.is_tracing():
+            current.record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        _run['records'].append(current.record)
+
+
+# Record the refresh mode of the run: 'full' or 'incremental' (called by etl/watermarks.py)
+# a stage with several incremental tables is incremental when any of them is
+def refresh_mode(mode):
+    if _run['stage'] is None:
+        begin(_default_stage())
+    if _run['refresh'] != 'incremental':
+        _run['refresh'] = mode
+
+
+def _stage_dir(stage, folder=TELEMETRY_DIR):
+    return os.path.join(folder, stage)
+
+
+# the latest run of the stage with the same refresh mode
+def previous_run(stage, folder=TELEMETRY_DIR, refresh=None):
+    path = _stage_dir(stage, folder)
+    if not os.path.isdir(path):
+        return None
+    for name in sorted((name for name in os.listdir(path) if name.endswith('.json')), reverse=True):
+        with open(os.path.join(path, name)) as f:
+            run = json.load(f)
+        if run.get('refresh') == refresh:
+            return run
+    return None
+
+
+# Alerts for the steps of a run compared with a previous run of the same stage
+def compare_runs(previous, current):
+    alerts = []
+    before = {r['step']: r for r in previous['records']}
+    for record in current['records']:
+        old = before.get(record['step'])
+        if old is None:
+            continue
+        if record['seconds'] >= MIN_SECONDS and record['seconds'] > SLOWDOWN * old['seconds']:
+            alerts.append(record['step'] + ': ' + str(round(record['seconds'], 2)) + 's, was '
+                          + str(round(old['seconds'], 2)) + 's')
+        if old['rows_out'] and record['rows_out'] is not None and record['rows_out'] < (1 - ROW_DROP) * old['rows_out']:
+            alerts.append(record['step'] + ': ' + str(record['rows_out']) + ' rows out, was ' + str(old['rows_out']))
+    return alerts
+
+
+# Write the records of the current run to telemetry/<stage>/<run id>.json
+# returns the run (with the alerts against the previous run of the stage)
+def finish(folder=TELEMETRY_DIR):
+    if _run['stage'] is None or _run['written']:
+        return None
+    run = {'stage': _run['stage'], 'run_id': _run['run_id'], 'refresh': _run['refresh'], 'records': _run['records'],
+           'seconds': round(sum(r['seconds'] for r in _run['records']), 6),
+           'process_max_rss_bytes': _max_rss()}
+    previous = previous_run(run['stage'], folder, run['refresh'])
+    run['alerts'] = compare_runs(previous, run) if previous else []
+    for alert in run['alerts']:
+        print('[' + run['stage'] + '] telemetry alert - ' + alert)
+
+    os.makedirs(_stage_dir(run['stage'], folder), exist_ok=True)
+    with open(os.path.join(_stage_dir(run['stage'], folder), run['run_id'] + '.json'), 'w') as f:
+        json.dump(run, f, indent=2)
+    _run['written'] = True
+    return run
+
+
+# stages run directly write their records when the interpreter exits
+atexit.register(finish)
@@ -0,0 +1,82 @@
+# Coverage validation of the cleaned tables
+# The stages check that every country has data for every year before they compare countries.
+# coverage_matrix() counts the rows of every Country x Year cell (optionally split by more
+# dimensions, e.g. Sex or Age) with one group-by, instead of one scan per country and per year.
+# check_coverage() tests the matrix against a declarative expectation, e.g.
+#   Expectation(countries=eu27_ids(), years=(2013, 2020), rows=None)
+# ("every EU27 country in every year from 2013 to 2020, with the same number of rows in every cell")
+# and raises before the index calculation when a cell is missing.
+
+from collections import namedtuple
+
+import pandas as pd
+
+from etl.countries import countries
+
+# countries: CountryIds that must be present (e.g. eu27_ids()), None: the countries in the table
+# years: (first, last) years that must be present for every country - years outside are not checked
+# rows: number of rows in every cell, None: the same number of rows in every cell
+Expectation = namedtuple('Expectation', ['countries', 'years', 'rows'])
+
+# number of problems listed in the error message
+MAX_REPORTED = 10
+
+
+# Rows per Country (x by) x Year: Country (and the by dimensions) in the index, the years in the columns
+# cells without rows are 0
+def coverage_matrix(df, country='Country', year='Year', by=None):
+    keys = [country] + list(by or []) + [year]
+    counts = df.groupby(keys, observed=True, sort=True).size()
+    return counts.unstack(year, fill_value=0)
+
+
+# The matrix with the country names instead of the keys of the country dimension (for printing)
+def with_country_names(matrix):
+    return matrix.rename(index=countries()['Country'], level=0)
+
+
+# Check the coverage matrix against an expectation - raises ValueError listing the missing / uneven cells
+# name: table name for the error message
+# returns the cells of the expected countries and years
+def check_coverage(matrix, expectation, name='table'):
+    problems = []
+    present = matrix.index.get_level_values(0).unique()
+    expected_countries = present if expectation.countries is None else pd.Index(expectation.countries)
+    missing = expected_countries.difference(present)
+    if len(missing):
+        problems.append('no rows for ' + ', '.join(countries()['Country'].reindex(missing).fillna('?').astype(str)))
+
+    if expectation.years is None:
+        years = matrix.columns
+    else:
+        years = pd.RangeIndex(expectation.years[0], expectation.years[1] + 1)
+        missing = years.difference(matrix.columns)
+        if len(missing):
+            problems.append('no rows in ' + ', '.join(str(y) for y in missing))
+
+    # every combination of the expected countries with the other dimensions found in the table
+    if matrix.index.nlevels > 1:
+        others = matrix.index.droplevel(0).unique()
+        index = pd.MultiIndex.from_tuples([(c,) + (o if isinstance(o, tuple) else (o,))
+                                           for c in expected_countries for o in others],
+                                          names=matrix.index.names)
+    else:
+        index = expected_countries.rename(matrix.index.name)
+    cells = matrix.reindex(index=index, columns=years, fill_value=0)
+
+    rows = expectation.rows
+    if rows is None and cells.size:
+        # the most common number of rows per cell
+        rows = pd.Series(cells.to_numpy().ravel()).mode().iloc[0]
+    uneven = cells.stack()
+    uneven = uneven[uneven != rows]
+    if len(uneven):
+        labels = with_country_names(uneven.to_frame()).index
+        problems.append(str(len(uneven)) + ' cells without ' + str(rows) + ' rows: '
+                        + ', '.join(str(label) + ' ' + str(n) for label, n in
+                                    zip(labels[:MAX_REPORTED], uneven.to_numpy()[:MAX_REPORTED]))
+                        + (' ...' if len(uneven) > MAX_REPORTED else ''))
+
+    if problems:
+        raise ValueError(name + ' coverage: ' + '; '.join(problems))
+    return cells
@@ -0,0 +1,183 @@
+# Watermarks of the Eurostat SDMX-CSV downloads for incremental refreshes
+# Every row of a download carries the LAST UPDATE of its series, which the loaders throw away.
+# After a stage has built its cleaned table, the watermarks of the raw file are stored per
+# Country x Year slice (the unit a stage can recompute): the latest LAST UPDATE of the slice, its
+# number of rows and a digest of its rows (every series key, period, value and flag).
+# On a new download only the slices whose rows changed are read, recomputed by the stage and
+# upserted into the cleaned table (etl/store.py upsert_table), so a monthly refresh that touches a
+# few countries does not rebuild all countries and years.
+# The whole table is rebuilt when there are no watermarks yet, when the code of the stage or the etl
+# package changed since they were written, when nothing changed (e.g. a forced rerun) and when
+# VA_FULL_REFRESH=1 is set.
+#
+# In a stage:
+#   refresh = changed_slices('pension', './datasets_raw/Pension gap raw.csv')
+#   df = slice_rows(read_sdmx_csv(...), refresh)
+#   ...
+#   save_refreshed(refresh, 'pension', final_df, keys=['Country', 'Year'], csv=...)
+#   commit_watermarks(refresh)
+
+import hashlib
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from etl import telemetry
+from etl.cache import file_hash
+from etl.countries import countries, country_ids
+from etl.eurostat import sdmx_columns, sdmx_dimensions
+from etl.periods import parse_periods
+from etl.store import STORE_DIR, has_table, save_table, upsert_table
+
+WATERMARK_DIR = os.path.join(STORE_DIR, 'watermarks')
+ETL_DIR = os.path.dirname(os.path.abspath(__file__))
+# the stage scripts live next to the etl package
+CODE_DIR = os.path.dirname(ETL_DIR)
+
+LAST_UPDATE_FORMAT = '%d/%m/%y %H:%M:%S'
+
+# name: stage / table name, path: raw file
+# full: rebuild the whole table - codes, years and slices are None then
+# codes: geo codes of the changed slices, years: their years
+# slices: set of (geo code, year) pairs that changed
+# watermarks: watermarks of the raw file, stored by commit_watermarks
+# fingerprint: hash of the stage code and the etl package the watermarks belong to
+Refresh = namedtuple('Refresh', ['name', 'path', 'full', 'codes', 'years', 'slices', 'watermarks', 'fingerprint'])
+
+
+def _watermark_file(name, folder=WATERMARK_DIR):
+    return os.path.join(folder, name + '.parquet')
+
+
+# hash of the stage code and the etl package - a change in either can change every row
+def code_fingerprint(name):
+    from etl.pipeline import STAGES
+    digest = hashlib.sha256()
+    codes = [os.path.join(CODE_DIR, stage.code) for stage in STAGES if stage.name == name]
+    packages = [os.path.join(ETL_DIR, f) for f in sorted(os.listdir(ETL_DIR)) if f.endswith('.py')]
+    for path in codes + packages:
+        digest.update(os.path.basename(path).encode())
+        digest.update(file_hash(path).encode())
+    return digest.hexdigest()
+
+
+# year of an SDMX period: '2013', '2013-Q2', '2013-04' (etl/periods.py)
+def _years(periods):
+    return pd.Series(parse_periods(periods).year.astype(int), index=periods.index)
+
+
+# Watermarks of an SDMX-CSV file: one row per geo code and year with the latest LAST UPDATE,
+# the number of rows and the digest of the rows (sum of the row hashes, so the order of the rows
+# in the download does not matter). The file is read in chunks.
+def slice_watermarks(path, chunksize=500000):
+    dimensions = sdmx_dimensions(path)
+    hashed = dimensions + [c for c in ['TIME_PERIOD', 'OBS_VALUE', 'OBS_FLAG'] if c in sdmx_columns(path)]
+    dtypes = {c: 'category' for c in hashed}
+    # values are hashed as written in the file
+    dtypes.update({'OBS_VALUE': str, 'LAST UPDATE': 'category'})
+    totals = {}
+    for chunk in pd.read_csv(path, usecols=hashed + ['LAST UPDATE'], dtype=dtypes,
+                             keep_default_na=False, chunksize=chunksize):
+        row_hash = pd.util.hash_pandas_object(chunk[hashed], index=False).to_numpy()
+        updates = chunk['LAST UPDATE']
+        stamps = pd.to_datetime(updates.cat.categories, format=LAST_UPDATE_FORMAT)
+        update = np.asarray(stamps)[updates.cat.codes.to_numpy()]
+        keys = pd.MultiIndex.from_arrays([chunk['geo'].astype(str), _years(chunk['TIME_PERIOD'])])
+        codes, uniques = pd.factorize(keys)
+        # uint64 sums wrap around, which keeps the digest independent of the row order
+        digest = np.zeros(len(uniques), dtype='uint64')
+        np.add.at(digest, codes, row_hash)
+        rows = np.bincount(codes, minlength=len(uniques))
+        latest = pd.Series(update).groupby(codes).max().to_numpy()
+        for i, key in enumerate(uniques):
+            total = totals.get(key)
+            if total is None:
+                totals[key] = [int(digest[i]), int(rows[i]), latest[i]]
+            else:
+                total[0] = (total[0] + int(digest[i])) % (1 << 64)
+                total[1] += int(rows[i])
+                total[2] = max(total[2], latest[i])
+    keys = sorted(totals)
+    return pd.DataFrame({'geo': [k[0] for k in keys], 'year': [k[1] for k in keys],
+                         'last_update': [totals[k][2] for k in keys],
+                         'rows': [totals[k][1] for k in keys],
+                         # stored as text, parquet has no unsigned 64 bit statistics everywhere
+                         'digest': [format(totals[k][0], '016x') for k in keys]})
+
+
+def read_watermarks(name, folder=WATERMARK_DIR):
+    path = _watermark_file(name, folder)
+    if not os.path.exists(path):
+        return None, None
+    table = pd.read_parquet(path)
+    return table.drop(columns='fingerprint'), table['fingerprint'].iloc[0] if len(table) else None
+
+
+# Compare the watermarks of the raw file with the ones of the last run of the stage
+def changed_slices(name, path, folder=WATERMARK_DIR):
+    current = slice_watermarks(path)
+    fingerprint = code_fingerprint(name)
+    previous, previous_fingerprint = read_watermarks(name, folder)
+
+    reason = None
+    if os.environ.get('VA_FULL_REFRESH') == '1':
+        reason = 'VA_FULL_REFRESH=1'
+    elif previous is None or not has_table(name):
+        reason = 'no earlier run'
+    elif previous_fingerprint != fingerprint:
+        reason = 'stage code or etl package changed'
+    if reason is None:
+        merged = current.merge(previous, on=['geo', 'year'], how='outer', suffixes=('', '_old'), indicator=True)
+        changed = merged[(merged['_merge'] != 'both') | (merged['digest'] != merged['digest_old'])
+                         | (merged['rows'] != merged['rows_old'])]
+        if not len(changed):
+            reason = 'no slice changed'
+    if reason is not None:
+        print('[' + name + '] full refresh: ' + reason)
+        telemetry.refresh_mode('full')
+        return Refresh(name, path, True, None, None, None, current, fingerprint)
+
+    print('[' + name + '] incremental refresh: ' + str(len(changed)) + ' of ' + str(len(current))
+          + ' country / year slices changed, LAST UPDATE ' + str(previous['last_update'].max())
+          + ' -> ' + str(current['last_update'].max()))
+    slices = set(zip(changed['geo'], changed['year'].astype(int)))
+    telemetry.refresh_mode('incremental')
+    return Refresh(name, path, False, sorted({g for g, y in slices}), sorted({y for g, y in slices}),
+                   slices, current, fingerprint)
+
+
+# The rows of a table read from the raw file that an incremental refresh recomputes
+# (every row for a full refresh): the rows of the changed countries in the changed years, so every
+# changed slice is read with all of its series (e.g. all sectors of a country and year)
+def slice_rows(df, refresh, geo='geo', period='TIME_PERIOD'):
+    if refresh.full:
+        return df
+    keep = df[geo].astype(str).isin(refresh.codes).to_numpy() & _years(df[period]).isin(refresh.years).to_numpy()
+    return df[keep].reset_index(drop=True)
+
+
+# CountryIds of the changed slices (None for a full refresh)
+def slice_country_ids(refresh):
+    return None if refresh.full else country_ids(refresh.codes).to_numpy()
+
+
+# Save the table of a stage: the whole table for a full refresh, otherwise only the changed slices
+# are upserted (see etl/store.py upsert_table)
+# df: the table with the country names, keys: the columns that identify a row
+def save_refreshed(refresh, name, df, keys, csv=None, csv_index=False):
+    if refresh.full:
+        save_table(name, df, csv=csv, csv_index=csv_index)
+        return
+    names = countries().set_index('Code')['Country']
+    slices = {(names[code], year) for code, year in refresh.slices if code in names.index}
+    upsert_table(name, df, slices, keys, csv=csv, csv_index=csv_index)
+
+
+# Store the watermarks of the raw file once the stage saved its tables
+def commit_watermarks(refresh, folder=WATERMARK_DIR):
+    os.makedirs(folder, exist_ok=True)
+    table = refresh.watermarks.assign(fingerprint=refresh.fingerprint)
+    table.to_parquet(_watermark_file(refresh.name, folder) + '.tmp', index=False)
+    os.replace(_watermark_file(refresh.name, folder) + '.tmp', _watermark_file(refresh.name, folder))
@@ -0,0 +1,23 @@
+# Runs the cleaning stages (02 - 07) and the composite index (index_sheet_test.ipynb)
+# Only stages whose code or input files changed since the last run are executed,
+# independent indicator stages run in parallel before the master index is rebuilt.
+#
+# Usage:
+#   python run_pipeline.py                 run everything that is out of date
+#   python run_pipeline.py pension index   only check these stages (and what they depend on)
+#   python run_pipeline.py --force         rerun every stage
+#   python run_pipeline.py --dry-run       show what would run
+
+import argparse
+
+from etl.pipeline import STAGES, run_pipeline
+
+parser = argparse.ArgumentParser(description='Run the VA_Dashboard cleaning pipeline')
+parser.add_argument('stages', nargs='*', help='stages to run: ' + ', '.join(s.name for s in STAGES))
+parser.add_argument('--force', action='store_true', help='rerun stages even if nothing changed')
+parser.add_argument('--jobs', type=int, default=None, help='number of worker processes')
+parser.add_argument('--dry-run', action='store_true', help='only print which stages would run')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    run_pipeline(args.stages or None, force=args.force, jobs=args.jobs, dry_run=args.dry_run)
@@ -0,0 +1,27 @@
+# Local query service over the composite index and the indicator tables (etl/service.py)
+# The tables are reloaded when a pipeline run writes new results.
+#
+# Usage:
+#   python serve_index.py                  serve on http://127.0.0.1:8765
+#   python serve_index.py --port 9000
+#
+#   curl 'http://127.0.0.1:8765/range?table=pay&country=Spain&from=2013&to=2020&columns=Index'
+#   curl 'http://127.0.0.1:8765/top?table=master_index&year=2019&column=IndexTotal&k=5'
+
+import argparse
+import asyncio
+
+from etl.service import RELOAD_INTERVAL, serve
+
+parser = argparse.ArgumentParser(description='Serve point, range and top-k queries over the composite index')
+parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+parser.add_argument('--port', type=int, default=8765, help='port to listen on')
+parser.add_argument('--reload-interval', type=float, default=RELOAD_INTERVAL,
+                    help='seconds between two checks of the cleaned store for changes')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.reload_interval))
+    except KeyboardInterrupt:
+        pass
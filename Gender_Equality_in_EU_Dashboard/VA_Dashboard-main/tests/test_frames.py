@@ -0,0 +1,32 @@
+# The employment gap of stage 02 gives the same table on the pandas and the polars backend (etl/frames.py)
+#   python -m pytest tests
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.indicators import employment_gap
+
+pytest.importorskip('polars')
+
+
+def _employment_rows():
+    # cleaned rows of stage 02: countries 1-3 and the EU aggregate 99, percentages for F / M and
+    # thousands of persons for T, values with ties for the rounding (e.g. 28.5 / 100)
+    rng = np.random.default_rng(0)
+    rows = []
+    for country in [1, 2, 3, 99]:
+        for year in range(2009, 2022):
+            for age in ['Y15-64', 'Y20-64', 'Y25-54']:
+                for sex in ['F', 'M']:
+                    rows.append((country, year, sex, age, 'PC_POP', round(rng.uniform(40, 90) * 2) / 2))
+                rows.append((country, year, 'T', age, 'THS_PER', round(rng.uniform(100, 40000), 1)))
+    return pd.DataFrame(rows, columns=['Country', 'Year', 'Sex', 'Age', 'unit', 'Total Employment in %'])
+
+
+def test_employment_gap_same_on_both_backends():
+    df = _employment_rows()
+    pandas_df = employment_gap(df, 0, 1, [1, 2, 3], backend='pandas')
+    polars_df = employment_gap(df, 0, 1, [1, 2, 3], backend='polars')
+    assert len(pandas_df) == 3 * 13 * 3
+    pd.testing.assert_frame_equal(polars_df, pandas_df, check_exact=True)
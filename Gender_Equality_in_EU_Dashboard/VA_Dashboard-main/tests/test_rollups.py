@@ -0,0 +1,48 @@
+# Rollups with missing index values (0 means no data, see etl/composite.py geometric_mean)
+#   python -m pytest tests
+
+import math
+
+import pandas as pd
+import pytest
+
+from etl.rollups import compute_rollups, year_document
+
+
+def _master_index():
+    # Sweden has no care data in 2020 (IndexValueCare 0)
+    return pd.DataFrame({'Country': ['Belgium', 'Spain', 'Sweden'] * 2,
+                         'Year': [2019] * 3 + [2020] * 3,
+                         'IndexValueCare': [0.6, 0.4, 0.8, 0.7, 0.5, 0.0],
+                         'IndexTotal': [0.6, 0.4, 0.8, 0.7, 0.5, 0.0]})
+
+
+def _row(rollups, country, year, measure='IndexValueCare'):
+    part = rollups[(rollups['Country'] == country) & (rollups['Year'] == year) & (rollups['Measure'] == measure)]
+    return part.iloc[0]
+
+
+def test_zero_is_missing():
+    rollups = compute_rollups(_master_index())
+    sweden = _row(rollups, 'Sweden', 2020)
+    assert math.isnan(sweden['Value'])
+    assert pd.isna(sweden['Rank'])
+    # no jump from 0.8 to 0
+    assert math.isnan(sweden['Delta'])
+
+
+def test_zero_is_left_out_of_ranks_and_eu27():
+    rollups = compute_rollups(_master_index())
+    assert _row(rollups, 'Belgium', 2020)['Rank'] == 1
+    assert _row(rollups, 'Spain', 2020)['Rank'] == 2
+    spain = _row(rollups, 'Spain', 2020)
+    assert spain['EU27Mean'] == pytest.approx(0.6)
+    assert spain['EU27Median'] == pytest.approx(0.6)
+    assert spain['Delta'] == pytest.approx(0.1)
+
+
+def test_year_document_publishes_missing_values():
+    document = year_document(compute_rollups(_master_index()), 2020)
+    sweden = document['countries']['Sweden']
+    assert sweden == {'values': [None, None], 'ranks': [None, None], 'deltas': [None, None]}
+    assert document['eu27']['mean'] == pytest.approx([0.6, 0.6])
@@ -0,0 +1,54 @@
+# Queries of the index service (etl/service.py) stay within the country and reject invalid parameters
+#   python -m pytest tests
+
+import json
+
+import pandas as pd
+import pytest
+
+from etl.service import IndexQueries, QueryError, index_table
+
+
+@pytest.fixture
+def queries():
+    # Austria and Belgium are next to each other in the country dimension
+    df = pd.DataFrame({'Country': ['Austria'] * 3 + ['Belgium'] * 3,
+                       'Year': [2019, 2020, 2021] * 2,
+                       'IndexTotal': [0.6, 0.65, 0.7, 0.5, 0.55, 0.0]})
+    return IndexQueries(tables={'master_index': index_table('master_index', df, ['IndexTotal'])})
+
+
+def test_range_stays_within_the_country(queries):
+    rows = queries.range('master_index', 'AT', 2019, 12014)
+    assert [(r['Country'], r['Year']) for r in rows] == [('Austria', 2019), ('Austria', 2020), ('Austria', 2021)]
+    rows = queries.range('master_index', 'BE', -20000, 2020)
+    assert [(r['Country'], r['Year']) for r in rows] == [('Belgium', 2019), ('Belgium', 2020)]
+    assert queries.range('master_index', 'AT', 2022, 9999) == []
+
+
+def test_point_stays_within_the_country(queries):
+    assert queries.point('master_index', 'AT', 2021)['IndexTotal'] == 0.7
+    with pytest.raises(QueryError) as error:
+        queries.point('master_index', 'AT', 12019)
+    assert error.value.status == 404
+
+
+def test_range_rejects_first_after_last(queries):
+    status, body = queries.answer('/range?table=master_index&country=AT&from=2021&to=2019')
+    assert status == 400
+    assert 'error' in json.loads(body)
+
+
+@pytest.mark.parametrize('k', [0, -1])
+def test_top_rejects_k_below_one(queries, k):
+    with pytest.raises(QueryError) as error:
+        queries.top('master_index', 'IndexTotal', 2020, k)
+    assert error.value.status == 400
+    status, _ = queries.answer('/top?table=master_index&column=IndexTotal&year=2020&k=' + str(k))
+    assert status == 400
+
+
+def test_top_ranks_within_the_year(queries):
+    rows = queries.top('master_index', 'IndexTotal', 2021, 5)
+    # Belgium has no value in 2021 (0 is missing)
+    assert [(r['Country'], r['Rank']) for r in rows] == [('Austria', 1)]
@@ -0,0 +1,17 @@
+# The CSV export of a cleaned table reads back the float64 values the parquet store holds
+#   python -m pytest tests
+
+import numpy as np
+import pandas as pd
+
+from etl.store import read_csv_export
+
+
+def test_csv_export_round_trips_floats(tmp_path):
+    # values that pandas' default float parser reads 1 ulp off
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'Country': ['Belgium'] * 1000, 'Year': range(1000),
+                       'Index': np.concatenate([[0.9299999999999999, 0.1 + 0.2], rng.random(998)])})
+    path = tmp_path / 'table.csv'
+    df.to_csv(path)
+    pd.testing.assert_frame_equal(read_csv_export(path, index_col=0), df, check_exact=True)